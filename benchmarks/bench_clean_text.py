@@ -0,0 +1,91 @@
+"""Benchmark: per-cell _clean_text vs. the column-wide _clean_series.
+
+Builds a corpus of email-like cells dense with the artifacts Excel exports
+leave behind (_x000D_, *x000A*, HTML entities, stray underscores, runs of
+whitespace), checks both paths produce identical output, and prints timings
+and the peak memory each path allocates (traced in a separate, untimed run).
+
+    python benchmarks/bench_clean_text.py --rows 200000
+
+The win is modest and shrinks as cells get longer, because most of the time
+is then spent in the str.replace and split work both paths share. At 40,000
+rows: about 2x on short cells (--words 20), 1.5x at the default, and 1.3-1.4x
+on email-body-sized cells (--words 1000, ~3.8 KB each). Peak memory matches
+Series.apply (within a few hundred KB either way): both are dominated by the
+cleaned strings themselves.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import email_filter_app as app  # noqa: E402
+
+WORDS = "please see the attached investment analysis exit plan for tower c and the takeout schedule".split()
+ARTIFACTS = [
+    "_x000D_", "*x000D*", "_x000A_", "*x000A*", "_x000D__x000A_", "_x000A_x000D_",
+    "&nbsp;", "&amp;", "&lt;", "&gt;", "&quot;", "&#39;", "&amp;lt;", "&amp;amp;gt;",
+    " _ ", "_  _", "\t", "\r\n", "   ",
+]
+
+
+def make_corpus(rows: int, words_per_cell: int, artifact_rate: float, seed: int) -> pd.Series:
+    rng = random.Random(seed)
+    cells = []
+    for _ in range(rows):
+        parts = []
+        for _ in range(rng.randint(1, words_per_cell)):
+            parts.append(rng.choice(ARTIFACTS) if rng.random() < artifact_rate else rng.choice(WORDS))
+            parts.append(rng.choice((" ", " ", "", "_x000D_")))
+        cells.append("".join(parts))
+    cells[::97] = [None] * len(cells[::97])
+    return pd.Series(cells, dtype=object)
+
+
+def peak_mb(fn, corpus: pd.Series) -> float:
+    """Peak Python memory allocated while ``fn(corpus)`` runs, result included."""
+    tracemalloc.start()
+    try:
+        fn(corpus)
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--words", type=int, default=120, help="max words per cell")
+    ap.add_argument("--artifact-rate", type=float, default=0.25)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.rows, args.words, args.artifact_rate, args.seed)
+    mb = sum(len(c) for c in corpus if c) / 1e6
+    print(f"corpus: {len(corpus):,} cells, {mb:.1f} MB of text")
+
+    t0 = time.perf_counter()
+    expected = corpus.apply(app._clean_text)
+    t_apply = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = app._clean_series(corpus)
+    t_series = time.perf_counter() - t0
+
+    identical = expected.tolist() == got.tolist()
+    del expected, got
+    m_apply = peak_mb(lambda c: c.apply(app._clean_text), corpus)
+    m_series = peak_mb(app._clean_series, corpus)
+    print(f"Series.apply(_clean_text): {t_apply:8.3f}s  ({mb / t_apply:6.1f} MB/s)  peak {m_apply:7.1f} MB")
+    print(f"_clean_series:             {t_series:8.3f}s  ({mb / t_series:6.1f} MB/s)  peak {m_series:7.1f} MB")
+    print(f"speedup: {t_apply / t_series:.1f}x   identical output: {identical}")
+    return 0 if identical else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
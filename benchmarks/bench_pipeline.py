@@ -0,0 +1,210 @@
+"""Benchmark: upload -> process -> results -> export, end to end through the Flask test client.
+
+Generates a synthetic mailbox (see synth_mailbox.py), then times each stage
+and records its peak RSS and throughput. Results are printed and written as
+JSON; pass --compare with an earlier JSON to flag stages that got slower.
+
+    python benchmarks/bench_pipeline.py --rows 50000 --out bench.json
+    python benchmarks/bench_pipeline.py --rows 50000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import email_filter_app as app  # noqa: E402
+import synth_mailbox  # noqa: E402
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_mb() -> float:
+    """Current resident set size; falls back to the lifetime peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE / 1e6
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+
+class RssSampler:
+    """Samples RSS on a background thread while a stage runs and keeps the peak."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start = self.peak = rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+
+def run_stage(name: str, fn) -> dict:
+    with RssSampler() as rss:
+        t0 = time.perf_counter()
+        out = fn()
+        seconds = time.perf_counter() - t0
+    return {"stage": name, "seconds": seconds, "peak_rss_mb": rss.peak, "rss_growth_mb": rss.peak - rss.start, **out}
+
+
+def one_run(client, workbook: str, rows: int, keywords: list[str], columns) -> list[dict]:
+    size_mb = os.path.getsize(workbook) / 1e6
+    state = {}
+
+    def upload():
+        with open(workbook, "rb") as fh:
+            data = client.post("/upload", data={"file": (fh, "bench.xlsx")}).get_json()
+        assert data["success"], data
+        state["filename"] = data["filename"]
+        return {"rows": rows, "bytes": int(size_mb * 1e6)}
+
+    def process(words):
+        def go():
+            body = {"filename": state["filename"], "additional_keywords": words, "columns": columns}
+            data = client.post("/process", json=body).get_json()
+            assert data["success"], data
+            state["matches"] = data["matching_count"]
+            return {"rows": rows, "matches": data["matching_count"]}
+        return go
+
+    def results():
+        data = client.get("/results", query_string={"filename": state["filename"], "offset": 50, "limit": 50,
+                                                    "q": "the", "sort": 2, "dir": -1}).get_json()
+        assert data["success"], data
+        return {"rows": state["matches"]}
+
+    def export(url):
+        def go():
+            resp = client.get(url, query_string={"filename": state["filename"]}, buffered=False)
+            n = sum(len(chunk) for chunk in resp.response)
+            resp.close()
+            return {"rows": state["matches"], "bytes": n}
+        return go
+
+    return [
+        run_stage("upload", upload),
+        run_stage("process", process(keywords)),
+        run_stage("process_edit", process(keywords + ["quarterly report"])),
+        run_stage("results_page", results),
+        run_stage("download_xlsx", export("/download")),
+        run_stage("download_csv", export("/download_csv")),
+    ]
+
+
+def summarize(runs: list[list[dict]]) -> dict:
+    stages = {}
+    for name in [s["stage"] for s in runs[0]]:
+        samples = [s for run in runs for s in run if s["stage"] == name]
+        seconds = statistics.median(s["seconds"] for s in samples)
+        out = {
+            "seconds": round(seconds, 4),
+            "runs": [round(s["seconds"], 4) for s in samples],
+            "peak_rss_mb": round(max(s["peak_rss_mb"] for s in samples), 1),
+            "rss_growth_mb": round(max(s["rss_growth_mb"] for s in samples), 1),
+            "rows_per_s": round(samples[0]["rows"] / seconds, 1) if seconds else None,
+        }
+        if "bytes" in samples[0]:
+            out["mb_per_s"] = round(samples[0]["bytes"] / 1e6 / seconds, 2) if seconds else None
+        if "matches" in samples[0]:
+            out["matches"] = samples[0]["matches"]
+        stages[name] = out
+    return stages
+
+
+def compare(stages: dict, baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path, encoding="utf-8") as fh:
+        baseline = json.load(fh)["stages"]
+    ok = True
+    print(f"\n{'stage':<15}{'baseline s':>12}{'now s':>10}{'ratio':>8}")
+    for name, now in stages.items():
+        if name not in baseline:
+            continue
+        ratio = now["seconds"] / baseline[name]["seconds"] if baseline[name]["seconds"] else float("inf")
+        flag = "  REGRESSION" if ratio > 1 + tolerance else ""
+        ok = ok and not flag
+        print(f"{name:<15}{baseline[name]['seconds']:>12.3f}{now['seconds']:>10.3f}{ratio:>8.2f}{flag}")
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    synth_mailbox.add_arguments(ap)
+    ap.add_argument("--repeat", type=int, default=3, help="runs per stage; the median is reported")
+    ap.add_argument("--columns", nargs="*", help="limit /process to these columns (default: all)")
+    ap.add_argument("--warm", action="store_true", help="keep the parsed-upload cache between runs")
+    ap.add_argument("--workbook", help="benchmark this .xlsx instead of generating one")
+    ap.add_argument("--out", help="write the results JSON here")
+    ap.add_argument("--compare", metavar="JSON", help="earlier results to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage is flagged")
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="emailsim-bench-")
+    try:
+        workbook = args.workbook
+        rows = args.rows
+        if workbook:
+            rows = len(pd.read_excel(workbook))
+        else:
+            workbook = os.path.join(work, "mailbox.xlsx")
+            t0 = time.perf_counter()
+            synth_mailbox.write_mailbox(workbook, rows, **synth_mailbox.options_from(args))
+            print(f"generated {rows:,} rows ({os.path.getsize(workbook) / 1e6:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+
+        runs = []
+        for i in range(args.repeat):
+            upload_dir = os.path.join(work, "uploads" if args.warm else f"uploads-{i}")
+            os.makedirs(upload_dir, exist_ok=True)
+            app.app.config["UPLOAD_FOLDER"] = upload_dir
+            runs.append(one_run(app.app.test_client(), workbook, rows, list(app.DEFAULT_KEYWORDS), args.columns))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    stages = summarize(runs)
+    report = {
+        "config": {**vars(args), "rows": rows},
+        "environment": {
+            "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+            "cpus": os.cpu_count(), "match_workers": app.MATCH_WORKERS, "platform": platform.platform(),
+        },
+        "stages": stages,
+    }
+    print(f"\n{'stage':<15}{'seconds':>10}{'rows/s':>12}{'MB/s':>8}{'peak RSS MB':>13}")
+    for name, st in stages.items():
+        mbps = f"{st['mb_per_s']:>8.1f}" if st.get("mb_per_s") is not None else f"{'':>8}"
+        print(f"{name:<15}{st['seconds']:>10.3f}{st['rows_per_s'] or 0:>12,.0f}{mbps}{st['peak_rss_mb']:>13.1f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nwrote {args.out}")
+    if args.compare:
+        return 0 if compare(stages, args.compare, args.tolerance) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
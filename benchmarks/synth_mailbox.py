@@ -0,0 +1,95 @@
+"""Synthetic mailbox workbooks shaped like the Outlook/Excel exports the tool is fed.
+
+Each row is one email: From, To, Subject, Body, Date, plus any number of
+filler columns (IDs, attachment names). Bodies carry the artifacts Excel
+exports leave behind (_x000D_, HTML entities, stray underscores) at a
+configurable density, and a configurable share of rows mention one of the
+app's default keywords.
+
+    python benchmarks/synth_mailbox.py out.xlsx --rows 50000 --body-words 150
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import email_filter_app as app  # noqa: E402
+
+WORDS = ("please see the attached schedule for the meeting regarding budget forecast with "
+         "our partners and the revised draft of the quarterly report thanks regards").split()
+ARTIFACTS = ["_x000D_", "*x000D*", "_x000A_", "_x000D__x000A_", "&nbsp;", "&amp;", "&lt;", "&gt;",
+             "&quot;", "&#39;", " _ ", "\t", "\r\n", "   "]
+NAMES = ["alex", "sam", "jordan", "taylor", "morgan", "casey", "riley", "devon"]
+
+
+def _text(rng: random.Random, words: int, artifact_rate: float) -> str:
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(ARTIFACTS) if rng.random() < artifact_rate else rng.choice(WORDS))
+        parts.append(" ")
+    return "".join(parts)
+
+
+def mailbox_rows(rows: int, extra_columns: int = 2, body_words: int = 120, artifact_rate: float = 0.05,
+                 hit_rate: float = 0.1, keywords=None, seed: int = 7):
+    """Yield the header and then ``rows`` email rows."""
+    rng = random.Random(seed)
+    keywords = list(keywords or app.DEFAULT_KEYWORDS)
+    yield ["From", "To", "Subject", "Body", "Date"] + [f"Extra {i + 1}" for i in range(extra_columns)]
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        body = _text(rng, rng.randint(body_words // 2, body_words), artifact_rate)
+        if rng.random() < hit_rate:
+            cut = rng.randint(0, len(body))
+            body = f"{body[:cut]} {rng.choice(keywords).upper() if rng.random() < 0.3 else rng.choice(keywords)} {body[cut:]}"
+        row = [
+            f"{rng.choice(NAMES)}@example.com",
+            f"{rng.choice(NAMES)}@example.com; {rng.choice(NAMES)}@example.com",
+            _text(rng, rng.randint(3, 9), artifact_rate / 2).strip(),
+            body,
+            start + timedelta(minutes=37 * i),
+        ]
+        row += [f"att_{rng.randrange(10**6)}.pdf" if k % 2 else rng.randrange(10**9) for k in range(extra_columns)]
+        yield row
+
+
+def write_mailbox(path: str, rows: int, **options) -> str:
+    """Write a synthetic mailbox to ``path`` (.xlsx, openpyxl write-only) and return the path."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    for row in mailbox_rows(rows, **options):
+        ws.append(row)
+    wb.save(path)
+    return path
+
+
+def add_arguments(ap: argparse.ArgumentParser) -> None:
+    ap.add_argument("--rows", type=int, default=20_000)
+    ap.add_argument("--extra-columns", type=int, default=2, help="filler columns after From/To/Subject/Body/Date")
+    ap.add_argument("--body-words", type=int, default=120, help="max words per body")
+    ap.add_argument("--artifact-rate", type=float, default=0.05, help="share of body tokens that are export artifacts")
+    ap.add_argument("--hit-rate", type=float, default=0.1, help="share of rows mentioning a default keyword")
+    ap.add_argument("--seed", type=int, default=7)
+
+
+def options_from(args: argparse.Namespace) -> dict:
+    return {"extra_columns": args.extra_columns, "body_words": args.body_words,
+            "artifact_rate": args.artifact_rate, "hit_rate": args.hit_rate, "seed": args.seed}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("path")
+    add_arguments(ap)
+    args = ap.parse_args()
+    write_mailbox(args.path, args.rows, **options_from(args))
+    print(f"wrote {args.rows:,} rows to {args.path} ({os.path.getsize(args.path) / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
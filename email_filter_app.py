@@ -1,14 +1,34 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import gzip
+import hashlib
+import importlib.util
+import itertools
 import os
 import re
 import json
+import multiprocessing
+import shutil
+import sys
 import tempfile
 import threading
+import time
 import traceback
 import webbrowser
+import uuid
+import zipfile
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
+from multiprocessing import shared_memory
 
+import numpy as np
 import pandas as pd
-from flask import Flask, render_template_string, request, jsonify, send_file
+from flask import Flask, Response, g, render_template_string, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 
 # ------------------------------
@@ -25,7 +45,34 @@ DEFAULT_KEYWORDS = [
 ]
 
 MAX_FILE_MB = 16
-DISPLAY_LIMIT = 500  # rows to render in the table for performance
+DISPLAY_LIMIT = 500  # largest page of rows returned by /process and /results
+PREVIEW_CHARS = 400  # cells cut to this many characters in preview pages; /row/<id> sends the full row
+COMPRESS_MIN_BYTES = 1024  # smaller responses go out uncompressed
+COMPRESS_LEVEL = 5  # gzip level (brotli quality 4): most of the size win at a fraction of level 9's time
+AUTOMATON_MIN_PHRASES = 100  # larger keyword lists scan with Aho-Corasick instead of a regex alternation
+INDEX_CHUNK_ROWS = 50_000  # rows tokenized per batch while building the upload index
+CLEAN_SLICE_CHARS = 100_000  # cell text cleaned per pass over a column; bounds the pass's working copies
+INGEST_BATCH_ROWS = 5_000  # .xlsx rows parsed and cleaned per batch while streaming an upload
+CACHE_READ_BYTES = 4 << 20  # cached text read back per slice, so loading a column never holds it twice
+CACHE_MAX_MB = 2048  # parsed-upload cache under UPLOAD_FOLDER; least recently used entries go first
+STORE_MAX_MB = 512  # uploads (and their results) kept in memory per worker before LRU eviction
+STORE_MAX_ENTRIES = 16
+QUERY_MAX_TERMS = 32  # distinct phrases one /process query may combine
+NEAR_DEFAULT_WORDS = 10  # words allowed between the terms of a bare NEAR (NEAR/n sets its own)
+PHRASE_CACHE_MAX = 256  # per-phrase scans kept per upload for incremental /process (or a longer search's phrase count)
+RESULT_CACHE_ENTRIES = 256  # finished searches (content digest + phrases + mode + columns) kept in memory per worker
+RESULT_CACHE_MB = 64
+RESULT_CACHE_DISK_MB = 512  # the same results under UPLOAD_FOLDER/emailsim_results, shared by workers; 0 = memory only
+# match processes per server process, started on the first scan that needs them; set EMAILSIM_MATCH_WORKERS
+# to change it (1 = never use the pool). Each one imports pandas, so keep it low on small instances.
+MATCH_WORKERS = int(os.environ.get("EMAILSIM_MATCH_WORKERS") or min(4, os.cpu_count() or 1))
+PARALLEL_MIN_ROWS = 50_000  # below this, pool start-up and hand-over cost more than they save
+EXPORT_CHUNK_ROWS = 5_000  # matched rows formatted at a time while streaming /download and /download_csv
+SCAN_CHUNK_ROWS = 20_000  # serial matching granularity when a job reports progress
+JOB_WORKERS = int(os.environ.get("EMAILSIM_JOB_WORKERS") or 2)  # background jobs running at once; the rest queue
+JOB_TTL_SECONDS = 3600  # finished jobs are forgotten (and their shared records deleted) after this
+BATCH_MAX_MB = 1024  # largest /batch request, and most a batch's .zip archives may unpack to
+PROFILE_SAMPLE_SECONDS = 0.005  # stack sampling interval of the opt-in request profiler
 
 # ------------------------------
 # Flask setup
@@ -33,8 +80,14 @@ DISPLAY_LIMIT = 500  # rows to render in the table for performance
 app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = tempfile.gettempdir()
 app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_MB * 1024 * 1024
-
-processed_data: dict[str, object] = {}
+# result rows go out in column order and as UTF-8, not key-sorted with every non-ASCII character escaped
+app.json.sort_keys = False
+app.json.ensure_ascii = False
+# per-upload state every worker can read; defaults to <UPLOAD_FOLDER>/emailsim_cache/sessions
+# (point it at e.g. /dev/shm/emailsim to keep it in shared memory)
+app.config["SHARED_STATE_DIR"] = os.environ.get("EMAILSIM_SHARED_DIR") or None
+# allow ?profile=1 / "X-Profile: 1" to sample a request's stacks into <UPLOAD_FOLDER>/emailsim_profiles
+app.config["PROFILING"] = os.environ.get("EMAILSIM_PROFILING") in ("1", "true", "on")
 
 # ------------------------------
 # HTML + CSS + JS
@@ -95,6 +148,10 @@ HTML_TEMPLATE = r"""
     .process-btn:hover { transform:translateY(-1px); }
     .process-btn:disabled { opacity:.6; cursor:not-allowed; transform:none; }
 
+    /* Job progress */
+    .progress { height:10px; background:#eef0fb; border-radius:6px; overflow:hidden; margin:14px auto 8px; max-width:520px; }
+    .progress .bar { height:100%; width:0; background:linear-gradient(135deg,var(--brand) 0%,var(--brand2) 100%); transition:width .3s; }
+
     /* Alerts */
     .alert { padding:12px; margin:0 40px 20px; border-radius:8px; display:none; }
     .alert.success { background:#d4edda; color:#155724; border:1px solid #c3e6cb; }
@@ -121,6 +178,7 @@ HTML_TEMPLATE = r"""
     tbody tr:nth-child(even) td { background:#fbfbff; }
     .cell { padding:10px 12px; max-height:220px; overflow:auto; white-space:pre-wrap; word-wrap:break-word; }
     .cell.small { max-height:none; }
+    mark { background:#fff3a3; color:inherit; border-radius:2px; padding:0 1px; }
   </style>
 </head>
 <body>
@@ -139,9 +197,12 @@ HTML_TEMPLATE = r"""
         <div class="upload-zone" id="uploadZone">
           <div class="upload-icon">📁</div>
           <h3>Drop your Excel file here or click to browse</h3>
-          <p>Supports .xlsx and .xls files (up to {{ max_mb }} MB)</p>
-          <input type="file" id="fileInput" accept=".xlsx,.xls" style="display:none" />
+          <p>Supports .xlsx and .xls files and CSV/TSV exports (up to {{ max_mb }} MB). Drop several workbooks or a .zip of them to search them as one batch.</p>
+          <input type="file" id="fileInput" accept=".xlsx,.xls,.csv,.tsv,.zip" multiple style="display:none" />
         </div>
+        <label class="desc" style="display:flex; align-items:center; gap:6px; margin-top:10px;">
+          <input type="checkbox" id="buildIndex" /> Build a search index on upload (faster when re-running different keywords on a large file)
+        </label>
       </div>
 
       <!-- Configuration -->
@@ -159,6 +220,10 @@ HTML_TEMPLATE = r"""
             <div class="chiplist" id="activeChips"></div>
             <div class="desc" style="margin-top:12px;"><strong>Available defaults:</strong> (click to add back)</div>
             <div class="chiplist" id="availableDefaults"></div>
+            <div class="desc" style="margin-top:12px;"><strong>Or a query:</strong> AND, OR, NOT, ( ), &quot;quoted phrases&quot;, NEAR/5 (within 5 words); replaces the chips and match mode</div>
+            <div class="keyword-input">
+              <input type="text" id="queryInput" placeholder="&quot;exit plan&quot; AND (tower OR takeout) NOT draft" />
+            </div>
           </div>
 
           <div class="card">
@@ -170,6 +235,19 @@ HTML_TEMPLATE = r"""
               </label>
               <div class="mode-label"><strong id="modeLabel">ANY terms (default)</strong></div>
             </div>
+            <label class="desc" style="display:flex; align-items:center; gap:6px; margin-top:10px;">
+              <input type="checkbox" id="dedupToggle" /> Collapse near-duplicate emails (replies, forwards, CC copies) into one row with a count
+            </label>
+            <div class="desc" style="margin-top:12px;"><strong>Search in columns:</strong> (none selected = every column)</div>
+            <div class="chiplist" id="columnChips"><span class="desc">Upload a file to choose columns.</span></div>
+            <div id="filterPicker" style="display:none;">
+              <div class="desc" style="margin-top:12px;"><strong>Narrow down first:</strong> (applied before any keyword is searched)</div>
+              <div id="filterFields"></div>
+            </div>
+            <div id="sheetPicker" style="display:none;">
+              <div class="desc" style="margin-top:12px;"><strong>Search in sheets:</strong> (several = one result with a Sheet column)</div>
+              <div class="chiplist" id="sheetChips"></div>
+            </div>
             <div class="actions">
               <button class="process-btn" id="processBtn" onclick="processFile()" disabled>🚀 Process File</button>
             </div>
@@ -182,7 +260,8 @@ HTML_TEMPLATE = r"""
         <div class="subhead">Processing</div>
         <div class="loading">
           <div class="spinner"></div>
-          <p>Crunching your spreadsheet…</p>
+          <div class="progress"><div class="bar" id="progressBar"></div></div>
+          <p id="progressText">Crunching your spreadsheet…</p>
         </div>
       </div>
 
@@ -212,6 +291,7 @@ HTML_TEMPLATE = r"""
           <div id="pagination" style="font-size:14px; color:var(--muted);"></div>
           <div id="columnToggles" style="display:flex; gap:8px; flex-wrap:wrap;"></div>
         </div>
+        <div class="chiplist" id="phraseBreakdown" style="margin-bottom:12px;"></div>
 
         <div class="results-table" id="resultsTable"></div>
       </div>
@@ -229,18 +309,29 @@ HTML_TEMPLATE = r"""
 
   <script>
     // ------- State -------
-    let currentFileName = '';
+    let uploadKey = '';          // the upload (or batch) /process searches
+    let currentFileName = '';    // the upload holding the result on screen: a sheet or a merged batch may differ
     const defaultKeywords = {{ default_keywords|tojson }};
     let activeKeywords = [...defaultKeywords];     // the ONLY list the backend will use
+    let fileHeaders = [];
+    let searchColumns = new Set();                 // column positions to search; empty = all columns
+    let fileSheets = [];
+    let searchSheets = new Set();                  // sheet names to search; more than one = merged, tagged by sheet
+    let filterColumns = { date: [], address: [] }; // columns the upload can be narrowed by before searching
 
-    // Client-side table state
+    // Table state (rows live on the server; only the current page is held here)
     let headers = [];
-    let rawRows = [];
-    let filteredRows = [];
+    let pageRows = [];
+    let matchingCount = 0;
+    let collapsedCount = 0;   // near-duplicate rows folded into others by the last Process
+    let phraseCounts = [];         // per-keyword hits / rows for the whole file, from /process
+    let viewTotal = 0;
+    let searchQuery = '';
     let sortState = { index: null, dir: 1 };
     let currentPage = 1;
     let pageSize = 50;
     let hiddenCols = new Set();
+    let pageRequest = 0;
 
     // Mode
     const requireAllToggle = document.getElementById('requireAllToggle');
@@ -255,8 +346,12 @@ HTML_TEMPLATE = r"""
     uploadZone.addEventListener('click', () => fileInput.click());
     uploadZone.addEventListener('dragover', e=>{ e.preventDefault(); uploadZone.classList.add('dragover'); });
     uploadZone.addEventListener('dragleave', e=>{ e.preventDefault(); uploadZone.classList.remove('dragover'); });
-    uploadZone.addEventListener('drop', e=>{ e.preventDefault(); uploadZone.classList.remove('dragover'); if(e.dataTransfer.files.length){ uploadFile(e.dataTransfer.files[0]); }});
-    fileInput.addEventListener('change', e=>{ if(e.target.files.length){ uploadFile(e.target.files[0]); }});
+    uploadZone.addEventListener('drop', e=>{ e.preventDefault(); uploadZone.classList.remove('dragover'); uploadFiles(e.dataTransfer.files); });
+    fileInput.addEventListener('change', e=>uploadFiles(e.target.files));
+    function uploadFiles(files){
+      if(!files.length){ return; }
+      if(files.length > 1 || files[0].name.match(/\.zip$/i)){ uploadBatch([...files]); } else { uploadFile(files[0]); }
+    }
 
     async function parseResponseAsJson(resp){
       const text = await resp.text();
@@ -269,20 +364,110 @@ HTML_TEMPLATE = r"""
       }
     }
 
+    // ------- Background jobs -------
+    function showProgress(job){
+      const total = (job.files_total || job.rows_total) || 0;
+      const done = job.files_total ? job.files_done : job.kind === 'upload' ? job.rows_parsed : job.rows_scanned;
+      document.getElementById('progressBar').style.width = (total ? Math.min(100, Math.round(100*done/total)) : 0) + '%';
+      let text;
+      if(job.state === 'queued'){ text = 'Waiting for a free worker…'; }
+      else if(job.files_total){ text = `${done} of ${total} workbooks · ${(job.rows_scanned || job.rows_parsed || 0).toLocaleString()} rows · ${job.matches.toLocaleString()} matches so far`; }
+      else if(job.kind === 'upload'){ text = `Parsed ${done.toLocaleString()}${total ? ' of '+total.toLocaleString() : ''} rows`; }
+      else { text = `Scanned ${done.toLocaleString()} of ${total.toLocaleString()} rows · ${job.matches.toLocaleString()} matches so far`; }
+      if(job.state === 'running' && job.eta_seconds != null){ text += ` · about ${Math.ceil(job.eta_seconds)}s left`; }
+      document.getElementById('progressText').textContent = text;
+    }
+    function resetProgress(message){
+      document.getElementById('progressBar').style.width = '0%';
+      document.getElementById('progressText').textContent = message;
+    }
+    // Poll /jobs/<id> until the job finishes; resolves with the same body the synchronous call returns
+    function waitForJob(data){
+      if(!data.success || !data.job_id){ return Promise.resolve(data); }
+      return new Promise((resolve, reject)=>{
+        const poll = ()=> fetch('/jobs/'+encodeURIComponent(data.job_id))
+          .then(parseResponseAsJson)
+          .then(job=>{
+            if(!job.success){ resolve(job); return; }
+            showProgress(job);
+            if(job.state === 'done'){ resolve(job.result); }
+            else if(job.state === 'error'){ resolve({ success:false, error: job.error }); }
+            else { setTimeout(poll, 500); }
+          })
+          .catch(reject);
+        poll();
+      });
+    }
+
     function uploadFile(file){
-      if(!file.name.match(/\.(xlsx|xls)$/i)){ showAlert('Please select an Excel file (.xlsx or .xls)','error'); return; }
+      if(!file.name.match(/\.(xlsx|xls|csv|tsv)$/i)){ showAlert('Please select an Excel file (.xlsx or .xls) or a CSV/TSV export','error'); return; }
       const formData=new FormData(); formData.append('file', file);
+      if(document.getElementById('buildIndex').checked){ formData.append('build_index', '1'); }
+      if(document.getElementById('dedupToggle').checked){ formData.append('dedup', '1'); }   // group duplicates now, not on first search
+      formData.append('async', '1');
+      resetProgress('Uploading…');
+      document.getElementById('loading').style.display='block';
       fetch('/upload', { method:'POST', body:formData })
         .then(parseResponseAsJson)
+        .then(waitForJob)
         .then(data=>{
+          document.getElementById('loading').style.display='none';
           if(data.success){
-            currentFileName=data.filename;
+            uploadKey = currentFileName = data.filename;
+            fileHeaders = data.headers || [];
+            searchColumns.clear();
+            refreshColumnChips();
+            fileSheets = data.sheets || [];
+            searchSheets = new Set(fileSheets.slice(0, 1).map(s=>s.name));
+            refreshSheetChips();
+            filterColumns = data.filter_columns || { date: [], address: [] };
+            refreshFilterFields();
             uploadZone.innerHTML=`<div class="upload-icon">✅</div><h3>File loaded successfully!</h3><p>${file.name} (${data.rows} rows)</p>`;
             document.getElementById('processBtn').disabled=false;
             showAlert(`File uploaded: ${data.rows} rows`, 'success');
           } else { showAlert('Error uploading file: '+data.error,'error'); }
         })
-        .catch(e=> showAlert(String(e),'error'));
+        .catch(e=>{
+          document.getElementById('loading').style.display='none';
+          showAlert(String(e),'error');
+        });
+    }
+
+    // Several workbooks (or .zip archives of them) become one batch: searched together, results tagged by file
+    function uploadBatch(files){
+      const bad = files.filter(f=>!f.name.match(/\.(xlsx|xls|csv|tsv|zip)$/i));
+      if(bad.length){ showAlert('Not an Excel file, CSV/TSV or .zip: '+bad.map(f=>f.name).join(', '),'error'); return; }
+      const formData=new FormData();
+      files.forEach(f=>formData.append('files', f));
+      formData.append('async', '1');
+      resetProgress('Uploading…');
+      document.getElementById('loading').style.display='block';
+      fetch('/batch', { method:'POST', body:formData })
+        .then(parseResponseAsJson)
+        .then(waitForJob)
+        .then(data=>{
+          document.getElementById('loading').style.display='none';
+          if(data.success){
+            uploadKey = currentFileName = data.filename;
+            fileHeaders = data.headers || [];
+            searchColumns.clear();
+            refreshColumnChips();
+            fileSheets = [];
+            searchSheets.clear();
+            refreshSheetChips();
+            filterColumns = { date: [], address: [] };
+            refreshFilterFields();
+            const failed = (data.sources || []).filter(s=>s.error);
+            uploadZone.innerHTML=`<div class="upload-icon">✅</div><h3>Batch loaded!</h3><p>${data.workbooks} workbooks (${data.rows} rows)</p>`;
+            document.getElementById('processBtn').disabled=false;
+            showAlert(`Batch uploaded: ${data.workbooks} workbooks, ${data.rows} rows` +
+                      (failed.length ? ` · could not read ${failed.map(s=>s.name).join(', ')}` : ''), failed.length ? 'error' : 'success');
+          } else { showAlert('Error uploading batch: '+data.error,'error'); }
+        })
+        .catch(e=>{
+          document.getElementById('loading').style.display='none';
+          showAlert(String(e),'error');
+        });
     }
 
     function showAlert(message,type){
@@ -320,35 +505,99 @@ HTML_TEMPLATE = r"""
       input.value='';
       refreshChips();
     }
+    function refreshColumnChips(){
+      document.getElementById('columnChips').innerHTML = fileHeaders.map((h,i)=>
+        `<span class="chip ${searchColumns.has(i)?'':'add-back'}" onclick="toggleSearchColumn(${i})">${searchColumns.has(i)?'✓ ':''}${escapeHtml(h)}</span>`
+      ).join('');
+    }
+    function refreshSheetChips(){
+      document.getElementById('sheetPicker').style.display = fileSheets.length > 1 ? 'block' : 'none';
+      document.getElementById('sheetChips').innerHTML = fileSheets.map((s,i)=>
+        `<span class="chip ${searchSheets.has(s.name)?'':'add-back'}" onclick="toggleSearchSheet(${i})">${searchSheets.has(s.name)?'✓ ':''}${escapeHtml(s.name)}${s.rows!=null ? ' · '+s.rows.toLocaleString()+' rows' : ''}</span>`
+      ).join('');
+    }
+    function refreshFilterFields(){
+      const dates = filterColumns.date || [], addresses = filterColumns.address || [];
+      document.getElementById('filterPicker').style.display = dates.length || addresses.length ? 'block' : 'none';
+      const row = 'style="display:flex; align-items:center; gap:6px; margin-top:6px; font-size:13px;"';
+      document.getElementById('filterFields').innerHTML =
+        (dates.length ? `<div ${row}>
+            <select id="filterDateCol">${dates.map(d=>`<option>${escapeHtml(d)}</option>`).join('')}</select>
+            from <input type="date" id="filterDateFrom" /> to <input type="date" id="filterDateTo" /></div>` : '') +
+        addresses.map(a=>`<div ${row}><span style="min-width:70px;">${escapeHtml(a)}</span>
+            <input type="text" data-address="${escapeHtml(a)}" placeholder="address, name or @domain (comma-separated)" style="flex:1;" /></div>`).join('');
+    }
+    // {column: {from, to}} for the date range, {column: [values]} per address box; undefined when nothing is set
+    function collectFilters(){
+      const out = {};
+      const dateCol = document.getElementById('filterDateCol');
+      if(dateCol){
+        const from = document.getElementById('filterDateFrom').value, to = document.getElementById('filterDateTo').value;
+        if(from || to){ out[dateCol.value] = { from, to }; }
+      }
+      document.querySelectorAll('#filterFields input[data-address]').forEach(inp=>{
+        const values = inp.value.split(/[,;]/).map(v=>v.trim()).filter(Boolean);
+        if(values.length){ out[inp.getAttribute('data-address')] = values; }
+      });
+      return Object.keys(out).length ? out : undefined;
+    }
+    function toggleSearchSheet(i){
+      const name = fileSheets[i].name;
+      if(searchSheets.has(name)){ searchSheets.delete(name); } else { searchSheets.add(name); }
+      refreshSheetChips();
+    }
+    function toggleSearchColumn(i){
+      if(searchColumns.has(i)){ searchColumns.delete(i); } else { searchColumns.add(i); }
+      refreshColumnChips();
+    }
     document.getElementById('keywordInput').addEventListener('keypress', e=>{ if(e.key==='Enter'){ addKeyword(); }});
+    document.getElementById('queryInput').addEventListener('keypress', e=>{
+      if(e.key==='Enter' && !document.getElementById('processBtn').disabled){ processFile(); }
+    });
     refreshChips();
 
     // ------- Process -------
     function processFile(){
-      if(!currentFileName){ showAlert('Please upload a file first','error'); return; }
+      if(!uploadKey){ showAlert('Please upload a file first','error'); return; }
+      resetProgress('Crunching your spreadsheet…');
       document.getElementById('loading').style.display='block';
       document.getElementById('resultsSection').style.display='none';
 
+      pageSize = parseInt(document.getElementById('pageSize').value,10);
       const payload = {
-        filename: currentFileName,
+        filename: uploadKey,
         additional_keywords: activeKeywords,   // exact set user sees
-        require_all: !!requireAllToggle.checked
+        require_all: !!requireAllToggle.checked,
+        page_size: pageSize,
+        columns: searchColumns.size ? fileHeaders.filter((h,i)=>searchColumns.has(i)) : undefined,
+        sheets: fileSheets.length > 1 && searchSheets.size ? [...searchSheets] : undefined,
+        preview: true,   // long cells come cut short; the modal fetches the whole row
+        dedup: document.getElementById('dedupToggle').checked,
+        filters: collectFilters(),
+        query: document.getElementById('queryInput').value.trim() || undefined,   // takes over from the chips when set
+        async: true
       };
 
       fetch('/process', { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify(payload) })
         .then(parseResponseAsJson)
+        .then(waitForJob)
         .then(data=>{
           document.getElementById('loading').style.display='none';
           if(!data.success){ showAlert('Processing failed: '+data.error,'error'); return; }
+          currentFileName = data.filename || uploadKey;   // a sheet or a merged result is an upload of its own
           headers = data.headers;
-          rawRows = data.results;
-          filteredRows = rawRows.slice();
+          phraseCounts = data.phrase_counts || [];
+          matchingCount = data.matching_count;
+          viewTotal = data.matching_count;
+          collapsedCount = data.duplicates_collapsed || 0;
+          pageRows = data.results;
+          document.getElementById('globalSearch').value = '';
+          searchQuery = '';
           sortState = { index:null, dir:1 };
           currentPage = 1;
-          pageSize = parseInt(document.getElementById('pageSize').value,10);
           initColumnToggles();
           render();
-          const mode = payload.require_all ? 'ALL terms' : 'ANY terms';
+          const mode = payload.query ? 'query' : payload.require_all ? 'ALL terms' : 'ANY terms';
           showAlert(`Done (${mode}): ${data.matching_count} matches`, 'success');
         })
         .catch(e=>{
@@ -358,29 +607,63 @@ HTML_TEMPLATE = r"""
     }
 
     // ------- Table -------
+    // Cell text with <mark> around the server-reported hit spans ([start, end] pairs, sorted, non-overlapping)
+    function highlightHtml(text, spans){
+      let html = '', pos = 0;
+      for(const [a, b] of spans){
+        html += escapeHtml(text.slice(pos, a)) + '<mark>' + escapeHtml(text.slice(a, b)) + '</mark>';
+        pos = b;
+      }
+      return html + escapeHtml(text.slice(pos));
+    }
     function escapeHtml(s){ return String(s).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;').replace(/"/g,'&quot;'); }
-    function clearSearch(){ const box = document.getElementById('globalSearch'); if(!box.value) return; box.value=''; filteredRows=rawRows.slice(); currentPage=1; render(); }
+    function clearSearch(){ const box = document.getElementById('globalSearch'); if(!box.value) return; box.value=''; searchQuery=''; currentPage=1; loadPage(); }
     function getVisibleHeaders(){ return headers.map((h,i)=>({h,idx:i})).filter(o=>!hiddenCols.has(o.idx)); }
 
+    // Fetch one page of the stored result (server applies search + sort)
+    function loadPage(){
+      const params = new URLSearchParams({
+        filename: currentFileName,
+        offset: String((currentPage-1)*pageSize),
+        limit: String(pageSize),
+        q: searchQuery,
+        preview: '1'
+      });
+      if(sortState.index!==null){ params.set('sort', String(sortState.index)); params.set('dir', String(sortState.dir)); }
+      const ticket = ++pageRequest;
+      fetch('/results?'+params.toString())
+        .then(parseResponseAsJson)
+        .then(data=>{
+          if(ticket!==pageRequest) return;   // a newer page request superseded this one
+          if(!data.success){ showAlert('Could not load results: '+data.error,'error'); return; }
+          pageRows = data.results;
+          viewTotal = data.total;
+          matchingCount = data.matching_count;
+          render();
+        })
+        .catch(e=> showAlert(String(e),'error'));
+    }
+
     function render(){
       const resultsSection=document.getElementById('resultsSection');
       const resultsStats=document.getElementById('resultsStats');
       const resultsTable=document.getElementById('resultsTable');
 
-      resultsStats.innerHTML = `<strong>📊 Results:</strong> ${rawRows.length} shown (of up to {{ display_limit }}), keywords: ${activeKeywords.length ? activeKeywords.map(escapeHtml).join(', ') : '— none —'}`;
+      resultsStats.innerHTML = `<strong>📊 Results:</strong> ${matchingCount} matches${collapsedCount ? ` (${collapsedCount} near-duplicates collapsed)` : ''}${searchQuery ? ` (${viewTotal} matching search)` : ''}, keywords: ${activeKeywords.length ? activeKeywords.map(escapeHtml).join(', ') : '— none —'}`;
+      document.getElementById('phraseBreakdown').innerHTML = phraseCounts.map(c=>
+        `<span class="chip" title="${c.hits} hits in ${c.rows} rows">${escapeHtml(c.phrase)} · ${c.hits.toLocaleString()} hits / ${c.rows.toLocaleString()} rows</span>`
+      ).join('');
 
-      if(!filteredRows.length){
+      if(!viewTotal){
         resultsTable.innerHTML='<div style="padding:40px; text-align:center; color:#666;">No matching rows.</div>';
         resultsSection.style.display='block';
         document.getElementById('pagination').textContent='';
         return;
       }
 
-      const total = filteredRows.length;
+      const total = viewTotal;
       const pages = Math.max(1, Math.ceil(total / pageSize));
-      if(currentPage>pages) currentPage=pages;
-      const start=(currentPage-1)*pageSize, end=Math.min(total,start+pageSize);
-      const slice = filteredRows.slice(start,end);
+      const start=(currentPage-1)*pageSize, end=Math.min(total,start+pageRows.length);
 
       const visible = getVisibleHeaders();
       const ths = visible.map(o=>{
@@ -389,15 +672,18 @@ HTML_TEMPLATE = r"""
         return `<th class="sortable" data-col="${o.idx}">${escapeHtml(o.h)}<span class="sort-ind">${ind}</span></th>`;
       }).join('') + `<th>Match Reason</th>`;
 
-      const trs = slice.map(row=>{
+      const trs = pageRows.map((row, ri)=>{
         const cells = visible.map(o=>{
           const key=headers[o.idx]; const val=String(row[key]??'');
           const isBody = /body|message|content/i.test(key);
-          return `<td title="${escapeHtml(val)}" data-col="${escapeHtml(key)}">
-                    <div class="cell ${isBody?'':'small'}" ondblclick="openModalFromCell(this.parentElement)">${escapeHtml(val)}</div>
+          const marks = (row._highlights||{})[o.idx];
+          return `<td title="${escapeHtml(val)}" data-col="${escapeHtml(key)}" data-row="${ri}" data-idx="${o.idx}">
+                    <div class="cell ${isBody?'':'small'}" ondblclick="openModalFromCell(this.parentElement)">${marks ? highlightHtml(val, marks) : escapeHtml(val)}</div>
                   </td>`;
         }).join('');
-        return `<tr>${cells}<td><div class="cell small"><span class="chip"> ${escapeHtml(row._match_reason||'')} </span></div></td></tr>`;
+        const terms = (row._matched_phrases||[]).join(', ');
+        const dups = row._duplicates > 1 ? `<span class="chip" title="${row._duplicates} near-identical matched rows">×${row._duplicates}</span>` : '';
+        return `<tr>${cells}<td><div class="cell small"><span class="chip" title="${escapeHtml(terms)}"> ${escapeHtml(row._match_reason||'')} </span>${dups}${terms ? `<div class="desc">${escapeHtml(terms)}</div>` : ''}</div></td></tr>`;
       }).join('');
 
       resultsTable.innerHTML = `<table><thead><tr>${ths}</tr></thead><tbody>${trs}</tbody></table>`;
@@ -406,7 +692,7 @@ HTML_TEMPLATE = r"""
         th.onclick=()=>{
           const colIdx=parseInt(th.getAttribute('data-col'),10);
           if(sortState.index===colIdx) sortState.dir*=-1; else { sortState.index=colIdx; sortState.dir=1; }
-          stableSort(colIdx, sortState.dir); currentPage=1; render();
+          currentPage=1; loadPage();
         };
       });
 
@@ -422,23 +708,18 @@ HTML_TEMPLATE = r"""
       resultsSection.style.display='block';
     }
 
-    function stableSort(colIdx, dir){
-      const key = headers[colIdx];
-      const decorated = filteredRows.map((row, i)=>({i, row, v: String(row[key]||'').toLowerCase()}));
-      decorated.sort((a,b)=> (a.v<b.v?-1: a.v>b.v?1: a.i-b.i) * dir);
-      filteredRows = decorated.map(d=>d.row);
-    }
-
+    let searchTimer = null;
     document.getElementById('globalSearch').addEventListener('input', function(){
       const q=this.value.trim().toLowerCase();
-      filteredRows = !q ? rawRows.slice() : rawRows.filter(r=> headers.some(h=> String(r[h]||'').toLowerCase().includes(q)));
-      currentPage=1; render();
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(()=>{ searchQuery=q; currentPage=1; loadPage(); }, 250);
     });
-    document.getElementById('pageSize').addEventListener('change', function(){ pageSize=parseInt(this.value,10); currentPage=1; render(); });
-    function firstPage(){ currentPage=1; render(); }
-    function prevPage(){ if(currentPage>1){ currentPage--; render(); } }
-    function nextPage(){ const pages=Math.ceil(filteredRows.length/pageSize)||1; if(currentPage<pages){ currentPage++; render(); } }
-    function lastPage(){ currentPage=Math.ceil(filteredRows.length/pageSize)||1; render(); }
+    document.getElementById('pageSize').addEventListener('change', function(){ pageSize=parseInt(this.value,10); currentPage=1; if(currentFileName && headers.length){ loadPage(); } });
+    function pageCount(){ return Math.ceil(viewTotal/pageSize)||1; }
+    function firstPage(){ currentPage=1; loadPage(); }
+    function prevPage(){ if(currentPage>1){ currentPage--; loadPage(); } }
+    function nextPage(){ if(currentPage<pageCount()){ currentPage++; loadPage(); } }
+    function lastPage(){ currentPage=pageCount(); loadPage(); }
 
     // Column toggles (now you can hide ANY column since nothing is sticky)
     function initColumnToggles(){
@@ -455,18 +736,279 @@ HTML_TEMPLATE = r"""
     function toggleCol(idx, show){ if(!show) hiddenCols.add(idx); else hiddenCols.delete(idx); render(); }
 
     // Modal
-    function openModal(title, body){ document.getElementById('modalTitle').textContent=title; document.getElementById('modalBody').textContent=body; document.getElementById('modalBackdrop').style.display='flex'; }
-    function openModalFromCell(td){ openModal(td.getAttribute('data-col')||'Details', td.getAttribute('title')||''); }
+    function openModal(title, body, html){
+      document.getElementById('modalTitle').textContent=title;
+      if(html){ document.getElementById('modalBody').innerHTML=html; } else { document.getElementById('modalBody').textContent=body; }
+      document.getElementById('modalBackdrop').style.display='flex';
+    }
+    function openModalFromCell(td){
+      const title = td.getAttribute('data-col')||'Details';
+      const row = pageRows[parseInt(td.getAttribute('data-row'),10)];
+      const col = parseInt(td.getAttribute('data-idx'),10);
+      if(!row || !(row._truncated||[]).includes(col)){ openModal(title, td.getAttribute('title')||'', td.querySelector('.cell').innerHTML); return; }
+      // the table holds a preview of this cell: fetch the whole row
+      openModal(title, 'Loading…');
+      fetch('/row/'+row._row+'?filename='+encodeURIComponent(currentFileName))
+        .then(parseResponseAsJson)
+        .then(data=>{
+          if(!data.success){ document.getElementById('modalBody').textContent = data.error; return; }
+          const val = String(data.row[headers[col]]??''); const marks = (data.row._highlights||{})[col];
+          document.getElementById('modalBody').innerHTML = marks ? highlightHtml(val, marks) : escapeHtml(val);
+        })
+        .catch(e=>{ document.getElementById('modalBody').textContent = String(e); });
+    }
     function hideModal(){ document.getElementById('modalBackdrop').style.display='none'; }
 
     // Downloads
-    function downloadResults(){ if(!rawRows.length){ showAlert('No results to download','error'); return; } window.location.href='/download'; }
-    function downloadCsv(){ if(!rawRows.length){ showAlert('No results to download','error'); return; } window.location.href='/download_csv'; }
+    function downloadResults(){ if(!matchingCount){ showAlert('No results to download','error'); return; } window.location.href='/download?filename='+encodeURIComponent(currentFileName); }
+    function downloadCsv(){ if(!matchingCount){ showAlert('No results to download','error'); return; } window.location.href='/download_csv?filename='+encodeURIComponent(currentFileName); }
   </script>
 </body>
 </html>
 """
 
+# ------------------------------
+# Instrumentation
+# ------------------------------
+# Every request (and every background job) gets a _Timings that the pipeline
+# fills through _stage("parse") / _count(rows=...). Stages nest: a stage's time
+# excludes the stages inside it, so clean is not also counted as parse. The
+# totals go out as a Server-Timing header and into _metrics, which /metrics
+# renders in the Prometheus text format. Metrics are per worker process.
+
+_timings_var: contextvars.ContextVar = contextvars.ContextVar("emailsim_timings", default=None)
+
+class _Timings:
+    """Exclusive wall time per pipeline stage, plus row and byte counts, for one request or job."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self._open: list[list] = []  # [name, start, seconds spent in nested stages]
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        frame = [name, time.perf_counter(), 0.0]
+        self._open.append(frame)
+        try:
+            yield
+        finally:
+            self._open.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - frame[2]
+            if self._open:
+                self._open[-1][2] += elapsed
+
+    def count(self, **fields) -> None:
+        for name, value in fields.items():
+            self.counts[name] = self.counts.get(name, 0) + int(value)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> dict:
+        """Milliseconds per stage and the counts, as reported on finished jobs."""
+        return {"stages_ms": {n: round(s * 1000, 1) for n, s in self.stages.items()},
+                "total_ms": round(self.elapsed() * 1000, 1), **self.counts}
+
+    def server_timing(self) -> str:
+        parts = [f"{n};dur={s * 1000:.1f}" for n, s in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        parts.extend(f'{n};desc="{v}"' for n, v in self.counts.items())
+        return ", ".join(parts)
+
+def _stage(name: str):
+    """Time a block as ``name`` in the current request's or job's timings; a no-op outside one."""
+    timings = _timings_var.get()
+    return timings.stage(name) if timings is not None else contextlib.nullcontext()
+
+def _timed(name: str):
+    """Decorator form of _stage, for functions that are one stage from start to end."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with _stage(name):
+                return fn(*args, **kwargs)
+        return timed
+    return wrap
+
+def _count(**fields) -> None:
+    """Add row/byte counts to the current request's or job's timings."""
+    timings = _timings_var.get()
+    if timings is not None:
+        timings.count(**fields)
+
+_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Metrics:
+    """Process-wide counters and duration histograms behind /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Counter = Counter()  # (endpoint, status)
+        self.durations: dict[tuple, list] = {}  # (kind, label) -> [bucket counts..., sum, count]
+        self.counts: Counter = Counter()  # (endpoint, count name)
+
+    def _observe(self, key: tuple, seconds: float) -> None:
+        hist = self.durations.setdefault(key, [0] * len(_DURATION_BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(_DURATION_BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+        hist[-2] += seconds
+        hist[-1] += 1
+
+    def record(self, endpoint: str, timings: _Timings, status=None) -> None:
+        """Fold one finished request (``status`` given) or job/stream (no status) into the totals."""
+        with self._lock:
+            if status is not None:
+                self.requests[(endpoint, str(status))] += 1
+                self._observe(("request", endpoint), timings.elapsed())
+            for name, seconds in timings.stages.items():
+                self._observe(("stage", endpoint, name), seconds)
+            for name, value in timings.counts.items():
+                self.counts[(endpoint, name)] += value
+
+    def render(self) -> str:
+        def labels(**kv) -> str:
+            return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in kv.items()) + "}"
+
+        def histogram(metric: str, hist: list, **kv) -> list[str]:
+            out = [f"{metric}_bucket{labels(**kv, le=str(b))} {hist[i]}" for i, b in enumerate(_DURATION_BUCKETS)]
+            out.append(f"{metric}_bucket{labels(**kv, le='+Inf')} {hist[-1]}")
+            out.append(f"{metric}_sum{labels(**kv)} {hist[-2]:.6f}")
+            out.append(f"{metric}_count{labels(**kv)} {hist[-1]}")
+            return out
+
+        with self._lock:
+            lines = ["# HELP emailsim_requests_total Requests handled, by endpoint and HTTP status.",
+                     "# TYPE emailsim_requests_total counter"]
+            lines += [f"emailsim_requests_total{labels(endpoint=e, status=s)} {n}"
+                      for (e, s), n in sorted(self.requests.items())]
+            lines += ["# HELP emailsim_request_duration_seconds Wall time per request, by endpoint.",
+                      "# TYPE emailsim_request_duration_seconds histogram"]
+            for key, hist in sorted(self.durations.items()):
+                if key[0] == "request":
+                    lines += histogram("emailsim_request_duration_seconds", hist, endpoint=key[1])
+            lines += ["# HELP emailsim_stage_duration_seconds Time in each pipeline stage, excluding nested stages.",
+                      "# TYPE emailsim_stage_duration_seconds histogram"]
+            for key, hist in sorted(self.durations.items()):
+                if key[0] == "stage":
+                    lines += histogram("emailsim_stage_duration_seconds", hist, endpoint=key[1], stage=key[2])
+            for name, help_text in (("rows", "Rows parsed, scanned, matched or exported."),
+                                    ("bytes", "Bytes uploaded or exported.")):
+                metric = f"emailsim_{name}_total"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+                lines += [f"{metric}{labels(endpoint=e)} {n}" for (e, k), n in sorted(self.counts.items()) if k == name]
+            other = sorted((e, k, n) for (e, k), n in self.counts.items() if k not in ("rows", "bytes"))
+            if other:
+                lines += ["# HELP emailsim_items_total Other per-endpoint counts (matches, phrases).",
+                          "# TYPE emailsim_items_total counter"]
+                lines += [f"emailsim_items_total{labels(endpoint=e, kind=k)} {n}" for e, k, n in other]
+        with _jobs_lock:
+            states = Counter(job.state["state"] for job in _jobs.values())
+        lines += ["# HELP emailsim_jobs Background jobs this worker knows about, by state.",
+                  "# TYPE emailsim_jobs gauge"]
+        lines += [f"emailsim_jobs{labels(state=s)} {states.get(s, 0)}" for s in ("queued", "running", "done", "error")]
+        entries, nbytes = _store.usage()
+        lines += ["# HELP emailsim_store_entries Uploads held in this worker's dataset store.",
+                  "# TYPE emailsim_store_entries gauge", f"emailsim_store_entries {entries}",
+                  "# HELP emailsim_store_bytes Approximate memory held by those uploads.",
+                  "# TYPE emailsim_store_bytes gauge", f"emailsim_store_bytes {nbytes}"]
+        entries, nbytes = _results.usage()
+        lines += ["# HELP emailsim_result_cache_hits_total Searches answered from the result cache, by tier.",
+                  "# TYPE emailsim_result_cache_hits_total counter"]
+        lines += [f"emailsim_result_cache_hits_total{labels(tier=t)} {_results.hits.get(t, 0)}" for t in ("memory", "disk")]
+        lines += ["# HELP emailsim_result_cache_misses_total Searches that had to scan.",
+                  "# TYPE emailsim_result_cache_misses_total counter", f"emailsim_result_cache_misses_total {_results.misses}",
+                  "# HELP emailsim_result_cache_entries Search results held in this worker's memory.",
+                  "# TYPE emailsim_result_cache_entries gauge", f"emailsim_result_cache_entries {entries}",
+                  "# HELP emailsim_result_cache_bytes Memory held by those results.",
+                  "# TYPE emailsim_result_cache_bytes gauge", f"emailsim_result_cache_bytes {nbytes}"]
+        return "\n".join(lines) + "\n"
+
+def _prom_escape(value: object) -> str:
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+_metrics = _Metrics()
+
+class _SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread.
+
+    The result is written in the collapsed-stack format ("a;b;c <samples>")
+    that flamegraph.pl and speedscope read.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="emailsim-profiler", daemon=True)
+
+    def start(self) -> "_SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self, label: str) -> str:
+        """Stop sampling and write the profile under UPLOAD_FOLDER/emailsim_profiles; returns its path."""
+        self._stop.set()
+        self._thread.join()
+        folder = os.path.join(app.config["UPLOAD_FOLDER"], "emailsim_profiles")
+        os.makedirs(folder, exist_ok=True)
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secure_filename(label) or 'request'}_{uuid.uuid4().hex[:8]}"
+        path = os.path.join(folder, f"{name}.folded")
+        with open(path, "w", encoding="utf-8") as fh:
+            for stack, n in self.samples.most_common():
+                fh.write(f"{stack} {n}\n")
+        return path
+
+def _wants_profile() -> bool:
+    """Profile this request? Needs PROFILING enabled plus ?profile=1 or an X-Profile: 1 header."""
+    if not app.config["PROFILING"]:
+        return False
+    return (request.args.get("profile") or request.headers.get("X-Profile") or "") in ("1", "true", "on")
+
+@app.before_request
+def _start_timings():
+    g.timings = _Timings()
+    g.timings_token = _timings_var.set(g.timings)
+    g.profiler = _SamplingProfiler(threading.get_ident()).start() if _wants_profile() else None
+
+@app.after_request
+def _report_timings(resp):
+    timings = g.get("timings")
+    if timings is None:
+        return resp
+    if g.profiler is not None:
+        resp.headers["X-Profile-File"] = g.profiler.stop(request.endpoint or "request")
+        g.profiler = None
+    resp.headers["Server-Timing"] = timings.server_timing()
+    if request.endpoint != "metrics":
+        _metrics.record(request.endpoint or "unknown", timings, resp.status_code)
+    return resp
+
+@app.teardown_request
+def _end_timings(exc=None):
+    if g.get("profiler") is not None:  # after_request did not run
+        g.profiler.stop(request.endpoint or "request")
+    token = g.pop("timings_token", None)
+    if token is not None:
+        _timings_var.reset(token)
+
 # ------------------------------
 # Helpers
 # ------------------------------
@@ -493,21 +1035,668 @@ def _clean_text(text: object) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
-def _phrase_in_text(text: str, phrase: str) -> bool:
-    """Return True if an exact phrase (word-boundaries) is in the text."""
-    if not text:
-        return False
-    lo = text.lower()
-    pat = r"\b" + re.escape(phrase) + r"\b"
-    return re.search(pat, lo) is not None
+# _clean_text's steps, in order; the order matters ("&amp;lt;" ends up as "<")
+_ARTIFACT_REPLACEMENTS = (
+    ("_x000D_", " "),
+    ("*x000D*", " "),
+    ("_x000A_", " "),
+    ("*x000A*", " "),
+    ("&nbsp;", " "),
+    ("&amp;", "&"),
+    ("&lt;", "<"),
+    ("&gt;", ">"),
+    ("&quot;", '"'),
+    ("&#39;", "'"),
+)
+_CELL_SEP = "\x00"  # not whitespace and not part of any artifact, so no step can match across it
+
+def _collapse_ws(s: str) -> str:
+    """re.sub(r"\\s+", " ", s) without the regex: str.split() uses the same notion of whitespace."""
+    return " ".join(s.split())
+
+def _clean_joined(texts: list[str]) -> list[str]:
+    """_clean_text of each of some cells, run once over the cells joined into one string.
+
+    The string is bracketed by separators, so the ends are never stripped.
+    The three regexes of _clean_text each consume whole whitespace runs, so
+    on collapsed text they reduce to the literal replacements "_ _" and
+    " _ " with a collapse in between.
+    """
+    big = _CELL_SEP + _CELL_SEP.join(texts) + _CELL_SEP
+    if big.count(_CELL_SEP) != len(texts) + 1:
+        return [_clean_text(t) for t in texts]  # a cell holds the separator itself
+    for old, new in _ARTIFACT_REPLACEMENTS:
+        if old in big:
+            big = big.replace(old, new)
+    big = _collapse_ws(big)
+    if "_ _" in big:
+        big = _collapse_ws(big.replace("_ _", " "))
+    if " _ " in big:
+        big = big.replace(" _ ", " ")
+    big = big.replace(" " + _CELL_SEP, _CELL_SEP).replace(_CELL_SEP + " ", _CELL_SEP)
+    return big[1:-1].split(_CELL_SEP)
+
+@_timed("clean")
+def _clean_series(col: pd.Series) -> pd.Series:
+    """Vectorized _clean_text for a whole column, with identical output.
+
+    Cells are cleaned CLEAN_SLICE_CHARS of text at a time by _clean_joined,
+    each step running once over the slice in C instead of once per cell
+    through Series.apply. Slicing keeps the working copies, and the words
+    _collapse_ws splits out, to under a MB whatever the column's size, so
+    peak memory is that of Series.apply. The speed-up is largest on short
+    cells; on body-length ones it is about 1.3x (see benchmarks/bench_clean_text.py).
+    """
+    values = col.astype(object)
+    na = values.isna().to_numpy()
+    if na.any():
+        values = values.where(~na, "")
+    texts = [v if type(v) is str else str(v) for v in values.tolist()]
+    ends = np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)))
+    out: list[str] = []
+    lo = 0
+    while lo < len(texts):
+        start = ends[lo - 1] if lo else 0
+        hi = max(int(np.searchsorted(ends, start + CLEAN_SLICE_CHARS, side="right")), lo + 1)
+        out.extend(_clean_joined(texts[lo:hi]))
+        lo = hi
+    return pd.Series(out, index=col.index, dtype=object)
+
+def _display_value(v: object) -> str:
+    """Text of an already-cleaned cell for JSON and exports (no second cleaning pass)."""
+    if isinstance(v, str):
+        return v
+    return "" if pd.isna(v) else str(v)
+
+def _is_text_dtype(dtype) -> bool:
+    """True for columns holding Python text: object, or pandas' str dtype (pandas >= 3)."""
+    return pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype)
+
+def _clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Blank out NaNs and clean every text column of a freshly parsed sheet."""
+    df = df.fillna("")
+    for col in df.columns:
+        if _is_text_dtype(df[col].dtype):
+            df[col] = _clean_series(df[col])
+    return df
+
+def _excel_header(cells) -> list:
+    """Column names as pd.read_excel would give them: blanks become ``Unnamed: i``, repeats get ``.1``, ``.2``."""
+    names: list = []
+    seen: dict = {}
+    for i, cell in enumerate(cells):
+        name = f"Unnamed: {i}" if cell is None else cell
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+            while name in seen:
+                seen[name] += 1
+                name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+def _iter_xlsx_batches(path: str, batch_rows: int = INGEST_BATCH_ROWS, progress=None, sheet: int = 0):
+    """Stream one worksheet (the first by default) of an .xlsx as cleaned DataFrame batches of object columns.
+
+    The sheet is read with openpyxl's read-only parser, so only one batch of
+    raw cells is alive at a time. Text cells are cleaned as they arrive; blank
+    rows in the middle are kept and trailing blank rows dropped, like read_excel.
+    ``progress(rows_parsed=, rows_total=)`` is called after every batch.
+    """
+    from openpyxl import load_workbook
 
-def _matches_by_mode(full_text: str, phrases: list[str], require_all: bool) -> bool:
-    """Implements ANY vs ALL mode for phrase matching."""
-    phrases = [p for p in phrases if isinstance(p, str) and p.strip()]
+    fh = open(path, "rb")  # a file object, so openpyxl does not judge the content by the extension
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[sheet]
+        rows_total = ws.max_row - 1 if ws.max_row else None  # from the sheet's <dimension>, may be absent
+        parsed = 0
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = _excel_header(header)
+        width = len(names)
+        batch: list[list] = []
+        blanks: list[list] = []
+        emitted = False
+        for row in rows:
+            row = list(row)
+            if len(row) > width:
+                names.extend(f"Unnamed: {i}" for i in range(width, len(row)))
+                width = len(row)
+            row.extend([None] * (width - len(row)))
+            if all(v is None for v in row):
+                blanks.append(row)
+                continue
+            if blanks:
+                batch.extend(blanks)
+                blanks = []
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                parsed += len(batch)
+                yield _clean_batch(batch, names)
+                batch = []
+                emitted = True
+                if progress:
+                    progress(rows_parsed=parsed, rows_total=rows_total)
+        if batch or not emitted:
+            parsed += len(batch)
+            yield _clean_batch(batch, names)
+        if progress:
+            progress(rows_parsed=parsed, rows_total=parsed)
+    finally:
+        wb.close()
+        fh.close()
+
+def _str_cells(col: pd.Series) -> np.ndarray:
+    """Boolean mask of the cells of an object column that hold a str."""
+    return (col.map(type) == str).to_numpy(dtype=bool)
+
+# what read_excel reads as a blank cell: its parser's default NA strings and Excel's error values
+_EXCEL_NA_VALUES = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN", "<NA>", "N/A",
+    "NA", "NULL", "NaN", "None", "n/a", "nan", "null", "#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!",
+])
+_EXCEL_TRUE_FALSE = frozenset(["True", "TRUE", "true", "False", "FALSE", "false"])
+
+def _excel_cells(col: pd.Series) -> pd.Series:
+    """Raw openpyxl cells as read_excel passes them on: whole floats as ints, NA strings and errors as None."""
+    kinds = col.map(type)
+    is_float = (kinds == float).to_numpy(dtype=bool)
+    is_na = (kinds == str).to_numpy(dtype=bool) & col.isin(_EXCEL_NA_VALUES).to_numpy(dtype=bool)
+    if not is_float.any() and not is_na.any():
+        return col
+    col = col.copy()
+    if is_float.any():
+        floats = col[is_float]
+        whole = floats.map(float.is_integer).to_numpy(dtype=bool)  # False for nan and inf
+        col[floats.index[whole]] = floats[whole].map(int)
+    col[is_na] = None
+    return col
+
+def _clean_batch(rows: list[list], names: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=list(names), dtype=object)
+    for i in range(df.shape[1]):
+        col = _excel_cells(df.iloc[:, i])
+        is_str = _str_cells(col)
+        if is_str.any():
+            col = col.copy()
+            col[is_str] = _clean_series(col[is_str])
+        df.isetitem(i, col)
+    return df
+
+def _parsed_values(cells: pd.Series) -> bool:
+    """True if read_excel's parser may still read every str cell as a number or a bool."""
+    text = cells[_str_cells(cells)]
+    return bool(text.isin(_EXCEL_TRUE_FALSE).all() or pd.to_numeric(text, errors="coerce").notna().all())
+
+def _infer_column(values: np.ndarray) -> pd.Series:
+    """A column's dtype inferred over all of its cells, by the parser read_excel itself hands them to."""
+    from pandas.io.parsers import TextParser
+
+    if not len(values):
+        return pd.Series(values, dtype=object)
+    return TextParser(values.reshape(-1, 1).tolist(), header=None, skip_blank_lines=False).read()[0]
+
+def _read_xlsx_streaming(path: str, batch_rows: int = INGEST_BATCH_ROWS, progress=None,
+                         sheet: int = 0) -> pd.DataFrame:
+    """Assemble the streamed batches into the cleaned upload frame.
+
+    Each batch is written out by a _ColumnWriter (to a scratch folder) as
+    it arrives, so besides the finished columns only one batch of cells is
+    ever in memory. Columns with any text (or any blank) end up as cleaned
+    strings, exactly what fillna("") + _clean_text leave behind; all-numeric
+    and all-date columns keep their inferred dtype.
+    """
+    work = tempfile.mkdtemp(prefix="emailsim_xlsx_")
+    try:
+        writer = _ColumnWriter(work)
+        for batch in _iter_xlsx_batches(path, batch_rows, progress, sheet):
+            writer.add(batch)
+        writer.close()
+        return _read_columns(work, mmap=False)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+_OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_ZIP_MAGIC = b"PK\x03\x04"
+_SNIFF_BYTES = 64 * 1024
+_EXT_FORMATS = {".xlsx": "xlsx", ".xls": "xls", ".csv": "csv", ".tsv": "csv"}
+
+def _text_encoding(head: bytes):
+    """Encoding of a delimited-text export from its first bytes, or None when they are not text."""
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    if head.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16"  # Excel's "Unicode Text" export
+    if b"\x00" in head:
+        return None
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if len(head) >= _SNIFF_BYTES and e.reason == "unexpected end of data":  # a character cut off by the window
+            return "utf-8"
+    return "cp1252" if all(b not in head for b in b"\x81\x8d\x8f\x90\x9d") else "latin-1"
+
+def _sniff_format(path: str) -> str:
+    """What an upload holds, from its bytes: "xlsx", "xls", "csv" (any delimited text) or "" when none of those."""
+    with open(path, "rb") as fh:
+        head = fh.read(_SNIFF_BYTES)
+    if head.startswith(_ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(path) as zf:
+                return "xlsx" if "xl/workbook.xml" in zf.namelist() else ""
+        except zipfile.BadZipFile:
+            return ""
+    if head.startswith(_OLE2_MAGIC):
+        return "xls"
+    return "csv" if head.strip() and _text_encoding(head) else ""
+
+def _xls_engines() -> list[str]:
+    """Installed pandas engines for OLE2 .xls, fastest first."""
+    return [engine for engine, module in (("calamine", "python_calamine"), ("xlrd", "xlrd"))
+            if importlib.util.find_spec(module)]
+
+def _read_xls(path: str, sheet: int = 0) -> pd.DataFrame:
+    """One sheet of an OLE2 .xls, with the fastest engine installed; an engine that fails hands over to the next."""
+    engines = _xls_engines()
+    if not engines:
+        raise ValueError("reading .xls files needs python-calamine or xlrd==1.2 installed")
+    for n, engine in enumerate(engines):
+        try:
+            return pd.read_excel(path, sheet_name=sheet, engine=engine)
+        except Exception:
+            if n == len(engines) - 1:
+                raise
+            app.logger.warning("%s could not read %s; falling back to %s", engine, path, engines[n + 1], exc_info=True)
+            _count(parse_fallbacks=1)
+
+def _read_delimited(path: str, batch_rows: int = INGEST_BATCH_ROWS, progress=None) -> pd.DataFrame:
+    """Parse a CSV/TSV export with pandas' C parser, batch_rows rows at a time, cleaning each batch.
+
+    The delimiter is whichever of tab, comma, semicolon and pipe the header
+    line has most of. Every cell stays text, as typed, and blanks stay "".
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(_SNIFF_BYTES)
+    encoding = _text_encoding(head)
+    if encoding not in ("utf-8", "utf-8-sig"):
+        app.logger.info("reading %s as %s", path, encoding)
+    first = head.decode(encoding, errors="ignore").lstrip("\ufeff").splitlines()[0]
+    sep = max("\t,;|", key=first.count) if any(c in first for c in "\t,;|") else ","
+    options = {"sep": sep, "encoding": encoding, "dtype": object, "keep_default_na": False, "na_filter": False,
+               "engine": "c"}
+    batches = []
+    parsed = 0
+    for batch in pd.read_csv(path, chunksize=batch_rows, **options):
+        for i in range(batch.shape[1]):
+            batch.isetitem(i, _clean_series(batch.iloc[:, i]))
+        batches.append(batch)
+        parsed += len(batch)
+        if progress:
+            progress(rows_parsed=parsed, rows_total=None)
+    if not batches:
+        return pd.read_csv(path, nrows=0, **options)
+    if progress:
+        progress(rows_parsed=parsed, rows_total=parsed)
+    return pd.concat(batches, ignore_index=True) if len(batches) > 1 else batches[0]
+
+@_timed("parse")
+def _upload_format(path: str) -> str:
+    """_sniff_format, logging (and counting) an upload whose extension says otherwise."""
+    fmt = _sniff_format(path)
+    named = _EXT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt and named and fmt != named:
+        app.logger.warning("%s is named as %s but holds %s; reading it as %s", path, named, fmt, fmt)
+        _count(parse_fallbacks=1)
+    return fmt
+
+def _load_frame(path: str, progress=None, sheet: int = 0, fmt: str = "") -> pd.DataFrame:
+    """Parse and clean one worksheet (by position) of an upload, read as whatever its content says it is.
+
+    .xlsx streams through openpyxl in bounded batches, .xls goes to the
+    fastest installed engine, and CSV/TSV exports to pandas' C parser.
+    ``fmt`` is the already sniffed format, if any.
+    """
+    fmt = fmt or _upload_format(path)
+    if fmt == "xlsx":
+        return _read_xlsx_streaming(path, progress=progress, sheet=sheet)
+    if fmt == "csv":
+        return _read_delimited(path, progress=progress)
+    if fmt != "xls":
+        raise ValueError("not an Excel workbook or a CSV/TSV export")
+    df = _read_xls(path, sheet)
+    if progress:
+        progress(rows_parsed=len(df), rows_total=len(df))
+    return _clean_frame(df)
+
+def _row_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Return df with the dtype coercion iterrows() applies to each row.
+
+    A row of an all-numeric frame is upcast to the common dtype (an int next to
+    a float prints as ``1.0``); frames with any text column keep per-cell types.
+    """
+    if df.empty or any(pd.api.types.is_object_dtype(t) or pd.api.types.is_string_dtype(t) for t in df.dtypes):
+        return df
+    values = df.to_numpy()
+    if values.dtype == object:
+        return df
+    return pd.DataFrame(values, index=df.index, columns=df.columns)
+
+def _search_text(df: pd.DataFrame) -> pd.Series:
+    """Build the lowercased search text of every row (all columns, space-joined) as one column."""
+    frame = _row_frame(df)
+    cols = [frame.iloc[:, i].astype(object).map(str).tolist() for i in range(frame.shape[1])]
+    if not cols:
+        return pd.Series([""] * len(frame), index=frame.index, dtype=object)
+    return pd.Series([" ".join(vals).lower() for vals in zip(*cols)], index=frame.index, dtype=object)
+
+def _is_word_char(ch: str) -> bool:
+    """Same definition of a word character as the ``\\w`` used by ``\\b`` in str patterns."""
+    return ch.isalnum() or ch == "_"
+
+class _PhraseAutomaton:
+    """Aho-Corasick automaton that finds every phrase hit in one scan of a text.
+
+    Raw substring hits are accepted only when both ends sit on a word boundary,
+    so a hit here is exactly a ``\\bphrase\\b`` regex match.
+    """
+
+    def __init__(self, phrases: tuple[str, ...]):
+        self.phrases = phrases
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[list[int]] = [[]]
+        for idx, phrase in enumerate(phrases):
+            state = 0
+            for ch in phrase:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = nxt
+            self.out[state].append(idx)
+        self.alphabet = frozenset(self.goto[0])
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def hits(self, text: str):
+        """Yield ``(phrase_index, start)`` for every word-bounded phrase occurrence."""
+        goto, fail, out, phrases, alphabet = self.goto, self.fail, self.out, self.phrases, self.alphabet
+        n = len(text)
+        state = 0
+        for i, ch in enumerate(text):
+            if ch not in alphabet and not state:
+                continue
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if not out[state]:
+                continue
+            end = i + 1
+            right = end < n and _is_word_char(text[end])
+            if right == _is_word_char(text[i]):
+                continue
+            for idx in out[state]:
+                start = end - len(phrases[idx])
+                left = start > 0 and _is_word_char(text[start - 1])
+                if left != _is_word_char(text[start]):
+                    yield idx, start
+
+@functools.lru_cache(maxsize=16)
+def _phrase_automaton(phrases: tuple[str, ...]) -> _PhraseAutomaton:
+    """Build (once per distinct keyword set) the automaton for a sorted, de-duplicated phrase tuple."""
+    return _PhraseAutomaton(phrases)
+
+@functools.lru_cache(maxsize=128)
+def _phrase_scanner(phrases: tuple[str, ...]) -> tuple[re.Pattern, dict]:
+    """Lookahead pattern reporting the longest phrase that starts at each word boundary, and for each
+    phrase the columns it implies (itself plus the shorter phrases it begins with that end on a boundary).
+    """
+    order = sorted(phrases, key=len, reverse=True)
+    pattern = re.compile(r"\b(?=(" + "|".join(re.escape(p) for p in order) + r")\b)")
+    col = {p: j for j, p in enumerate(phrases)}
+    implied = {
+        q: [col[q]] + [col[p] for p in phrases
+                       if p != q and q.startswith(p) and _is_word_char(q[len(p) - 1]) != _is_word_char(q[len(p)])]
+        for q in phrases
+    }
+    return pattern, implied
+
+def _phrase_occurrences(texts: pd.Series, phrases: tuple[str, ...]) -> np.ndarray:
+    """Every ``\bphrase\b`` occurrence in the texts, all phrases in one scan, as int32 (text, phrase, start) rows.
+
+    Each text is read to the end and overlapping occurrences all count, so
+    "a a" occurs twice in "a a a". Rows come out in text order.
+    """
+    out = array("i")
     if not phrases:
-        return False
-    return all(_phrase_in_text(full_text, p) for p in phrases) if require_all \
-           else any(_phrase_in_text(full_text, p) for p in phrases)
+        return np.zeros((0, 3), dtype=np.int32)
+    if len(phrases) >= AUTOMATON_MIN_PHRASES:
+        automaton = _phrase_automaton(phrases)
+        for i, t in enumerate(texts):
+            if t:
+                for j, start in automaton.hits(t):
+                    out.extend((i, j, start))
+    else:
+        pattern, implied = _phrase_scanner(phrases)
+        for i, t in enumerate(texts):
+            if t:
+                for m in pattern.finditer(t):
+                    start = m.start()
+                    for j in implied[m.group(1)]:
+                        out.extend((i, j, start))
+    return np.frombuffer(out, dtype=np.int32).reshape(-1, 3).copy()
+
+def _occurrence_masks(occ: np.ndarray, n_rows: int, n_phrases: int) -> np.ndarray:
+    """Boolean (row, phrase) matrix of an occurrence table."""
+    out = np.zeros((n_rows, n_phrases), dtype=bool)
+    out[occ[:, 0], occ[:, 1]] = True
+    return out
+
+def _occurrences_by_phrase(occ: np.ndarray, n_phrases: int) -> list[np.ndarray]:
+    """(row, column, start) occurrences of each phrase of an occurrence table, in one stable sort (row order kept)."""
+    order = np.argsort(occ[:, 1], kind="stable")
+    bounds = np.cumsum(np.bincount(occ[:, 1], minlength=n_phrases))[:-1]
+    return [np.ascontiguousarray(part[:, [0, 2, 3]]) for part in np.split(occ[order], bounds)]
+
+# ------------------------------
+# Parallel matching
+# ------------------------------
+# Large uploads are split into contiguous row partitions. Their search text is
+# encoded once into a SharedMemory block (NUL between rows); each pool worker
+# decodes only its own byte range and sends back its phrase occurrences, so no
+# DataFrame is ever pickled. Occurrence tables are shifted to absolute row
+# numbers and concatenated in partition order.
+#
+# Pool processes come from a forkserver (spawn where there is none), never a
+# fork of this multi-threaded server. The pool is made by the first scan of
+# PARALLEL_MIN_ROWS or more (or batch of several workbooks) that needs it, so
+# a worker that only serves small uploads never starts one.
+
+_MATCH_POOL_START = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+_match_pool_instance = None
+_match_pool_pid = None
+_match_pool_lock = threading.Lock()
+
+def _match_pool() -> ProcessPoolExecutor:
+    """The process pool of this process, made on first use."""
+    global _match_pool_instance, _match_pool_pid
+    with _match_pool_lock:
+        if _match_pool_instance is None or _match_pool_pid != os.getpid():  # not one inherited through a fork
+            _match_pool_instance = ProcessPoolExecutor(max_workers=MATCH_WORKERS,
+                                                       mp_context=multiprocessing.get_context(_MATCH_POOL_START))
+            _match_pool_pid = os.getpid()
+        return _match_pool_instance
+
+def _scan_shared_partition(shm_name: str, start: int, length: int, phrases: tuple[str, ...]) -> np.ndarray:
+    """Pool worker: phrase occurrences in the rows encoded in one byte range of the shared block."""
+    shm = shared_memory.SharedMemory(name=shm_name)  # pool children share the parent's resource tracker
+    try:
+        texts = str(shm.buf[start:start + length], "utf-8").split(_CELL_SEP)
+    finally:
+        shm.close()
+    return _phrase_occurrences(pd.Series(texts, dtype=object), phrases)
+
+def _rows_hit(parts: list[np.ndarray]) -> int:
+    return int(sum(len(np.unique(part[:, 0])) for part in parts))
+
+def _parallel_scan(texts: pd.Series, phrases: tuple[str, ...], workers: int, progress=None) -> np.ndarray:
+    bounds = np.linspace(0, len(texts), workers * 2 + 1).astype(int)
+    blobs = [_CELL_SEP.join(texts.iloc[lo:hi]).encode("utf-8") for lo, hi in zip(bounds[:-1], bounds[1:])]
+    shm = shared_memory.SharedMemory(create=True, size=max(sum(map(len, blobs)), 1))
+    try:
+        offset = 0
+        futures = []
+        pool = _match_pool()
+        for blob, lo, hi in zip(blobs, bounds[:-1], bounds[1:]):
+            shm.buf[offset:offset + len(blob)] = blob
+            if hi > lo:
+                futures.append((lo, hi, pool.submit(_scan_shared_partition, shm.name, offset, len(blob), phrases)))
+            offset += len(blob)
+        del blobs
+        parts = []
+        for lo, hi, f in futures:
+            part = f.result()
+            part[:, 0] += lo
+            parts.append(part)
+            if progress:
+                progress(rows_scanned=int(hi), matches=_rows_hit(parts))
+        return np.concatenate(parts) if parts else np.zeros((0, 3), dtype=np.int32)
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _serial_scan(texts: pd.Series, phrases: tuple[str, ...], progress=None) -> np.ndarray:
+    if progress is None:
+        return _phrase_occurrences(texts, phrases)
+    parts = []
+    for lo in range(0, len(texts), SCAN_CHUNK_ROWS):
+        chunk = texts.iloc[lo:lo + SCAN_CHUNK_ROWS]
+        part = _phrase_occurrences(chunk, phrases)
+        part[:, 0] += lo
+        parts.append(part)
+        progress(rows_scanned=lo + len(chunk), matches=_rows_hit(parts))
+    return np.concatenate(parts) if parts else np.zeros((0, 3), dtype=np.int32)
+
+def _scan_occurrences(texts: pd.Series, phrases: tuple[str, ...], progress=None) -> np.ndarray:
+    """_phrase_occurrences, spread over MATCH_WORKERS processes for uploads of PARALLEL_MIN_ROWS or more.
+
+    ``progress(rows_scanned=, matches=)`` is called as partitions finish.
+    """
+    workers = min(MATCH_WORKERS, max(len(texts) // max(PARALLEL_MIN_ROWS // 2, 1), 1))
+    if workers < 2 or len(texts) < PARALLEL_MIN_ROWS or texts.str.contains(_CELL_SEP, regex=False).any():
+        return _serial_scan(texts, phrases, progress)
+    try:
+        return _parallel_scan(texts, phrases, workers, progress)
+    except Exception:
+        app.logger.warning("parallel matching failed; matching serially", exc_info=True)
+        return _serial_scan(texts, phrases, progress)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+class _TokenIndex:
+    """Positional inverted index over the search text of one upload.
+
+    Every token occurrence is stored as a ``row << 32 | position`` key; keys are
+    grouped by token in one sorted array, so a phrase lookup is a chain of
+    ``np.intersect1d`` calls over shifted posting lists.
+    """
+
+    def __init__(self, texts: pd.Series, chunk_rows: int = INDEX_CHUNK_ROWS):
+        vocab: dict[str, int] = {}
+        id_parts: list[np.ndarray] = []
+        key_parts: list[np.ndarray] = []
+        for lo in range(0, len(texts), chunk_rows):
+            tokens = [_TOKEN_RE.findall(t) for t in texts.iloc[lo:lo + chunk_rows]]
+            counts = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+            codes, uniques = pd.factorize(np.array(list(itertools.chain.from_iterable(tokens)), dtype=object))
+            ids = np.array([vocab.setdefault(u, len(vocab)) for u in uniques], dtype=np.int64)
+            rows = np.repeat(np.arange(lo, lo + len(tokens), dtype=np.int64), counts)
+            pos = np.arange(int(counts.sum()), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+            id_parts.append(ids[codes])
+            key_parts.append((rows << 32) | pos)
+        ids = np.concatenate(id_parts) if id_parts else np.zeros(0, dtype=np.int64)
+        keys = np.concatenate(key_parts) if key_parts else np.zeros(0, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        self.vocab = vocab
+        self.keys = keys[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(ids, minlength=len(vocab)))))
+        self.n_rows = len(texts)
+
+    def postings(self, token: str) -> np.ndarray:
+        tid = self.vocab.get(token)
+        if tid is None:
+            return self.keys[:0]
+        return self.keys[self.offsets[tid]:self.offsets[tid + 1]]
+
+    def candidate_rows(self, phrase: str):
+        """Rows whose tokens contain the phrase's tokens back to back, or None if the phrase has no tokens.
+
+        Every ``\\bphrase\\b`` match is such a run, so the result is a superset
+        of the true matches (separators between tokens are not checked).
+        """
+        tokens = _TOKEN_RE.findall(phrase)
+        if not tokens:
+            return None
+        keys = self.postings(tokens[0])
+        for k, token in enumerate(tokens[1:], 1):
+            if not keys.size:
+                break
+            keys = np.intersect1d(keys, self.postings(token) - k, assume_unique=True)
+        return np.unique(keys >> 32)
+
+@_timed("match")
+def _scoped_occurrences(df: pd.DataFrame, phrases: tuple[str, ...], scope=None, index=None,
+                        progress=None, within=None) -> np.ndarray:
+    """Phrase occurrences in a frame as int32 (row, phrase, column, start) rows, sorted by row.
+
+    With no scope, each row's joined search text is scanned and column is -1.
+    With a scope (a tuple of column positions), each of those columns is
+    scanned on its own, as lowercased display text, and no row text is built.
+    Given the upload index, only rows it says can hold a phrase are read;
+    given ``within`` (sorted row positions), only those rows are.
+    """
+    rows = within
+    if index is not None:
+        candidates = [index.candidate_rows(p) for p in phrases]
+        if candidates and all(c is not None for c in candidates):
+            rows = np.unique(np.concatenate(candidates))
+            if within is not None:
+                rows = np.intersect1d(rows, within, assume_unique=True)
+    sub = df if rows is None else df.iloc[rows]
+    if not len(sub) or not phrases:
+        return np.zeros((0, 4), dtype=np.int32)
+    if scope is None:
+        occ = np.insert(_scan_occurrences(_search_text(sub), phrases, progress), 2, -1, axis=1)
+    else:
+        frame = _row_frame(sub)
+        parts = []
+        for k, col in enumerate(scope):
+            step = None
+            if progress:
+                def step(rows_scanned, matches, k=k):
+                    progress(rows_scanned=(k * len(frame) + rows_scanned) // len(scope), matches=matches)
+            texts = _display_frame(frame.iloc[:, [col]]).iloc[:, 0].str.lower()
+            parts.append(np.insert(_scan_occurrences(texts, phrases, step), 2, col, axis=1))
+        occ = np.concatenate(parts)
+        occ = occ[np.argsort(occ[:, 0], kind="stable")]
+    if rows is not None:
+        occ[:, 0] = rows[occ[:, 0]]
+    return occ
 
 def _json_error(message: str, code: int = 500):
     """Return JSON error with a compact traceback string."""
@@ -516,10 +1705,2103 @@ def _json_error(message: str, code: int = 500):
     resp.status_code = code
     return resp
 
+# ------------------------------
+# Columnar upload cache
+# ------------------------------
+# Each cleaned upload is stored under UPLOAD_FOLDER/emailsim_cache/<sha256 of
+# the workbook>/ as one file per column: .npy arrays for numeric/date/bool
+# columns, and for text a UTF-8 blob of NUL-separated cells plus an .npy of
+# byte offsets. Arrays are memory-mapped and text is read back in slices, so a
+# re-upload or a /process after a restart skips parsing and _clean_text
+# altogether. A new .xlsx is streamed into this layout batch by batch
+# (_ColumnWriter) and then loaded from it, never being whole in memory twice.
+
+_CACHE_VERSION = 1
+
+def _cache_root() -> str:
+    return os.path.join(app.config["UPLOAD_FOLDER"], "emailsim_cache")
+
+def _uploads_root() -> str:
+    """Folder the uploaded files are saved in; UPLOAD_FOLDER itself is shared (by default it is the temp dir)."""
+    folder = os.path.join(app.config["UPLOAD_FOLDER"], "emailsim_uploads")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+@_timed("digest")
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _json_name(name: object) -> object:
+    return name if isinstance(name, (str, int, float)) and not isinstance(name, bool) else str(name)
+
+def _save_text_column(col: pd.Series, base: str) -> bool:
+    texts = [_display_value(v) for v in col.tolist()]
+    data = _CELL_SEP.join(texts).encode("utf-8")
+    seps = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0)
+    split_ok = len(seps) == max(len(texts) - 1, 0)
+    if split_ok:
+        offsets = np.concatenate(([0], seps + 1, [len(data) + 1])).astype(np.int64)
+    else:  # a cell contains NUL itself: fall back to measuring every cell
+        sizes = np.fromiter((len(t.encode("utf-8")) + 1 for t in texts), dtype=np.int64, count=len(texts))
+        offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+    with open(base + ".txt", "wb") as fh:
+        fh.write(data)
+    np.save(base + ".offsets.npy", offsets)
+    return split_ok
+
+def _load_text_column(base: str, rows: int, split_ok: bool) -> list[str]:
+    """The cells of a cached text column, read CACHE_READ_BYTES at a time (cell boundaries from the offsets)."""
+    if not rows:
+        return []
+    offsets = np.load(base + ".offsets.npy")
+    out: list[str] = []
+    with open(base + ".txt", "rb") as fh:
+        lo = 0
+        while lo < rows:
+            hi = min(max(int(np.searchsorted(offsets, offsets[lo] + CACHE_READ_BYTES, side="right")) - 1, lo + 1), rows)
+            fh.seek(offsets[lo])
+            data = fh.read(offsets[hi] - 1 - offsets[lo])
+            if split_ok:
+                out.extend(str(data, "utf-8").split(_CELL_SEP))
+            else:
+                cuts = offsets[lo:hi + 1] - offsets[lo]
+                out.extend(str(data[cuts[i]:cuts[i + 1] - 1], "utf-8") for i in range(hi - lo))
+            lo = hi
+    return out
+
+@_timed("cache")
+def _save_cached_frame(digest: str, df: pd.DataFrame) -> None:
+    """Write the cleaned frame to the cache (atomically: build in a temp dir, then rename)."""
+    root = _cache_root()
+    final = os.path.join(root, digest)
+    if os.path.isdir(final):
+        return
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{digest[:12]}-", dir=root)
+    try:
+        meta = {"version": _CACHE_VERSION, "rows": int(len(df)), "columns": []}
+        for i in range(df.shape[1]):
+            col = df.iloc[:, i]
+            base = os.path.join(tmp, f"c{i}")
+            info = {"name": _json_name(df.columns[i])}
+            if _is_text_dtype(col.dtype):
+                info["kind"] = "text"
+                info["split"] = _save_text_column(col, base)
+            else:
+                info["kind"] = "array"
+                np.save(base + ".npy", col.to_numpy(), allow_pickle=False)
+            meta["columns"].append(info)
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, final)
+    except (OSError, ValueError):
+        shutil.rmtree(tmp, ignore_errors=True)  # lost a race with another worker, disk full, or an unstorable dtype
+        return
+    _prune_cache(keep=digest)
+
+class _ColumnWriter:
+    """Writes the cleaned batches of _iter_xlsx_batches to a folder in the cache layout, one batch at a time.
+
+    A column goes out as text from the first batch with a str cell that
+    read_excel would not parse as a number or a bool. Until then its cells
+    are held back: a column that never has one gets its dtype inferred over
+    all of its rows at close(), by the parser read_excel uses, and is stored
+    as an .npy of that dtype, or as text when that leaves blanks.
+    Trailing all-blank ``Unnamed:`` columns are dropped, as read_excel does.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.rows = 0
+        self.columns: list[dict] = []
+
+    def add(self, batch: pd.DataFrame) -> None:
+        for i in range(len(self.columns), batch.shape[1]):  # first seen in this batch: blank above it
+            base = os.path.join(self.folder, f"c{i}")
+            open(base + ".txt", "wb").close()
+            self.columns.append({"name": batch.columns[i], "base": base, "size": 0, "starts": [], "split": True,
+                                 "held": [np.full(self.rows, None, dtype=object)], "blank": True})
+        for i, col in enumerate(self.columns):
+            cells = batch.iloc[:, i]
+            is_str = _str_cells(cells)
+            col["blank"] = col["blank"] and bool(cells.isna().all())
+            if col["held"] is not None and is_str.any() and not _parsed_values(cells):  # a text column after all
+                held, col["held"] = col["held"], None
+                for part in held:
+                    self._write(col, self._texts(pd.Series(part, dtype=object)))
+            if col["held"] is not None:
+                col["held"].append(cells.to_numpy(dtype=object, copy=True))  # a view would pin the whole batch
+            else:
+                self._write(col, self._texts(cells, is_str))
+        self.rows += len(batch)
+
+    @staticmethod
+    def _texts(cells: pd.Series, is_str=None) -> list[str]:
+        """Cell text of an object column whose str cells are already cleaned."""
+        is_str = _str_cells(cells) if is_str is None else is_str
+        if not is_str.all():
+            cells = cells.copy()
+            cells[~is_str] = _clean_series(cells[~is_str])
+        return cells.tolist()
+
+    def _write(self, col: dict, texts: list[str]) -> None:
+        if not texts:
+            return
+        data = _CELL_SEP.join(texts).encode("utf-8")
+        seps = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0)
+        if len(seps) == len(texts) - 1:
+            starts = np.concatenate(([0], seps + 1))
+        else:  # a cell contains NUL itself: measure every cell
+            col["split"] = False
+            sizes = np.fromiter((len(s.encode("utf-8")) + 1 for s in texts), dtype=np.int64, count=len(texts))
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        lead = 1 if col["starts"] else 0  # the separator after the previous batch's last cell
+        col["starts"].append(starts.astype(np.int64) + col["size"] + lead)
+        with open(col["base"] + ".txt", "ab") as fh:
+            if lead:
+                fh.write(_CELL_SEP.encode("utf-8"))
+            fh.write(data)
+        col["size"] += lead + len(data)
+
+    def close(self) -> None:
+        """Store the typed columns and the text offsets, and write meta.json."""
+        while self.columns and str(self.columns[-1]["name"]).startswith("Unnamed: ") and self.columns[-1]["blank"]:
+            col = self.columns.pop()
+            os.remove(col["base"] + ".txt")
+        meta = {"version": _CACHE_VERSION, "rows": self.rows, "columns": []}
+        for col in self.columns:
+            info = {"name": _json_name(col["name"]), "kind": "text"}
+            if col["held"] is not None:
+                values = _infer_column(np.concatenate(col["held"]))
+                if not values.isna().any() and not _is_text_dtype(values.dtype):
+                    np.save(col["base"] + ".npy", values.to_numpy(), allow_pickle=False)
+                    os.remove(col["base"] + ".txt")
+                    meta["columns"].append({**info, "kind": "array"})
+                    continue
+                self._write(col, _clean_series(values.astype(object)).tolist())
+            offsets = np.concatenate(col["starts"] + [[col["size"] + 1]]).astype(np.int64)
+            np.save(col["base"] + ".offsets.npy", offsets)
+            meta["columns"].append({**info, "split": col["split"]})
+        with open(os.path.join(self.folder, "meta.json"), "w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+
+def _read_columns(folder: str, mmap: bool = True):
+    """The DataFrame of a folder in the cache layout (numeric columns memory-mapped), or None if it is stale."""
+    with open(os.path.join(folder, "meta.json"), encoding="utf-8") as fh:
+        meta = json.load(fh)
+    if meta.get("version") != _CACHE_VERSION:
+        return None
+    rows = meta["rows"]
+    data = {}
+    for i, info in enumerate(meta["columns"]):
+        base = os.path.join(folder, f"c{i}")
+        if info["kind"] == "text":
+            data[i] = pd.Series(_load_text_column(base, rows, info["split"]), dtype=object)
+        else:
+            data[i] = pd.Series(np.load(base + ".npy", mmap_mode="r" if mmap else None))
+    df = pd.DataFrame(data) if data else pd.DataFrame(index=range(rows))
+    df.columns = [info["name"] for info in meta["columns"]]
+    return df
+
+@_timed("cache")
+def _load_cached_frame(digest: str):
+    """Memory-map a cached upload back into a DataFrame, or None on a miss."""
+    folder = os.path.join(_cache_root(), digest)
+    try:
+        df = _read_columns(folder)
+        if df is not None:
+            os.utime(folder)  # LRU stamp for _prune_cache
+        return df
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _cache_xlsx(path: str, key: str, progress=None, sheet: int = 0) -> bool:
+    """Stream one sheet of an .xlsx straight into the cache under ``key``; False if the cache could not be written.
+
+    Unlike _save_cached_frame, the frame is never whole in memory: batches
+    go to disk as they are parsed, and the caller loads the result back.
+    """
+    root = _cache_root()
+    final = os.path.join(root, key)
+    if os.path.isdir(final):
+        return True
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=root)
+    try:
+        writer = _ColumnWriter(tmp)
+        for batch in _iter_xlsx_batches(path, progress=progress, sheet=sheet):
+            writer.add(batch)
+        writer.close()
+        os.replace(tmp, final)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return os.path.isdir(final)  # lost a race with another worker, which wrote the same thing; else disk full
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _prune_cache(keep=key)
+    return True
+
+def _prune_cache(keep: str = "") -> None:
+    """Drop least recently used cache entries until the cache fits in CACHE_MAX_MB."""
+    root = _cache_root()
+    entries = []
+    for name in os.listdir(root):
+        folder = os.path.join(root, name)
+        if name.startswith(".") or not os.path.isdir(folder):
+            continue
+        size = sum(e.stat().st_size for e in os.scandir(folder) if e.is_file())
+        entries.append((os.path.getmtime(folder), name, size))
+    total = sum(e[2] for e in entries)
+    for _, name, size in sorted(entries):
+        if total <= CACHE_MAX_MB * 1024 * 1024:
+            break
+        if name != keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            total -= size
+
+def _sheet_digest(digest: str, sheet: int) -> str:
+    """Cache key of one worksheet; the first sheet keeps the workbook's own digest."""
+    return digest if not sheet else hashlib.sha256(f"{digest}/sheet{sheet}".encode("utf-8")).hexdigest()
+
+def _load_upload(path: str, digest: str = "", progress=None, sheet: int = 0) -> tuple[str, pd.DataFrame]:
+    """Workbook digest and the cleaned frame of one of its sheets, from the cache when this exact content was seen before."""
+    digest = digest or _file_digest(path)
+    key = _sheet_digest(digest, sheet)
+    df = _load_cached_frame(key)
+    fmt = "" if df is not None else _upload_format(path)
+    if fmt == "xlsx" and _cache_xlsx(path, key, progress, sheet):  # parsed batches go to disk, not into a list
+        df = _load_cached_frame(key)
+    if df is None:
+        df = _load_frame(path, progress, sheet, fmt)
+        _save_cached_frame(key, df)
+    elif progress:
+        progress(rows_parsed=len(df), rows_total=len(df))
+    _count(rows=len(df))
+    return digest, df
+
+def _workbook_sheets(path: str) -> list[dict]:
+    """Name and row count of every worksheet, from workbook metadata only (no cells are parsed).
+
+    Counts come from each .xlsx sheet's <dimension> (header row excluded) and
+    are None where the file has none, and for .xls. CSV/TSV exports have no sheets.
+    """
+    try:
+        fmt = _sniff_format(path)
+        if fmt == "xlsx":
+            from openpyxl import load_workbook
+
+            with open(path, "rb") as fh:
+                wb = load_workbook(fh, read_only=True)
+                try:
+                    return [{"name": ws.title, "rows": max(ws.max_row - 1, 0) if ws.max_row else None}
+                            for ws in wb.worksheets]
+                finally:
+                    wb.close()
+        if fmt == "xls" and _xls_engines():
+            return [{"name": str(name), "rows": None}
+                    for name in pd.ExcelFile(path, engine=_xls_engines()[0]).sheet_names]
+        return []
+    except Exception:
+        app.logger.warning("could not list the sheets of %s", path, exc_info=True)
+        return []
+
+# ------------------------------
+# Query result cache
+# ------------------------------
+# A finished search is fully decided by the searched frame's content digest,
+# the sorted phrase set, the match mode and the searched columns, so its
+# outcome is cached under exactly that: a repeat /process (or batch sheet)
+# is answered without a scan, and a new version of a workbook, having a new
+# digest, can never be served an older version's result.
+
+class _ResultCache:
+    """LRU of search outcomes, ``{"rows", "hits", "counts"}`` arrays keyed by _ResultCache.key.
+
+    ``rows`` are the matched row positions, ``hits`` their packed phrase bits
+    and ``counts`` per phrase (occurrences, rows). Memory holds
+    RESULT_CACHE_ENTRIES / RESULT_CACHE_MB; every entry is also written to
+    UPLOAD_FOLDER/emailsim_results (capped by RESULT_CACHE_DISK_MB) so other
+    workers, and this one after a restart or an eviction, find it there.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits: Counter = Counter()  # by tier: memory, disk
+        self.misses = 0
+
+    @staticmethod
+    def key(digest: str, phrases: tuple[str, ...], require_all: bool, scope=None, filters=None, query=None) -> str:
+        search = [digest, sorted(phrases), bool(require_all), None if scope is None else [int(c) for c in scope]]
+        if filters:
+            search.append(filters)
+        if query:
+            search.append(["query", _query_text(query)])
+        return hashlib.sha256(json.dumps(search).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(app.config["UPLOAD_FOLDER"], "emailsim_results", key + ".npz")
+
+    def get(self, key: str) -> tuple:
+        """``(outcome, tier)`` for a cached search, or ``(None, "")``."""
+        with self._lock:
+            found = self._items.get(key)
+            if found is not None:
+                self._items.move_to_end(key)
+                return found, "memory"
+        if not RESULT_CACHE_DISK_MB:
+            return None, ""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                found = {name: npz[name] for name in ("rows", "hits", "counts")}
+            os.utime(path)  # LRU stamp for _prune
+        except (OSError, ValueError, KeyError):
+            return None, ""
+        self._remember(key, found)
+        return found, "disk"
+
+    def put(self, key: str, outcome: dict) -> None:
+        self._remember(key, outcome)
+        if not RESULT_CACHE_DISK_MB:
+            return
+        from io import BytesIO
+        buf = BytesIO()
+        np.savez(buf, **outcome)
+        try:
+            _write_atomic(self._path(key), buf.getvalue())
+        except OSError:
+            app.logger.warning("could not write a cached result", exc_info=True)
+            return
+        self._prune(os.path.dirname(self._path(key)))
+
+    def note(self, tier: str) -> None:
+        """Count a lookup: a hit from ``tier`` or, with no tier, a miss (also into the request's timings)."""
+        with self._lock:
+            if tier:
+                self.hits[tier] += 1
+            else:
+                self.misses += 1
+        _count(**{"result_cache_hits" if tier else "result_cache_misses": 1})
+
+    def usage(self) -> tuple[int, int]:
+        with self._lock:
+            return len(self._items), sum(self._sizes.values())
+
+    def _remember(self, key: str, outcome: dict) -> None:
+        with self._lock:
+            self._items[key] = outcome
+            self._items.move_to_end(key)
+            self._sizes[key] = sum(a.nbytes for a in outcome.values())
+            while len(self._items) > 1 and (
+                len(self._items) > self.max_entries or sum(self._sizes.values()) > self.max_bytes
+            ):
+                oldest, _ = self._items.popitem(last=False)
+                del self._sizes[oldest]
+
+    @staticmethod
+    def _prune(folder: str) -> None:
+        """Drop least recently used result files until they fit in RESULT_CACHE_DISK_MB."""
+        try:
+            files = [(e.stat().st_mtime, e.path, e.stat().st_size) for e in os.scandir(folder)
+                     if e.is_file() and not e.name.startswith(".")]
+        except OSError:
+            return
+        total = sum(f[2] for f in files)
+        for _, path, size in sorted(files):
+            if total <= RESULT_CACHE_DISK_MB * 1024 * 1024:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+_results = _ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_MB * 1024 * 1024)
+
+# ------------------------------
+# Near-duplicate clusters
+# ------------------------------
+# Replies, forwards and CC copies of one message are grouped with MinHash:
+# each row's body is cut into 3-word shingles, DEDUP_HASHES salted hashes
+# keep their minimum, and rows whose signatures agree on every hash of any
+# of DEDUP_BANDS bands land in one cluster (locality-sensitive hashing, no
+# pairwise comparison), unless they agree on fewer than DEDUP_THRESHOLD of
+# all the hashes. A cluster is labelled by its first row; clusters.npy sits
+# next to the upload's columnar cache.
+
+DEDUP_HASHES = 32
+DEDUP_BANDS = 8  # 8 bands of 4 hashes: rows of Jaccard similarity 0.8 meet in some band 98% of the time
+DEDUP_THRESHOLD = 0.8
+_BODY_RE = re.compile(r"body|message|content", re.I)
+_DEDUP_SALTS = np.random.default_rng(0x5EED).integers(1, 2**63, size=(3, DEDUP_HASHES), dtype=np.uint64)
+
+def _dedup_text(df: pd.DataFrame) -> pd.Series:
+    """Lowercased text the signatures are taken over: the body-like text columns, else the whole row."""
+    body = [i for i, c in enumerate(df.columns) if _BODY_RE.search(str(c)) and _is_text_dtype(df.dtypes.iloc[i])]
+    return _search_text(df.iloc[:, body] if body else df)
+
+def _minhash_signatures(texts: pd.Series, chunk_rows: int = INDEX_CHUNK_ROWS) -> np.ndarray:
+    """(rows, DEDUP_HASHES) uint64 MinHash signatures over word 3-shingles; a row without words is all ones."""
+    sigs = np.full((len(texts), DEDUP_HASHES), np.iinfo(np.uint64).max, dtype=np.uint64)
+    mult = _DEDUP_SALTS[0] | np.uint64(1)
+    with np.errstate(over="ignore"):
+        for lo in range(0, len(texts), chunk_rows):
+            tokens = [t.split() for t in texts.iloc[lo:lo + chunk_rows]]  # punctuation stays on its word
+            counts = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+            flat = np.array(list(itertools.chain.from_iterable(tokens)), dtype=object)
+            if not len(flat):
+                continue
+            h = pd.util.hash_array(flat)
+            ends = np.repeat(np.cumsum(counts), counts)
+            idx = np.arange(len(h))
+            pos = idx - np.repeat(np.cumsum(counts) - counts, counts)
+            # shingle at i is tokens i, i+1, i+2 of its row; a row of one or two words is one short shingle
+            nxt1 = np.where(idx + 1 < ends, np.append(h[1:], np.uint64(0)), np.uint64(0))
+            nxt2 = np.where(idx + 2 < ends, np.append(h[2:], [np.uint64(0)] * 2), np.uint64(0))
+            shingles = h * _DEDUP_SALTS[1, 0] + nxt1 * _DEDUP_SALTS[1, 1] + nxt2
+            keep = pos <= np.maximum(np.repeat(counts, counts) - 3, 0)
+            shingles = shingles[keep]
+            per_row = np.bincount(np.repeat(np.arange(len(counts)), counts)[keep], minlength=len(counts))
+            has = per_row > 0
+            starts = (np.cumsum(per_row) - per_row)[has]
+            for k in range(DEDUP_HASHES):
+                sigs[lo + np.flatnonzero(has), k] = np.minimum.reduceat((shingles ^ _DEDUP_SALTS[2, k]) * mult[k], starts)
+    return sigs
+
+def _near_duplicate_clusters(sigs: np.ndarray) -> np.ndarray:
+    """Cluster label (the first row of its cluster) of every row, from MinHash signatures by banded LSH.
+
+    In every band each row is linked to the first row of its bucket when the
+    two signatures agree on DEDUP_THRESHOLD of the hashes; clusters are the
+    connected groups of linked rows.
+    """
+    n = len(sigs)
+    labels = np.arange(n, dtype=np.int64)
+    live = np.flatnonzero(sigs[:, 0] != np.iinfo(np.uint64).max)  # rows with words
+    if len(live) < 2:
+        return labels
+    width = DEDUP_HASHES // DEDUP_BANDS
+    src, dst = [], []
+    with np.errstate(over="ignore"):
+        for b in range(DEDUP_BANDS):
+            band = sigs[live, b * width:(b + 1) * width]
+            key = band[:, 0].copy()
+            for j in range(1, width):
+                key = key * _DEDUP_SALTS[0, j] + band[:, j]
+            inverse = np.unique(key, return_inverse=True)[1]
+            first = np.full(inverse.max() + 1, n, dtype=np.int64)
+            np.minimum.at(first, inverse, live)
+            first = first[inverse]
+            linked = first != live
+            rows, heads = live[linked], first[linked]
+            similar = (sigs[rows] == sigs[heads]).mean(axis=1) >= DEDUP_THRESHOLD
+            src.append(rows[similar])
+            dst.append(heads[similar])
+    src, dst = np.concatenate(src), np.concatenate(dst)
+    while len(src):  # both ends of every link take the smaller label, until nothing moves
+        before = labels.copy()
+        np.minimum.at(labels, src, labels[dst])
+        np.minimum.at(labels, dst, labels[src])
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+def _clusters_path(entry: dict) -> str:
+    return os.path.join(_cache_root(), _sheet_digest(entry["digest"], entry.get("sheet", 0)), "clusters.npy")
+
+def _entry_clusters(entry: dict) -> np.ndarray:
+    """Near-duplicate cluster labels of an upload's rows: from memory, the upload's cache folder, or worked out now."""
+    clusters = entry.get("clusters")
+    if clusters is not None:
+        return clusters
+    df = entry["original_data"]
+    path = _clusters_path(entry)
+    try:
+        clusters = np.load(path, allow_pickle=False)
+        if clusters.shape != (len(df),):
+            clusters = None
+    except (OSError, ValueError):
+        clusters = None
+    if clusters is None:
+        with _stage("dedup"):
+            clusters = _near_duplicate_clusters(_minhash_signatures(_dedup_text(df)))
+        if os.path.isfile(os.path.join(os.path.dirname(path), "meta.json")):  # only beside a complete cache entry
+            try:
+                _write_atomic(path, _npy_bytes(clusters))
+            except OSError:
+                pass
+    entry["clusters"] = clusters
+    _store.resize(entry)
+    return clusters
+
+def _collapse_duplicates(clusters: np.ndarray, rows: np.ndarray, hits: np.ndarray) -> tuple:
+    """``(rows, hits, duplicates)``: the first matched row of each cluster and how many matched rows it stands for."""
+    _, first, counts = np.unique(clusters[rows], return_index=True, return_counts=True)
+    order = np.argsort(first)
+    keep = first[order]
+    return rows[keep], hits[keep], counts[order]
+
+# ------------------------------
+# Structured filters
+# ------------------------------
+# /process can narrow a search to rows whose date column falls in a range and
+# whose sender/recipient columns name given people, before any text is
+# scanned. A filtered column gets an index the first time a worker uses it:
+# a date column's timestamps sorted (a range is two binary searches), and an
+# address column's distinct cells with the rows holding each (an address is
+# matched against the distinct cells, not against every row).
+
+_DATE_HEADER_RE = re.compile(r"date|sent|received|time", re.I)
+_ADDRESS_HEADER_RE = re.compile(r"^(from|to|cc|bcc)$|sender|recipient|e-?mail|address", re.I)
+
+def _parse_dates(col: pd.Series) -> pd.Series:
+    """A column as naive timestamps; cells that are not dates become NaT."""
+    if not pd.api.types.is_datetime64_any_dtype(col.dtype):
+        col = pd.to_datetime(col.astype(object).map(_display_value), errors="coerce", format="mixed")
+    if getattr(col.dt, "tz", None) is not None:
+        col = col.dt.tz_localize(None)
+    return col
+
+def _filter_columns(df: pd.DataFrame) -> dict:
+    """Headers structured filters can target: ``{"date": [...], "address": [...]}``.
+
+    A date column is a datetime column, or a text column with a date-like
+    header whose first non-blank cells mostly parse as dates.
+    """
+    found = {"date": [], "address": []}
+    for i, name in enumerate(df.columns):
+        col = df.iloc[:, i]
+        if pd.api.types.is_datetime64_any_dtype(col.dtype):
+            found["date"].append(str(name))
+        elif _is_text_dtype(col.dtype) and _DATE_HEADER_RE.search(str(name)):
+            sample = col[col.astype(bool)].head(200)
+            if len(sample) and _parse_dates(sample).notna().mean() >= 0.9:
+                found["date"].append(str(name))
+        elif _is_text_dtype(col.dtype) and _ADDRESS_HEADER_RE.search(str(name)):
+            found["address"].append(str(name))
+    return found
+
+class _DateIndex:
+    """Rows of a date column ordered by timestamp (microseconds); cells that are not dates are left out."""
+
+    def __init__(self, col: pd.Series):
+        stamps = _parse_dates(col)
+        keep = stamps.notna().to_numpy()
+        keys = stamps.to_numpy(dtype="datetime64[us]")[keep].view(np.int64)
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.rows = np.flatnonzero(keep)[order]
+        self.nbytes = self.keys.nbytes + self.rows.nbytes
+
+    def between(self, lo, hi) -> np.ndarray:
+        """Sorted rows dated in [lo, hi) (either end may be None)."""
+        i = 0 if lo is None else np.searchsorted(self.keys, lo, side="left")
+        j = len(self.keys) if hi is None else np.searchsorted(self.keys, hi, side="left")
+        return np.sort(self.rows[i:j])
+
+class _ValueIndex:
+    """Hashed index of a text column: its distinct lowercased cells and, grouped by cell, the rows holding each."""
+
+    def __init__(self, col: pd.Series):
+        codes, uniques = pd.factorize(np.array([_display_value(v).lower() for v in col.tolist()], dtype=object))
+        self.values = list(uniques)
+        self.ids = {v: i for i, v in enumerate(self.values)}
+        self.rows = np.argsort(codes, kind="stable")
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(self.values)))))
+        self.nbytes = self.rows.nbytes + self.offsets.nbytes + sum(len(v) + 50 for v in self.values)
+
+    def matching(self, wanted: list[str]) -> np.ndarray:
+        """Sorted rows whose cell names any of ``wanted``: the whole cell, or an address, name or @domain in it."""
+        ids = set()
+        for w in wanted:
+            if w in self.ids:
+                ids.add(self.ids[w])
+            lead = "" if w.startswith("@") else r"(?<![\w.+-])"
+            pattern = re.compile(lead + re.escape(w) + r"(?![\w-])")
+            ids.update(i for i, v in enumerate(self.values) if w in v and pattern.search(v))
+        if not ids:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in ids]))
+
+def _normalize_filters(filters) -> dict:
+    """Validate /process ``filters``: ``{column: {"from": date, "to": date}}`` or ``{column: text or [texts]}``.
+
+    Dates become [lo, hi) microsecond bounds; a "to" with no time of day
+    takes in that whole day. Texts are lowercased. Raises ValueError.
+    """
+    if not filters:
+        return {}
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object keyed by column name")
+    out = {}
+    for column, spec in filters.items():
+        if isinstance(spec, dict):
+            bounds = []
+            for end in ("from", "to"):
+                text = str(spec.get(end) or "").strip()
+                if not text:
+                    bounds.append(None)
+                    continue
+                try:
+                    stamp = pd.Timestamp(text)
+                except ValueError:
+                    raise ValueError(f"Not a date: {text!r}") from None
+                if stamp.tzinfo is not None:
+                    stamp = stamp.tz_localize(None)
+                if end == "to" and stamp == stamp.normalize() and len(text) <= 10:
+                    stamp += pd.Timedelta(days=1)
+                elif end == "to":
+                    stamp += pd.Timedelta(microseconds=1)
+                bounds.append(int(stamp.value // 1000))
+            if bounds != [None, None]:
+                out[str(column)] = {"range": bounds}
+        elif isinstance(spec, (str, list, tuple)) or spec is None:
+            wanted = [spec] if isinstance(spec, str) else list(spec or ())
+            wanted = sorted({str(w).strip().lower() for w in wanted if str(w).strip()})
+            if wanted:
+                out[str(column)] = {"any": wanted}
+        else:
+            raise ValueError(f"Filter on {column!r} must be a text, a list of texts or a from/to date range")
+    return out
+
+def _check_filters(df: pd.DataFrame, filters: dict) -> None:
+    """Raise ValueError if a normalized filter names a column the frame lacks, or ranges over one that is not a date."""
+    names = [str(c) for c in df.columns]
+    date_columns = set(_filter_columns(df)["date"]) if any("range" in f for f in filters.values()) else set()
+    for column, spec in filters.items():
+        if column not in names:
+            raise ValueError(f"Unknown filter column: {column}")
+        if "range" in spec and column not in date_columns:
+            raise ValueError(f"Cannot filter on column {column!r}")
+
+def _prefilter_rows(df: pd.DataFrame, filters: dict, indexes: dict, strict: bool = True):
+    """Sorted rows passing every normalized filter, or None when there are none.
+
+    ``indexes`` keeps the column indexes (an entry's ``field_index``). A
+    column the frame lacks, or a range on a column that is not a date, raises
+    ValueError; with ``strict`` off (batch workbooks) it matches no rows.
+    """
+    if not filters:
+        return None
+    try:
+        _check_filters(df, filters)
+    except ValueError:
+        if strict:
+            raise
+        return np.zeros(0, dtype=np.int64)
+    names = [str(c) for c in df.columns]
+    rows = None
+    with _stage("prefilter"):
+        for column, spec in filters.items():
+            kind = "date" if "range" in spec else "value"
+            index = indexes.get((kind, column))
+            if index is None:
+                col = df.iloc[:, names.index(column)]
+                index = indexes[(kind, column)] = _DateIndex(col) if kind == "date" else _ValueIndex(col)
+            found = index.between(*spec["range"]) if kind == "date" else index.matching(spec["any"])
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+            if not len(rows):
+                break
+    return rows
+
+# ------------------------------
+# Query language
+# ------------------------------
+# /process ``query`` combines phrases with AND, OR, NOT, parentheses, quoted
+# phrases and NEAR/n (the two terms at most n words apart, in either order):
+#
+#     "exit plan" AND (tower c OR takeout) NOT draft
+#     budget NEAR/5 forecast
+#
+# Operators are upper case; terms side by side are ANDed, so a multi-word
+# phrase needs quotes. A query parses to a plan of nested tuples --
+# ("term", phrase), ("and", [...]), ("or", [...]), ("not", node),
+# ("near", a, b, n) -- that is run one term at a time: an AND scans each
+# further term only over the rows every earlier one left, an OR only over the
+# rows no earlier one matched, and terms already scanned for the upload (or
+# that the index says are rare) go first. The chip list is the flat ANY/ALL
+# case of the same thing and keeps its one-pass scan.
+
+_QUERY_TOKEN_RE = re.compile(r'\s*(?:"(?P<phrase>[^"]*)"|(?P<paren>[()])|NEAR(?:/(?P<near>\d+))?(?=[\s()"]|$)'
+                             r'|(?P<op>AND|OR|NOT)(?=[\s()"]|$)|(?P<word>[^\s()"]+)|(?P<quote>"))')
+
+def _query_tokens(text: str) -> list[tuple]:
+    """``(kind, value)`` tokens of a query: term, (, ), near (words apart), and, or, not."""
+    out, pos, text = [], 0, text.rstrip()
+    while pos < len(text):
+        m = _QUERY_TOKEN_RE.match(text, pos)
+        pos = m.end()
+        if m["quote"]:
+            raise ValueError("Unclosed quote in query")
+        if m["phrase"] is not None:
+            phrase = " ".join(m["phrase"].lower().split())
+            if not phrase:
+                raise ValueError("Empty quoted phrase in query")
+            out.append(("term", phrase))
+        elif m["paren"]:
+            out.append((m["paren"], None))
+        elif m["op"]:
+            out.append((m["op"].lower(), None))
+        elif m["word"]:
+            out.append(("term", m["word"].lower()))
+        else:
+            out.append(("near", int(m["near"]) if m["near"] else NEAR_DEFAULT_WORDS))
+    return out
+
+def _parse_query(text: str) -> tuple:
+    """Parse a query into its plan (see above). Raises ValueError on bad syntax or too many terms."""
+    tokens = _query_tokens(str(text or ""))
+    if not tokens:
+        raise ValueError("Empty query")
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def take(kind):
+        nonlocal pos
+        if peek() != kind:
+            raise ValueError(f"Expected {kind!r} in query" if kind != "term" else
+                             f"Expected a word or quoted phrase in query, found {peek() or 'the end'}")
+        pos += 1
+        return tokens[pos - 1][1]
+
+    def joined(kind, parts):
+        flat = []
+        for p in parts:
+            flat.extend(p[1] if p[0] == kind else [p])
+        return flat[0] if len(flat) == 1 else (kind, flat)
+
+    def either():
+        parts = [both()]
+        while peek() == "or":
+            take("or")
+            parts.append(both())
+        return joined("or", parts)
+
+    def both():
+        parts = [negated()]
+        while peek() in ("and", "not", "term", "("):
+            if peek() == "and":
+                take("and")
+            parts.append(negated())
+        return joined("and", parts)
+
+    def negated():
+        if peek() == "not":
+            take("not")
+            return ("not", negated())
+        return near()
+
+    def near():
+        node = atom()
+        pairs, left = [], node
+        while peek() == "near":
+            words = take("near")
+            right = atom()
+            if left[0] != "term" or right[0] != "term":
+                raise ValueError("NEAR joins two words or quoted phrases")
+            pairs.append(("near", left[1], right[1], words))
+            left = right
+        return joined("and", pairs) if pairs else node
+
+    def atom():
+        if peek() == "(":
+            take("(")
+            node = either()
+            take(")")
+            return node
+        return ("term", take("term"))
+
+    plan = either()
+    if pos < len(tokens):
+        raise ValueError(f"Unexpected {tokens[pos][0]!r} in query")
+    if len(_query_terms(plan)) > QUERY_MAX_TERMS:
+        raise ValueError(f"A query may use at most {QUERY_MAX_TERMS} terms")
+    return plan
+
+def _query_terms(plan: tuple, negated: bool = False, out=None) -> dict:
+    """Every term of a plan, mapped to whether it only appears under NOT, in first-seen order."""
+    out = {} if out is None else out
+    kind = plan[0]
+    if kind == "term":
+        out[plan[1]] = out.get(plan[1], True) and negated
+    elif kind == "near":
+        for p in plan[1:3]:
+            out[p] = out.get(p, True) and negated
+    elif kind == "not":
+        _query_terms(plan[1], not negated, out)
+    else:
+        for child in plan[1]:
+            _query_terms(child, negated, out)
+    return out
+
+def _query_text(plan: tuple) -> str:
+    """Canonical text of a plan: fully parenthesised, every phrase quoted (result cache key and echo)."""
+    kind = plan[0]
+    if kind == "term":
+        return json.dumps(plan[1], ensure_ascii=False)
+    if kind == "near":
+        return f"{json.dumps(plan[1], ensure_ascii=False)} NEAR/{plan[3]} {json.dumps(plan[2], ensure_ascii=False)}"
+    if kind == "not":
+        return f"NOT {_query_text(plan[1])}"
+    return "(" + f" {kind.upper()} ".join(_query_text(c) for c in plan[1]) + ")"
+
+class _QueryRun:
+    """One query over one frame: the sorted rows each plan node keeps, scanning each term only where it still matters.
+
+    ``scans`` are whole-frame ``(mask, occurrences)`` of terms already
+    scanned (the dataset store's); a term that has to be scanned over every
+    row lands there too, and in ``fresh`` for the caller to keep. ``steps``
+    records, in order, each term's rows in and out.
+    """
+
+    def __init__(self, df: pd.DataFrame, scope=None, index=None, scans=None):
+        self.df, self.scope, self.index = df, scope, index
+        self.scans = dict(scans or {})
+        self.fresh: dict[str, tuple] = {}
+        self.steps: list[dict] = []
+        self._guess: dict[str, int] = {}
+        self._read: dict[str, list] = {}  # term -> [(rows read, rows matched)] of scans over some rows
+
+    def rows(self, plan: tuple, within=None) -> np.ndarray:
+        """Rows (of ``within``, default all) the plan matches."""
+        cand = np.arange(len(self.df), dtype=np.int64) if within is None else np.asarray(within, dtype=np.int64)
+        with _stage("query"):
+            return self._eval(plan, cand)
+
+    def _estimate(self, plan: tuple) -> tuple[int, int]:
+        """``(cost, rows)``: cost 0 if no term needs a scan; rows, how many the node is expected to match."""
+        n = len(self.df)
+        kind = plan[0]
+        if kind == "term":
+            p = plan[1]
+            if p in self.scans:
+                return 0, int(self.scans[p][0].sum())
+            if p not in self._guess:
+                found = self.index.candidate_rows(p) if self.index is not None else None
+                # no index: assume each further word of a phrase halves the rows it can be in
+                self._guess[p] = len(found) if found is not None else n >> len(_TOKEN_RE.findall(p))
+            return 1, self._guess[p]
+        if kind == "not":
+            cost, rows = self._estimate(plan[1])
+            return cost, n - rows
+        children = [("term", p) for p in plan[1:3]] if kind == "near" else plan[1]
+        parts = [self._estimate(c) for c in children]
+        cost = max(c for c, _ in parts)
+        if kind == "or":
+            return cost, min(n, sum(r for _, r in parts))
+        return cost, min((r for (_, r), c in zip(parts, children) if c[0] != "not"), default=n)
+
+    def _eval(self, plan: tuple, cand: np.ndarray) -> np.ndarray:
+        kind = plan[0]
+        if not len(cand):
+            return cand
+        if kind == "term":
+            return self._term(plan[1], cand)
+        if kind == "not":
+            return np.setdiff1d(cand, self._eval(plan[1], cand), assume_unique=True)
+        if kind == "near":
+            both = self._term(plan[2], self._term(plan[1], cand))
+            return self._near(plan[1], plan[2], plan[3], both)
+        if kind == "and":  # free and narrow first; NOTs only take rows away, so they go last
+            order = sorted(plan[1], key=lambda c: (c[0] == "not",) + self._estimate(c))
+            for child in order:
+                cand = self._eval(child, cand)
+                if not len(cand):
+                    break
+            return cand
+        # or: free and broad first, each further branch only over rows still unmatched
+        order = sorted(plan[1], key=lambda c: (self._estimate(c)[0], -self._estimate(c)[1]))
+        found, rest = [], cand
+        for child in order:
+            got = self._eval(child, rest)
+            found.append(got)
+            rest = np.setdiff1d(rest, got, assume_unique=True)
+            if not len(rest):
+                break
+        return np.sort(np.concatenate(found))
+
+    def _term(self, phrase: str, cand: np.ndarray) -> np.ndarray:
+        scan = self.scans.get(phrase)
+        scanned = scan is None
+        if scan is None and len(cand) == len(self.df):  # over every row: that is the phrase's whole scan
+            occ = _scoped_occurrences(self.df, (phrase,), self.scope, self.index)
+            mask = np.zeros(len(self.df), dtype=bool)
+            mask[occ[:, 0]] = True
+            scan = self.scans[phrase] = self.fresh[phrase] = (mask, np.ascontiguousarray(occ[:, [0, 2, 3]]))
+        read = next((r for r in self._read.get(phrase, ()) if np.isin(cand, r[0], assume_unique=True).all()), None)
+        if scan is not None:
+            rows = cand[scan[0][cand]]
+        elif read is not None:  # these rows were all read for it already
+            rows, scanned = cand[np.isin(cand, read[1], assume_unique=True)], False
+        else:
+            occ = _scoped_occurrences(self.df, (phrase,), self.scope, self.index, within=cand)
+            rows = np.unique(occ[:, 0]).astype(np.int64)
+            self._read.setdefault(phrase, []).append((cand, rows))
+        self.steps.append({"term": phrase, "rows_in": int(len(cand)), "rows_out": int(len(rows)),
+                           "scanned": scanned})
+        return rows
+
+    def _near(self, a: str, b: str, words: int, rows: np.ndarray) -> np.ndarray:
+        """Those rows where some ``a`` and ``b`` (in one cell, with a scope) have at most ``words`` words between them."""
+        if not len(rows):
+            return rows
+        terms = (a,) if a == b else (a, b)
+        occ = _scoped_occurrences(self.df, terms, self.scope, within=rows)
+        sub = self.df.iloc[rows]
+        if self.scope is None:
+            texts = {-1: _search_text(sub).tolist()}
+        else:
+            frame = _row_frame(sub)
+            texts = {c: _display_frame(frame.iloc[:, [c]]).iloc[:, 0].str.lower().tolist() for c in self.scope}
+        width = [max(len(_TOKEN_RE.findall(t)), 1) for t in terms]
+        places: dict[tuple, tuple] = {}
+        for row, j, col, start in occ.tolist():
+            i = int(np.searchsorted(rows, row))
+            key = (i, col)
+            if key not in places:
+                places[key] = (np.array([m.start() for m in _TOKEN_RE.finditer(texts[col][i])]), ([], []))
+            starts, seen = places[key]
+            seen[j].append(int(np.searchsorted(starts, start)))
+        keep = set()
+        for (i, _), (_, seen) in places.items():
+            if i in keep:
+                continue
+            left, right = (seen[0], seen[0]) if a == b else seen
+            wa, wb = width[0], width[-1]
+            if any((y - x - wa if x <= y else x - y - wb) <= words
+                   for x in left for y in right if a != b or x != y):
+                keep.add(i)
+        return rows[sorted(keep)]
+
+def _query_outcome(df: pd.DataFrame, plan: tuple, terms: tuple[str, ...], scope=None, index=None, scans=None,
+                   within=None) -> tuple[dict, _QueryRun]:
+    """Run a plan into a result-cache outcome, as a chip search's, and the run that made it.
+
+    ``terms`` are the phrases whose hits are reported; their (hits, rows)
+    counts are taken within the matched rows, which is all a query reads.
+    """
+    run = _QueryRun(df, scope, index, scans)
+    rows = run.rows(plan, within)
+    masks = np.zeros((len(rows), len(terms)), dtype=bool)
+    counts = np.zeros((len(terms), 2), dtype=np.int64)
+    for j, p in enumerate(terms):
+        if p in run.scans:
+            mask, occ = run.scans[p]
+            masks[:, j] = mask[rows]
+            counts[j, 0] = np.isin(occ[:, 0], rows).sum()
+    missing = [j for j, p in enumerate(terms) if p not in run.scans]
+    if missing and len(rows):  # terms a short-circuit never reached: read over the matched rows only
+        occ = _scoped_occurrences(df, tuple(terms[j] for j in missing), scope, index, within=rows)
+        cols = np.asarray(missing)[occ[:, 1]]
+        masks[np.searchsorted(rows, occ[:, 0]), cols] = True
+        np.add.at(counts[:, 0], cols, 1)
+    counts[:, 1] = masks.sum(axis=0)
+    return {"rows": rows, "hits": np.packbits(masks, axis=1), "counts": counts}, run
+
+# ------------------------------
+# Dataset store
+# ------------------------------
+
+def _entry_nbytes(entry: dict) -> int:
+    if "frame_nbytes" not in entry:  # the frame never changes, and measuring its text is a full pass
+        entry["frame_nbytes"] = int(entry["original_data"].memory_usage(index=True, deep=True).sum())
+    size = entry["frame_nbytes"]
+    if entry.get("index") is not None:
+        size += entry["index"].keys.nbytes + entry["index"].offsets.nbytes
+    if entry.get("filtered_rows") is not None:
+        size += entry["filtered_rows"].nbytes
+    for name in ("phrase_hits", "duplicates", "clusters"):
+        if entry.get(name) is not None:
+            size += entry[name].nbytes
+    size += sum(bits.nbytes + occ.nbytes for bits, occ in entry.get("phrase_scans", {}).values())
+    size += sum(index.nbytes for index in entry.get("field_index", {}).values())
+    return size
+
+class _DatasetStore:
+    """Per-upload state keyed by the upload's filename.
+
+    Entries live in an in-process LRU capped by STORE_MAX_MB / STORE_MAX_ENTRIES.
+    A small record per upload (where the file is, its content digest, the
+    latest matched rows) is also written to SHARED_STATE_DIR, so any worker can
+    rebuild an entry it has never seen, or one it evicted, from the columnar
+    cache instead of asking the user to upload again.
+    """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._sizes: dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(_shared_root(), key)
+
+    def create(self, key: str, path: str, digest: str, df: pd.DataFrame, build_index: bool = False,
+               **meta) -> dict:
+        """Register an upload's frame.
+
+        ``meta`` (any of _ENTRY_META) is kept on the entry and in the shared
+        record: a batch's sources, the sheet the frame is, which upload it is
+        a sheet of, and the workbook's sheet list.
+        """
+        meta = {k: v for k, v in meta.items() if v is not None}
+        entry = {"key": key, "current_file": path, "digest": digest, "original_data": df, "build_index": build_index,
+                 **meta}
+        folder = self._dir(key)
+        os.makedirs(folder, exist_ok=True)
+        _write_atomic(os.path.join(folder, "upload.json"),
+                      json.dumps({"path": path, "digest": digest, "build_index": build_index, **meta}).encode("utf-8"))
+        self._remember(key, entry)
+        return entry
+
+    def get(self, key: str):
+        """Entry for an upload, rebuilt from the shared record if this worker does not hold it."""
+        key = secure_filename(key or "")
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            entry = self._rehydrate(key)
+            if entry is None:
+                return None
+            self._remember(key, entry)
+        self._sync_result(entry)
+        return entry
+
+    def usage(self) -> tuple[int, int]:
+        """Entries held by this worker and their approximate size in bytes."""
+        with self._lock:
+            return len(self._entries), sum(self._sizes.values())
+
+    def set_result(self, entry: dict, rows: np.ndarray, reason: str,
+                   phrases: tuple[str, ...] = (), hits=None, scope=None, duplicates=None) -> None:
+        """Record the latest /process for this upload: matched row positions and which phrases each row hit.
+
+        ``duplicates`` is, for a result collapsed to one row per near-duplicate
+        cluster, how many matched rows each row stands for.
+        """
+        entry["filtered_rows"] = rows
+        entry["match_reason"] = reason
+        entry["phrases"] = phrases
+        entry["phrase_hits"] = hits
+        entry["scope"] = scope
+        entry["duplicates"] = duplicates
+        folder = self._dir(entry["key"])
+        for name, arr in (("hits", hits), ("duplicates", duplicates)):
+            path = os.path.join(folder, name + ".npy")
+            if arr is not None:
+                _write_atomic(path, _npy_bytes(arr))
+            elif os.path.exists(path):
+                os.remove(path)  # belongs to the previous result
+        result_path = os.path.join(folder, "result.npy")
+        meta = {"reason": reason, "phrases": list(phrases), "columns": None if scope is None else list(scope),
+                "collapsed": duplicates is not None}
+        _write_atomic(result_path, _npy_bytes(rows), meta=json.dumps(meta).encode("utf-8"))
+        entry["result_stamp"] = _stamp(result_path)
+        self.resize(entry)
+
+    def phrase_scans(self, entry: dict, phrases, scope=None) -> dict[str, tuple]:
+        """``(mask, occurrences)`` of those phrases this upload has already been scanned for (memory, then SHARED_STATE_DIR).
+
+        ``occurrences`` is an int32 array of (row, column, start), as from
+        _scoped_occurrences. Scans are kept per search scope.
+        """
+        cache = entry.setdefault("phrase_scans", OrderedDict())
+        entry["phrase_cache_max"] = max(PHRASE_CACHE_MAX, len(phrases))  # a long keyword list must not evict itself
+        n = len(entry["original_data"])
+        found = {}
+        for p in phrases:
+            scan = cache.get((p, scope))
+            if scan is None:
+                try:
+                    with np.load(self._phrase_path(entry["key"], p, scope), allow_pickle=False) as npz:
+                        scan = (npz["bits"], npz["occ"])
+                except (OSError, ValueError, KeyError):
+                    continue
+                if scan[0].shape != ((n + 7) // 8,) or scan[1].ndim != 2 or scan[1].shape[1] != 3:
+                    continue
+                cache[(p, scope)] = scan
+            cache.move_to_end((p, scope))
+            found[p] = (np.unpackbits(scan[0], count=n).astype(bool), scan[1])
+        self._trim_phrase_scans(entry)
+        return found
+
+    def put_phrase_scans(self, entry: dict, scans: dict[str, tuple], scope=None) -> None:
+        """Keep newly scanned phrases (mask packed to a bitmap), in memory and for other workers."""
+        from io import BytesIO
+        cache = entry.setdefault("phrase_scans", OrderedDict())
+        for p, (mask, occ) in scans.items():
+            bits = np.packbits(mask)
+            cache[(p, scope)] = (bits, occ)
+            cache.move_to_end((p, scope))
+            buf = BytesIO()
+            np.savez(buf, bits=bits, occ=occ)
+            _write_atomic(self._phrase_path(entry["key"], p, scope), buf.getvalue())
+        self._trim_phrase_scans(entry)
+        self.resize(entry)
+
+    def _phrase_path(self, key: str, phrase: str, scope=None) -> str:
+        name = phrase if scope is None else phrase + "\x00" + ",".join(map(str, scope))
+        return os.path.join(self._dir(key), "phrases", hashlib.sha1(name.encode("utf-8")).hexdigest() + ".npz")
+
+    def _trim_phrase_scans(self, entry: dict) -> None:
+        cache = entry["phrase_scans"]
+        while len(cache) > entry.get("phrase_cache_max", PHRASE_CACHE_MAX):
+            cache.popitem(last=False)
+
+    def resize(self, entry: dict) -> None:
+        with self._lock:
+            if entry["key"] in self._entries:
+                self._sizes[entry["key"]] = _entry_nbytes(entry)
+                self._evict(keep=entry["key"])
+
+    def _remember(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._sizes[key] = _entry_nbytes(entry)
+            self._evict(keep=key)
+
+    def _evict(self, keep: str) -> None:
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or sum(self._sizes.values()) > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            del self._entries[oldest]
+            del self._sizes[oldest]
+
+    def _rehydrate(self, key: str):
+        folder = self._dir(key)
+        try:
+            with open(os.path.join(folder, "upload.json"), encoding="utf-8") as fh:
+                rec = json.load(fh)
+        except (OSError, ValueError):
+            return None  # only uploads this app recorded; a key is never read as a path
+        sheet = rec.get("sheet", 0)
+        if not os.path.isfile(rec["path"]) and _load_cached_frame(_sheet_digest(rec["digest"], sheet)) is None:
+            return None
+        digest, df = _load_upload(rec["path"], rec["digest"], sheet=sheet)
+        entry = {"key": key, "current_file": rec["path"], "digest": digest, "original_data": df,
+                 "build_index": bool(rec.get("build_index"))}
+        entry.update((k, rec[k]) for k in _ENTRY_META if rec.get(k) is not None)
+        return entry
+
+    def _sync_result(self, entry: dict) -> None:
+        """Pick up a result another worker wrote since this one last looked."""
+        result_path = os.path.join(self._dir(entry["key"]), "result.npy")
+        stamp = _stamp(result_path)
+        if stamp is None or stamp == entry.get("result_stamp"):
+            return
+        try:
+            rows = np.load(result_path, allow_pickle=False)
+            with open(result_path + ".json", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            reason = meta["reason"]
+        except (OSError, ValueError, KeyError):
+            return
+        phrases = tuple(meta.get("phrases", ()))
+        try:
+            hits = np.load(os.path.join(self._dir(entry["key"]), "hits.npy"), allow_pickle=False)
+        except (OSError, ValueError):
+            hits = None
+        if hits is not None and hits.shape != (len(rows), (len(phrases) + 7) // 8):
+            hits = None  # from an older or newer result; _result_hits rebuilds it
+        duplicates = None
+        if meta.get("collapsed"):
+            try:
+                duplicates = np.load(os.path.join(self._dir(entry["key"]), "duplicates.npy"), allow_pickle=False)
+            except (OSError, ValueError):
+                pass
+            if duplicates is None or duplicates.shape != rows.shape:
+                return  # written alongside a newer result; pick both up next time
+        entry["filtered_rows"] = rows
+        entry["match_reason"] = reason
+        entry["phrases"] = phrases
+        entry["phrase_hits"] = hits
+        entry["scope"] = None if meta.get("columns") is None else tuple(meta["columns"])
+        entry["duplicates"] = duplicates
+        entry["result_stamp"] = stamp
+        self.resize(entry)
+
+def _shared_root() -> str:
+    return app.config.get("SHARED_STATE_DIR") or os.path.join(_cache_root(), "sessions")
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _npy_bytes(arr: np.ndarray) -> bytes:
+    from io import BytesIO
+    buf = BytesIO()
+    np.save(buf, arr, allow_pickle=False)
+    return buf.getvalue()
+
+def _write_atomic(path: str, data: bytes, meta: bytes = b"") -> None:
+    """Replace a shared file in one step so readers never see it half written (meta goes to path + '.json')."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    for target, payload in ((path + ".json", meta), (path, data)) if meta else ((path, data),):
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(payload)
+        os.replace(tmp, target)
+
+_ENTRY_META = ("batch", "sheet", "sheet_of", "sheets")
+
+_store = _DatasetStore(STORE_MAX_MB * 1024 * 1024, STORE_MAX_ENTRIES)
+
+def _entry_index(entry: dict):
+    """The upload's token index, built on first use in a worker that rehydrated the entry."""
+    if entry.get("build_index") and entry.get("index") is None:
+        with _stage("index"):
+            entry["index"] = _TokenIndex(_search_text(entry["original_data"]))
+        _store.resize(entry)
+    return entry.get("index")
+
+def _sheet_entry(base: dict, sheet: int, progress=None) -> dict:
+    """The entry of one worksheet of an upload, parsed (or loaded from the cache) the first time it is asked for."""
+    if sheet == base.get("sheet", 0):
+        return base
+    key = f"{base['key']}_sheet{sheet}"
+    entry = _store.get(key)
+    if entry is None:
+        digest, df = _load_upload(base["current_file"], base["digest"], progress, sheet)
+        entry = _store.create(key, base["current_file"], digest, df, base.get("build_index", False),
+                              sheet=sheet, sheet_of=base["key"])
+    return entry
+
+def _display_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Cell text of a frame as shown in the table and exports."""
+    out = pd.DataFrame({i: df.iloc[:, i].map(_display_value) for i in range(df.shape[1])}, index=df.index)
+    out.columns = df.columns
+    return out
+
+def _result_chunks(entry: dict, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Display text of the matched rows, EXPORT_CHUNK_ROWS at a time (one empty frame when nothing matched).
+
+    A result collapsed to one row per near-duplicate cluster ends in a
+    "Duplicates" column: how many matched rows each row stands for.
+    """
+    df = entry["original_data"]
+    rows = entry.get("filtered_rows")
+    if rows is None or not len(rows):
+        yield _display_frame(df.iloc[:0])
+        return
+    duplicates = entry.get("duplicates")
+    label = "Duplicates" if "Duplicates" not in df.columns else "Duplicates (collapsed)"
+    for lo in range(0, len(rows), chunk_rows):
+        chunk = _display_frame(_row_frame(df.iloc[rows[lo:lo + chunk_rows]]))
+        if duplicates is not None:
+            chunk[label] = duplicates[lo:lo + chunk_rows].astype(str)
+        yield chunk
+
+def _write_xlsx(entry: dict, fh) -> None:
+    """Write the matched rows to ``fh`` as .xlsx, row by row in openpyxl write-only mode."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("results")
+    first = True
+    for chunk in _result_chunks(entry):
+        if first:
+            ws.append(list(chunk.columns))
+            first = False
+        for values in chunk.itertuples(index=False, name=None):
+            ws.append(values)
+    wb.save(fh)
+
+def _csv_chunks(entry: dict):
+    """The matched rows as UTF-8 CSV, one block per EXPORT_CHUNK_ROWS rows."""
+    for i, chunk in enumerate(_result_chunks(entry)):
+        yield chunk.to_csv(index=False, header=i == 0).encode("utf-8")
+
+def _export_name(ext: str) -> str:
+    return f"EMAILSIM_output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{ext}"
+
+def _result_text(entry: dict, col: int, rows: np.ndarray) -> pd.Series:
+    """Lowercased display text of one column for the given rows (what the table shows)."""
+    values = entry["original_data"].iloc[rows, col]
+    if not _is_text_dtype(values.dtype) or not _str_cells(values).all():
+        values = _row_frame(entry["original_data"]).iloc[rows, col].map(_display_value)
+    return values.astype(object).str.lower()
+
+@_timed("view")
+def _result_view(entry: dict, q: str, sort_col, descending: bool) -> np.ndarray:
+    """Positions into the stored result after substring search and a stable column sort.
+
+    Orders are cached per (result, query, sort), so paging through one view
+    only slices an array.
+    """
+    rows = entry["filtered_rows"]
+    key = (entry.get("result_stamp"), q, sort_col, descending)
+    views = entry.setdefault("views", OrderedDict())
+    order = views.get(key)
+    if order is not None:
+        views.move_to_end(key)
+        return order
+    order = np.arange(len(rows), dtype=np.int64)
+    df = entry["original_data"]
+    if q and len(rows):
+        hit = np.zeros(len(rows), dtype=bool)
+        for i in range(df.shape[1]):
+            left = np.flatnonzero(~hit)
+            if not left.size:
+                break
+            hit[left] = _result_text(entry, i, rows[left]).str.contains(q, regex=False).to_numpy(dtype=bool)
+        order = order[hit]
+    if sort_col is not None and 0 <= sort_col < df.shape[1] and len(order):
+        keys = _result_text(entry, sort_col, rows[order]).to_numpy()
+        order = order[np.argsort(keys, kind="stable")]
+        if descending:
+            order = order[::-1].copy()
+    views[key] = order
+    while len(views) > 8:
+        views.popitem(last=False)
+    return order
+
+def _rows_hits(entry: dict, rows: np.ndarray) -> np.ndarray:
+    """Packed phrase bits (np.packbits along axis 1) of some rows of the stored result."""
+    phrases, scope = entry.get("phrases", ()), entry.get("scope")
+    scans = _store.phrase_scans(entry, phrases, scope)
+    if phrases and len(scans) == len(phrases):
+        return np.packbits(np.stack([scans[p][0][rows] for p in phrases], axis=1), axis=1)
+    if entry.get("match_reason") == "Keyword Match (ALL)":  # every phrase is in every matched row
+        return np.packbits(np.ones((len(rows), len(phrases)), dtype=bool), axis=1)
+    occ = _scoped_occurrences(entry["original_data"].iloc[rows], phrases, scope)
+    return np.packbits(_occurrence_masks(occ, len(rows), len(phrases)), axis=1)
+
+def _result_hits(entry: dict) -> np.ndarray:
+    """Packed phrase hits of every matched row, worked out on first use and shared through SHARED_STATE_DIR."""
+    hits = entry.get("phrase_hits")
+    if hits is None:
+        hits = _rows_hits(entry, entry["filtered_rows"])
+        _store.set_result(entry, entry["filtered_rows"], entry["match_reason"], entry.get("phrases", ()), hits,
+                          entry.get("scope"), entry.get("duplicates"))
+    return hits
+
+def _row_highlights(entry: dict, rows: np.ndarray, frame: pd.DataFrame, display: pd.DataFrame) -> list[dict]:
+    """Per row, ``{column position: [[start, end], ...]}`` spans of phrase hits in the displayed cells.
+
+    Spans come from the occurrences the matching scan recorded (offsets into
+    the row's search text), mapped onto cells. A cell whose display text is
+    not its search text up to case (blank cells, lowercasing that changes
+    length) gets no spans.
+    """
+    phrases, scope = entry.get("phrases", ()), entry.get("scope")
+    out = [{} for _ in range(len(rows))]
+    if not phrases or not len(rows):
+        return out
+    scans = _store.phrase_scans(entry, phrases, scope)
+    if len(scans) == len(phrases):
+        parts = []
+        for j, p in enumerate(phrases):  # each phrase's occurrences are in row order: slice out the page's rows
+            occ = scans[p][1]
+            lo = np.searchsorted(occ[:, 0], rows, side="left")
+            counts = np.searchsorted(occ[:, 0], rows, side="right") - lo
+            if not counts.any():
+                continue
+            taken = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            page_rows = np.repeat(np.arange(len(rows)), counts)
+            parts.append(np.column_stack([page_rows, np.full(len(taken), j), occ[taken, 1], occ[taken, 2]]))
+        found = np.concatenate(parts).tolist() if parts else []
+    else:  # scans evicted since this result was stored: look at this page's rows only
+        found = [tuple(map(int, hit)) for hit in _scoped_occurrences(frame, phrases, scope)]
+    spans: dict[tuple[int, int], list[list[int]]] = {}
+    cells: dict[int, tuple[list[str], list[int]]] = {}
+    columns = None
+    for i, j, col, start in found:
+        if col < 0:  # offset into the row's search text: find the cell it falls in
+            if columns is None:  # cell text as _search_text joins it, a column at a time
+                columns = [frame.iloc[:, c].astype(object).map(str).tolist() for c in range(frame.shape[1])]
+            if i not in cells:
+                texts = [col_texts[i].lower() for col_texts in columns]
+                cells[i] = (texts, list(itertools.accumulate((len(t) + 1 for t in texts[:-1]), initial=0)))
+            texts, starts = cells[i]
+            col = bisect.bisect_right(starts, start) - 1
+            start -= starts[col]
+            searched = texts[col]
+        else:
+            searched = display.iat[i, col].lower()
+        spans.setdefault((i, col), []).append([start, min(start + len(phrases[j]), len(searched)), searched])
+    for (i, col), found_spans in spans.items():
+        shown = display.iat[i, col]
+        searched = found_spans[0][2]
+        if len(shown) != len(searched) or shown.lower() != searched:
+            continue
+        merged: list[list[int]] = []
+        for a, b, _ in sorted(found_spans):
+            if merged and a <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        out[i][col] = merged
+    return out
+
+@_timed("serialize")
+def _page_records(entry: dict, positions: np.ndarray, preview: bool = False) -> list[dict]:
+    """JSON rows for positions into the stored result; ``_row`` is each row's position in the upload.
+
+    A collapsed result gives each row ``_duplicates``, the matched rows it stands for.
+
+    With ``preview``, cells longer than PREVIEW_CHARS are cut to that many
+    characters (their highlight spans clipped to match) and listed, by column
+    position, in ``_truncated``; /row/<_row> has the whole row.
+    """
+    rows = entry["filtered_rows"][positions]
+    frame = _row_frame(entry["original_data"]).iloc[rows]
+    display = _display_frame(frame)
+    records = display.to_dict("records")
+    phrases = entry.get("phrases", ())
+    hits = entry.get("phrase_hits")
+    hits = hits[positions] if hits is not None else _rows_hits(entry, rows)  # only the page, not the whole result
+    bits = np.unpackbits(hits, axis=1, count=len(phrases)).astype(bool)
+    highlights = _row_highlights(entry, rows, frame, display)
+    duplicates = entry.get("duplicates")
+    duplicates = duplicates[positions].tolist() if duplicates is not None else [None] * len(rows)
+    for rd, row, row_bits, marks, dups in zip(records, rows.tolist(), bits, highlights, duplicates):
+        rd["_row"] = row
+        if dups is not None:
+            rd["_duplicates"] = dups
+        rd["_match_reason"] = entry["match_reason"]
+        rd["_matched_phrases"] = list(itertools.compress(phrases, row_bits))
+        rd["_highlights"] = marks
+        if preview:
+            rd["_truncated"] = []
+    if preview:
+        for col in range(display.shape[1]):
+            name = display.columns[col]
+            for i in np.flatnonzero(display.iloc[:, col].str.len().to_numpy() > PREVIEW_CHARS).tolist():
+                rd, marks = records[i], highlights[i]
+                rd[name] = rd[name][:PREVIEW_CHARS] + "…"
+                rd["_truncated"].append(col)
+                if col in marks:
+                    marks[col] = [[a, min(b, PREVIEW_CHARS)] for a, b in marks[col] if a < PREVIEW_CHARS]
+    return records
+
+def _json_response(body: dict):
+    """jsonify, timed as the serialize stage."""
+    with _stage("serialize"):
+        return jsonify(body)
+
+def _int_arg(value, default: int, lo: int, hi: int) -> int:
+    try:
+        return min(max(int(value), lo), hi)
+    except (TypeError, ValueError):
+        return default
+
+def _no_filename():
+    """400 for a request that does not name its upload; with several workers there is no "current" one."""
+    return jsonify({"success": False, "error": "filename is required"}), 400
+
+def _result_entry():
+    """Entry named by ?filename= that has a result."""
+    entry = _store.get(request.args["filename"])
+    if entry is None or entry.get("filtered_rows") is None:
+        return None
+    return entry
+
+# ------------------------------
+# Background jobs
+# ------------------------------
+# With async=1, /upload, /batch and /process hand their work to a small thread
+# pool and answer with a job id at once. Progress is kept in memory and mirrored
+# (at most twice a second) to SHARED_STATE_DIR/_jobs/<id>.json, so /jobs/<id>
+# works on whichever worker the poll lands on.
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_JOB_SYNC_SECONDS = 0.5
+
+class _Job:
+    """Progress and outcome of one background /upload, /batch or /process."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.state = {
+            "id": self.id, "kind": kind, "state": "queued",
+            "rows_total": None, "rows_parsed": 0, "rows_scanned": 0, "matches": 0, "eta_seconds": None,
+            "created": time.time(), "started": None, "finished": None,
+        }
+        self._lock = threading.Lock()
+        self._synced = 0.0
+        self._sync()
+
+    def update(self, **fields) -> None:
+        """Merge progress fields (the ``progress`` callback of the ingest and match helpers)."""
+        with self._lock:
+            st = self.state
+            st.update(fields)
+            if st.get("files_total"):  # batches advance a workbook at a time
+                done, total = st["files_done"], st["files_total"]
+            else:
+                done, total = st["rows_parsed"] if st["kind"] == "upload" else st["rows_scanned"], st["rows_total"]
+            if total and done and st["started"]:
+                remaining = max(total - done, 0)
+                st["eta_seconds"] = round((time.time() - st["started"]) * remaining / done, 1)
+            final = st["state"] in ("done", "error")
+            if final or time.time() - self._synced >= _JOB_SYNC_SECONDS:
+                self._sync()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.state)
+
+    def _sync(self) -> None:
+        self._synced = time.time()
+        try:
+            _write_atomic(_job_path(self.id), json.dumps(self.state, default=str).encode("utf-8"))
+        except OSError:
+            app.logger.warning("could not write job record %s", self.id, exc_info=True)
+
+_jobs: dict[str, _Job] = {}
+_jobs_lock = threading.Lock()
+_job_executor = None
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(_shared_root(), "_jobs", f"{job_id}.json")
+
+def _job_pool() -> ThreadPoolExecutor:
+    global _job_executor
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=max(JOB_WORKERS, 1), thread_name_prefix="emailsim-job")
+        return _job_executor
+
+def _prune_jobs() -> None:
+    cutoff = time.time() - JOB_TTL_SECONDS
+    with _jobs_lock:
+        for job_id in [j for j, job in _jobs.items() if (job.state["finished"] or time.time()) < cutoff]:
+            del _jobs[job_id]
+    folder = os.path.dirname(_job_path("x"))
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(folder, name)
+        try:
+            if os.stat(path).st_mtime < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _submit_job(kind: str, error_prefix: str, fn, *args, **kwargs) -> _Job:
+    """Queue ``fn(*args, progress=..., **kwargs)``; its returned dict becomes the job's result.
+
+    The job keeps its own stage timings (reported in its state and to /metrics
+    as ``job_<kind>``) and is profiled when the submitting request asked to be.
+    """
+    _prune_jobs()
+    job = _Job(kind)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    profile = _wants_profile()
+
+    def run():
+        timings = _Timings()
+        token = _timings_var.set(timings)
+        profiler = _SamplingProfiler(threading.get_ident()).start() if profile else None
+        job.update(state="running", started=time.time())
+        try:
+            outcome = {"state": "done", "result": fn(*args, progress=job.update, **kwargs), "eta_seconds": 0.0}
+        except Exception as e:
+            app.logger.warning("%s job %s failed", kind, job.id, exc_info=True)
+            outcome = {"state": "error", "error": f"{error_prefix}: {e}"}
+        finally:
+            _timings_var.reset(token)
+        if profiler is not None:
+            outcome["profile_file"] = profiler.stop(f"job_{kind}")
+        _metrics.record(f"job_{kind}", timings)
+        job.update(**outcome, finished=time.time(), timings=timings.summary())
+
+    _job_pool().submit(run)
+    return job
+
+def _job_state(job_id: str):
+    """Latest state of a job, from this worker's memory or the shared record."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job.snapshot()
+    try:
+        with open(_job_path(job_id), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+def _truthy(value) -> bool:
+    return value is True or str(value).lower() in ("1", "true", "on")
+
+def _ingest_upload(filename: str, path: str, build_index: bool, progress=None, dedup: bool = False) -> dict:
+    """Parse a saved upload (its first sheet; the others wait until asked for) into the dataset store; the /upload response body.
+
+    ``dedup`` works out the near-duplicate clusters now rather than on the first collapsed /process.
+    """
+    sheets = _workbook_sheets(path)
+    digest, df = _load_upload(path, progress=progress)
+    entry = _store.create(filename, path, digest, df, build_index, sheets=sheets)
+    _entry_index(entry)
+    body = {"success": True, "filename": filename, "rows": int(len(df)), "indexed": build_index,
+            "headers": [str(c) for c in df.columns], "sheets": sheets, "filter_columns": _filter_columns(df)}
+    if dedup:
+        clusters = _entry_clusters(entry)
+        body["duplicate_rows"] = int(len(clusters) - len(np.unique(clusters)))
+    return body
+
+def _column_scope(entry: dict, columns) -> tuple:
+    """``(scope, unknown)``: positions of the named columns in an upload (None for all) and names it lacks."""
+    if not columns:
+        return None, []
+    names = [str(c) for c in entry["original_data"].columns]
+    unknown = [c for c in columns if c not in names]
+    return tuple(sorted({names.index(c) for c in columns if c in names})), unknown
+
+def _run_sheet(base: dict, sheet: int, phrases: list[str], require_all: bool, page_size: int, progress=None,
+               columns=None, preview: bool = False, dedup: bool = False, filters=None, query=None) -> dict:
+    """_run_process on one worksheet of an upload (parsed on its first search); ``filename`` is that sheet's key."""
+    entry = _sheet_entry(base, sheet, progress)
+    scope, unknown = _column_scope(entry, columns)
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+    return {**_run_process(entry, phrases, require_all, page_size, progress, scope, preview, dedup, filters, query),
+            "filename": entry["key"]}
+
+def _run_process(entry: dict, phrases: list[str], require_all: bool, page_size: int, progress=None,
+                 scope=None, preview: bool = False, dedup: bool = False, filters=None, query=None) -> dict:
+    """Match an upload against normalized phrases and store the result; the /process response body.
+
+    ``scope`` limits the search to those column positions, each searched on its own.
+    ``preview`` sends the first page as previews (see _page_records).
+    ``dedup`` keeps one matched row per near-duplicate cluster (see _collapse_duplicates).
+    ``filters`` (from _normalize_filters) narrow the rows before any text is
+    scanned; with filters and no phrases, the filtered rows are the result.
+    ``query`` (a _parse_query plan) takes the place of the phrases and mode;
+    its terms outside NOT are the highlighted phrases.
+    """
+    df: pd.DataFrame = entry["original_data"]
+    rows = np.zeros(0, dtype=np.int64)
+    if progress:
+        progress(rows_total=int(len(df)))
+
+    unique = tuple(sorted(set(phrases)))
+    if query is not None:
+        unique = tuple(sorted(p for p, negated in _query_terms(query).items() if not negated))
+    breakdown = []
+    hits = None
+    tier = ""
+    run = None
+    indexes = entry.setdefault("field_index", {})
+    built = len(indexes)
+    within = _prefilter_rows(df, filters, indexes)
+    if len(indexes) != built:
+        _store.resize(entry)
+    if unique or query is not None:  # only search when user has active terms
+        # the same search of the same content is answered from the result cache, with no scan
+        cache_key = _results.key(_sheet_digest(entry["digest"], entry.get("sheet", 0)), unique, require_all, scope,
+                                 filters, query)
+        outcome, tier = _results.get(cache_key)
+        _results.note(tier)
+        if outcome is None and query is not None:
+            # terms scanned by earlier searches cost nothing; the rest are read only where they still matter
+            outcome, run = _query_outcome(df, query, unique, scope, _entry_index(entry),
+                                          _store.phrase_scans(entry, tuple(_query_terms(query)), scope), within)
+            with _stage("store"):
+                if run.fresh:
+                    _store.put_phrase_scans(entry, run.fresh, scope)
+                _results.put(cache_key, outcome)
+        elif outcome is None:
+            # every phrase's scan is cached for the upload, so a chip edit only scans the phrases it adds
+            scans = _store.phrase_scans(entry, unique, scope)
+            missing = tuple(p for p in unique if p not in scans)
+            if missing:
+                occ = _scoped_occurrences(df, missing, scope, _entry_index(entry), progress, within)
+                new = {}
+                for p, mine in zip(missing, _occurrences_by_phrase(occ, len(missing))):
+                    mask = np.zeros(len(df), dtype=bool)
+                    mask[mine[:, 0]] = True
+                    new[p] = (mask, mine)
+                if within is None:  # a scan of the filtered rows only is not the phrase's scan
+                    with _stage("store"):
+                        _store.put_phrase_scans(entry, new, scope)
+                scans.update(new)
+            if within is not None:  # whole-upload scans from earlier searches count only inside the filter
+                keep = np.zeros(len(df), dtype=bool)
+                keep[within] = True
+                scans = {p: (mask & keep, occ[keep[occ[:, 0]]]) for p, (mask, occ) in scans.items()}
+            combine = np.logical_and.reduce if require_all else np.logical_or.reduce
+            rows = np.flatnonzero(combine([scans[p][0] for p in unique]))
+            outcome = {
+                "rows": rows,
+                "hits": np.packbits(np.stack([scans[p][0][rows] for p in unique], axis=1), axis=1),
+                "counts": np.array([[len(scans[p][1]), scans[p][0].sum()] for p in unique], dtype=np.int64),
+            }
+            with _stage("store"):
+                _results.put(cache_key, outcome)
+        rows, hits = outcome["rows"], outcome["hits"]
+        breakdown = [{"phrase": p, "hits": int(h), "rows": int(r)} for p, (h, r) in zip(unique, outcome["counts"])]
+    elif within is not None:
+        rows, hits = within, np.zeros((len(within), 0), dtype=np.uint8)
+    if progress:
+        progress(rows_scanned=int(len(df)), matches=int(len(rows)))
+    matched = len(rows)
+    duplicates = None
+    if dedup and hits is not None:
+        rows, hits, duplicates = _collapse_duplicates(_entry_clusters(entry), rows, hits)
+
+    reason = "Keyword Match (ALL)" if require_all else "Keyword Match"
+    if query is not None:
+        reason = "Query Match"
+    elif not unique and within is not None:
+        reason = "Filter Match"
+    with _stage("store"):
+        _store.set_result(entry, rows, reason, unique, hits=hits, scope=scope, duplicates=duplicates)
+    _count(rows=len(df), matches=len(rows))
+
+    return {
+        "success": True,
+        "total_count": int(len(df)),
+        "matching_count": int(len(rows)),
+        "results": _page_records(entry, np.arange(min(page_size, len(rows))), preview),
+        "headers": list(df.columns),
+        "phrase_counts": breakdown,
+        "cached": tier or None,
+        "duplicates_collapsed": int(matched - len(rows)),
+        "filtered_count": None if within is None else int(len(within)),
+        "query": None if query is None else _query_text(query),
+        "query_plan": None if run is None else run.steps,
+    }
+
+# ------------------------------
+# Batch mode
+# ------------------------------
+# A batch is a set of workbooks (uploaded together, in .zip archives, or under a
+# directory for the CLI), or several sheets of one upload. Each source is
+# parsed into the columnar cache and matched in a pool process; only its
+# matched rows travel back, so memory holds the merged result plus at most
+# MATCH_WORKERS sources in flight. The merged rows are tagged with their
+# workbook, sheet and sheet row and registered as an upload of their own, so
+# /results and the exports work on them unchanged.
+
+_WORKBOOK_EXTS = (".xlsx", ".xls", ".csv", ".tsv")
+_BATCH_TAGS = ("Source File", "Sheet", "Source Row")
+
+def _is_workbook_name(name: str) -> bool:
+    base = os.path.basename(name)
+    return base.lower().endswith(_WORKBOOK_EXTS) and not base.startswith(("~$", "._"))
+
+def _extract_workbooks(zip_path: str, label: str, folder: str, budget: list) -> list[dict]:
+    """Unpack the workbooks of one archive into ``folder``; ``budget`` is the bytes still allowed, shared across archives."""
+    sources = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/") or not _is_workbook_name(info.filename):
+                continue
+            budget[0] -= info.file_size
+            if budget[0] < 0:
+                raise ValueError(f"{label} unpacks to more than {BATCH_MAX_MB} MB")
+            name = secure_filename(os.path.basename(info.filename)) or "workbook.xlsx"
+            path = os.path.join(folder, f"{uuid.uuid4().hex[:8]}_{name}")
+            with zf.open(info) as src, open(path, "wb") as out:
+                shutil.copyfileobj(src, out)
+            sources.append({"name": f"{label}/{info.filename}", "path": path})
+    return sources
+
+def _batch_sources(inputs: list[tuple[str, str]], folder: str, all_sheets: bool = False) -> list[dict]:
+    """``{name, path}`` of every workbook among ``(label, path)`` inputs: workbooks, directories and .zip archives.
+
+    Archives are unpacked into ``folder``; directories are walked in place.
+    With ``all_sheets`` a workbook of several sheets gives one source per
+    sheet (``sheet``, ``sheet_name``); otherwise only first sheets are read.
+    """
+    sources = []
+    budget = [BATCH_MAX_MB * 1024 * 1024]
+    for label, path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                sources.extend({"name": os.path.relpath(os.path.join(root, f), path), "path": os.path.join(root, f)}
+                               for f in sorted(files) if _is_workbook_name(f))
+        elif path.lower().endswith(".zip"):
+            sources.extend(_extract_workbooks(path, label, folder, budget))
+        elif _is_workbook_name(path):
+            sources.append({"name": label, "path": path})
+    if all_sheets:
+        expanded = []
+        for src in sources:
+            sheets = _workbook_sheets(src["path"])
+            if len(sheets) > 1:
+                expanded.extend(dict(src, sheet=k, sheet_name=s["name"]) for k, s in enumerate(sheets))
+            else:
+                expanded.append(src)
+        sources = expanded
+    return sources
+
+def _match_workbook(path: str, digest: str, phrases: tuple[str, ...], require_all: bool, columns=None,
+                    sheet: int = 0, filters=None, query=None) -> dict:
+    """Load one sheet of a batch workbook (parsing it into the cache if new) and, given phrases, match it.
+
+    Only the matched rows come back, with their sheet positions, per-row
+    phrase hits (packed bits) and per-phrase (hits, rows) counts; a search
+    this sheet has had before comes from the result cache (``cached`` is the tier).
+    ``columns`` limits the search to those headers, where the workbook has them.
+    ``filters`` (normalized) narrow the rows first; a workbook without a
+    filtered column has no matches. Given a ``query`` plan, it decides the
+    rows and ``phrases`` are its highlighted terms.
+    """
+    digest, df = _load_upload(path, digest, sheet=sheet)
+    out = {"digest": digest, "rows": int(len(df)), "headers": list(df.columns), "matches": 0}
+    if not phrases and query is None:
+        return out
+    scope = None
+    if columns is not None:
+        names = [str(c) for c in df.columns]
+        scope = tuple(sorted({names.index(c) for c in columns if c in names}))
+    cache_key = _results.key(_sheet_digest(digest, sheet), phrases, require_all, scope, filters, query)
+    outcome, tier = _results.get(cache_key)
+    if outcome is None and query is not None:
+        within = _prefilter_rows(df, filters, {}, strict=False)
+        if scope == ():
+            within = np.zeros(0, dtype=np.int64)
+        outcome, _ = _query_outcome(df, query, phrases, scope, within=within)
+        _results.put(cache_key, outcome)
+    elif outcome is None:
+        within = _prefilter_rows(df, filters, {}, strict=False)
+        if scope == () or (within is not None and not len(within)):
+            occ = np.zeros((0, 4), dtype=np.int32)
+        else:
+            occ = _scoped_occurrences(df, phrases, scope, within=within)
+        masks = _occurrence_masks(occ, len(df), len(phrases))
+        rows = np.flatnonzero(masks.all(axis=1) if require_all else masks.any(axis=1))
+        outcome = {
+            "rows": rows,
+            "hits": np.packbits(masks[rows], axis=1),
+            "counts": np.stack([np.bincount(occ[:, 1], minlength=len(phrases)), masks.sum(axis=0)], axis=1),
+        }
+        _results.put(cache_key, outcome)
+    rows = outcome["rows"]
+    out.update(
+        matches=int(len(rows)),
+        frame=df.iloc[rows].reset_index(drop=True),
+        source_rows=rows,
+        hits=outcome["hits"],
+        counts=outcome["counts"],
+        cached=tier,
+    )
+    return out
+
+def _batch_worker(upload_folder: str, *args) -> dict:
+    """Pool entry point for _match_workbook; the worker is one of the pool, so it scans on its own."""
+    global MATCH_WORKERS
+    MATCH_WORKERS = 1
+    app.config["UPLOAD_FOLDER"] = upload_folder  # the cache root; the worker started from a fresh import
+    return _match_workbook(*args)
+
+def _batch_outcomes(sources: list[dict], phrases: tuple[str, ...], require_all: bool, columns=None,
+                    progress=None, filters=None, query=None) -> list[dict]:
+    """_match_workbook for every source, MATCH_WORKERS at a time; a workbook that fails gets ``{"error": ...}``."""
+    outcomes: list = [None] * len(sources)
+    totals = {"rows": 0, "matches": 0}
+    row_field = "rows_scanned" if phrases or query is not None else "rows_parsed"
+
+    def finish(i: int, outcome: dict) -> None:
+        outcomes[i] = outcome
+        if "cached" in outcome:  # a search looked up here or in a pool worker; counted in this process
+            _results.note(outcome["cached"])
+        totals["rows"] += outcome.get("rows", 0)
+        totals["matches"] += outcome.get("matches", 0)
+        if progress:
+            progress(files_total=len(sources), files_done=sum(o is not None for o in outcomes),
+                     matches=totals["matches"], **{row_field: totals["rows"]})
+
+    def args(i: int) -> tuple:
+        src = sources[i]
+        return src["path"], src.get("digest", ""), phrases, require_all, columns, src.get("sheet", 0), filters, query
+
+    workers = min(MATCH_WORKERS, len(sources))
+    if workers > 1:
+        try:
+            pool = _match_pool()
+            pending = list(range(len(sources)))[::-1]
+            running = {}
+            while pending or running:
+                while pending and len(running) < workers:
+                    i = pending.pop()
+                    running[pool.submit(_batch_worker, app.config["UPLOAD_FOLDER"], *args(i))] = i
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for f in done:
+                    i = running.pop(f)
+                    try:
+                        finish(i, f.result())
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        finish(i, {"error": str(e)})
+        except Exception:
+            app.logger.warning("parallel batch failed; continuing serially", exc_info=True)
+    for i, outcome in enumerate(outcomes):
+        if outcome is None:
+            try:
+                finish(i, _match_workbook(*args(i)))
+            except Exception as e:
+                app.logger.warning("batch workbook %s failed", sources[i]["name"], exc_info=True)
+                finish(i, {"error": str(e)})
+    return outcomes
+
+def _batch_digest(sources: list[dict], *search) -> str:
+    """Cache key of a batch's merged frame: its sheets' digests plus the search that produced it."""
+    keys = [[s.get("digest"), s.get("sheet", 0)] for s in sources]
+    return hashlib.sha256(json.dumps([keys, *search]).encode("utf-8")).hexdigest()
+
+def _merge_batch(sources: list[dict], outcomes: list[dict]) -> tuple[pd.DataFrame, int]:
+    """Matched rows of every source under one header (the union, in first-seen order) behind tag columns.
+
+    Rows are tagged with their workbook (unless every source is a sheet of
+    one workbook), their sheet (when sources are sheets) and their sheet row
+    number. Returns the frame and how many tag columns lead it.
+    """
+    union = list(dict.fromkeys(c for o in outcomes for c in o.get("headers", ())))
+    by_sheet = any("sheet_name" in s for s in sources)
+    used = {"Source File": not by_sheet or len({s["path"] for s in sources}) > 1, "Sheet": by_sheet, "Source Row": True}
+    tags = [t for t in _BATCH_TAGS if used[t]]
+    labels = [t if t not in union else f"{t} (batch)" for t in tags]
+    parts = []
+    for src, outcome in zip(sources, outcomes):
+        frame = outcome.get("frame")
+        if frame is None or not len(frame):
+            continue
+        frame = frame.reindex(columns=union, fill_value="")  # a column this workbook lacks is blank
+        values = {"Source File": src["name"], "Sheet": src.get("sheet_name", ""),
+                  "Source Row": outcome["source_rows"] + 2}  # 1-based sheet row, after the header
+        for pos, (tag, label) in enumerate(zip(tags, labels)):
+            frame.insert(pos, label, values[tag])
+        parts.append(frame)
+    if not parts:
+        return pd.DataFrame(columns=labels + union), len(tags)
+    return pd.concat(parts, ignore_index=True), len(tags)
+
+def _run_batch(key: str, folder: str, sources: list[dict], phrases=None, require_all: bool = False,
+               page_size: int = DISPLAY_LIMIT, progress=None, columns=None, preview: bool = False,
+               dedup: bool = False, filters=None, query=None) -> dict:
+    """Parse, and given phrases match, every workbook of a batch, and register the outcome in the store.
+
+    Without phrases the workbooks are only parsed into the cache and ``key``
+    becomes an (empty) upload carrying the merged header; the body is an
+    /upload one. With phrases the merged, source-tagged matched rows become an
+    upload keyed by the batch and the search, whose result is all of its rows;
+    the body is a /process one with that key as ``filename``. ``dedup``
+    collapses near-duplicates across all of the batch's workbooks; ``filters``
+    apply to each workbook that has the filtered columns. A ``query`` plan
+    stands in for the phrases, as in _run_process.
+    """
+    unique = None if phrases is None else tuple(sorted(set(phrases)))
+    if query is not None:
+        unique = tuple(sorted(p for p, negated in _query_terms(query).items() if not negated))
+    outcomes = _batch_outcomes(sources, unique or (), require_all, columns, progress, filters, query)
+    for src, outcome in zip(sources, outcomes):
+        src.update(digest=outcome.get("digest", src.get("digest")), rows=outcome.get("rows", 0))
+        src.pop("error", None)
+        if "error" in outcome:
+            src["error"] = outcome["error"]
+    if not any("headers" in o for o in outcomes):
+        raise ValueError("no workbook in the batch could be read")
+    batch = {"key": key, "sources": sources}
+    total = sum(o.get("rows", 0) for o in outcomes)
+    merged, ntags = _merge_batch(sources, outcomes)
+
+    if unique is None:
+        digest = _batch_digest(sources)
+        _save_cached_frame(digest, merged)
+        _store.create(key, folder, digest, merged, batch=batch)
+        _count(rows=total)
+        return {"success": True, "filename": key, "rows": int(total), "indexed": False,
+                "headers": list(merged.columns[ntags:]), "workbooks": len({s["path"] for s in sources}),
+                "sources": [{k: s[k] for k in ("name", "sheet_name", "rows", "error") if k in s} for s in sources]}
+
+    digest = _batch_digest(sources, unique, require_all, columns, *([filters] if filters else []),
+                           *([_query_text(query)] if query is not None else []))
+    _save_cached_frame(digest, merged)
+    entry = _store.create(f"{key}_{digest[:12]}", folder, digest, merged, batch=batch)
+    names = [str(c) for c in merged.columns]
+    scope = tuple(i for i, c in enumerate(names[ntags:], ntags) if columns is None or c in columns)
+    width = (len(unique) + 7) // 8
+    hits = [o["hits"] for o in outcomes if o.get("matches")]
+    hits = np.concatenate(hits) if hits else np.zeros((0, width), dtype=np.uint8)
+    rows, duplicates = np.arange(len(merged)), None
+    if dedup and (unique or query is not None):
+        rows, hits, duplicates = _collapse_duplicates(_entry_clusters(entry), rows, hits)
+    reason = "Query Match" if query is not None else "Keyword Match (ALL)" if require_all else "Keyword Match"
+    with _stage("store"):
+        _store.set_result(entry, rows, reason, unique, hits=hits, scope=scope, duplicates=duplicates)
+    counts = sum((o["counts"] for o in outcomes if "counts" in o), np.zeros((len(unique), 2), dtype=np.int64))
+    _count(rows=total, matches=len(rows))
+    return {
+        "success": True,
+        "filename": entry["key"],
+        "total_count": int(total),
+        "matching_count": int(len(rows)),
+        "duplicates_collapsed": int(len(merged) - len(rows)),
+        "results": _page_records(entry, np.arange(min(page_size, len(rows))), preview),
+        "headers": list(merged.columns),
+        "phrase_counts": [{"phrase": p, "hits": int(h), "rows": int(r)} for p, (h, r) in zip(unique, counts)],
+        "query": None if query is None else _query_text(query),
+        "sources": [{**{k: s[k] for k in ("name", "sheet_name", "rows", "error") if k in s}, "matches": o.get("matches", 0)}
+                    for s, o in zip(sources, outcomes)],
+    }
+
 # ------------------------------
 # Routes
 # ------------------------------
 
+_COMPRESSIBLE = ("application/json", "text/html", "text/plain", "text/csv")
+
+@app.after_request
+def _compress_response(resp):
+    """gzip (or brotli, when installed) a buffered text response for clients that accept it.
+
+    Streamed exports and files are left alone. Registered after
+    _report_timings, so it runs first and its time is in Server-Timing.
+    """
+    if (resp.direct_passthrough or resp.is_streamed or resp.status_code < 200 or resp.status_code >= 300
+            or "Content-Encoding" in resp.headers or resp.mimetype not in _COMPRESSIBLE):
+        return resp
+    resp.vary.add("Accept-Encoding")
+    data = resp.get_data()
+    offered = ["br", "gzip"] if importlib.util.find_spec("brotli") else ["gzip"]
+    coding = request.accept_encodings.best_match(offered)
+    if len(data) < COMPRESS_MIN_BYTES or not coding:
+        return resp
+    with _stage("compress"):
+        if coding == "br":
+            import brotli
+
+            packed = brotli.compress(data, quality=COMPRESS_LEVEL - 1)
+        else:
+            packed = gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+    resp.set_data(packed)
+    resp.headers["Content-Encoding"] = coding
+    _count(bytes_sent=len(packed))
+    return resp
+
 @app.route("/")
 def index():
     return render_template_string(
@@ -537,35 +3819,82 @@ def upload_file():
         f = request.files["file"]
         if f.filename == "":
             return jsonify({"success": False, "error": "No file selected"})
-        if not f.filename.lower().endswith((".xlsx", ".xls")):
+        if not f.filename.lower().endswith(_WORKBOOK_EXTS):
             return jsonify({"success": False, "error": "Invalid file type"})
 
         filename = secure_filename(f.filename)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{filename}"
-        path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        f.save(path)
+        filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_{filename}"
+        path = os.path.join(_uploads_root(), filename)
+        with _stage("save"):
+            f.save(path)
+        _count(bytes=os.path.getsize(path))
+        if not _sniff_format(path):  # the name passed; the content decides
+            os.remove(path)
+            return jsonify({"success": False, "error": "Not an Excel workbook or a CSV/TSV export"})
 
-        # Read Excel
-        try:
-            if filename.lower().endswith(".xlsx"):
-                df = pd.read_excel(path, engine="openpyxl")
-            else:
-                df = pd.read_excel(path, engine="xlrd")  # requires xlrd==1.2 for .xls
-        except Exception:
-            df = pd.read_excel(path)
+        build_index = request.form.get("build_index") in ("1", "true", "on")
+        dedup = _truthy(request.form.get("dedup"))
+        if _truthy(request.form.get("async")):
+            job = _submit_job("upload", "Upload failed", _ingest_upload, filename, path, build_index, dedup=dedup)
+            return jsonify({"success": True, "job_id": job.id, "filename": filename}), 202
+        return _json_response(_ingest_upload(filename, path, build_index, dedup=dedup))
+    except Exception as e:
+        return _json_error(f"Upload failed: {e}")
 
-        df = df.fillna("")
-        for col in df.columns:
-            if df[col].dtype == "object":
-                df[col] = df[col].apply(_clean_text)
+@app.route("/batch", methods=["POST"])
+def batch_upload():
+    """Several workbooks and/or .zip archives of them, parsed in parallel and searched as one merged result.
 
-        processed_data["current_file"] = path
-        processed_data["original_data"] = df
+    Form fields: ``files`` (repeated), ``async``, ``all_sheets`` (search every
+    sheet, not just the first), and optionally ``additional_keywords`` (a JSON
+    list) plus ``require_all``, or a ``query``, to match at once, in which case
+    the body is a /process one.
+    """
+    try:
+        request.max_content_length = BATCH_MAX_MB * 1024 * 1024
+        files = [f for f in request.files.getlist("files") if f.filename]
+        if not files:
+            return jsonify({"success": False, "error": "No file selected"})
+        bad = [f.filename for f in files if not f.filename.lower().endswith(_WORKBOOK_EXTS + (".zip",))]
+        if bad:
+            return jsonify({"success": False, "error": f"Invalid file type: {', '.join(bad)}"})
 
-        return jsonify({"success": True, "filename": filename, "rows": int(len(df))})
+        key = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_batch"
+        folder = os.path.join(_uploads_root(), key)
+        os.makedirs(folder, exist_ok=True)
+        inputs = []
+        with _stage("save"):
+            for i, f in enumerate(files):
+                path = os.path.join(folder, f"{i:04d}_{secure_filename(f.filename) or 'upload'}")
+                f.save(path)
+                _count(bytes=os.path.getsize(path))
+                inputs.append((os.path.basename(f.filename), path))
+            sources = _batch_sources(inputs, folder, request.form.get("all_sheets") in ("1", "true", "on"))
+            for label, path in inputs:
+                if path.lower().endswith(".zip"):
+                    os.remove(path)  # unpacked
+        if not sources:
+            return jsonify({"success": False, "error": "No .xlsx or .xls workbooks found"})
+
+        phrases = None
+        if request.form.get("additional_keywords"):
+            phrases = [p.lower().strip() for p in json.loads(request.form["additional_keywords"])
+                       if isinstance(p, str) and p.strip()]
+        require_all = request.form.get("require_all") in ("1", "true", "on")
+        try:
+            query = _parse_query(request.form["query"]) if request.form.get("query", "").strip() else None
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)})
+        run = functools.partial(_run_batch, key, folder, sources, phrases, require_all,
+                                preview=_truthy(request.form.get("preview")), dedup=_truthy(request.form.get("dedup")),
+                                query=query)
+        if _truthy(request.form.get("async")):
+            job = _submit_job("batch", "Batch failed", run)
+            return jsonify({"success": True, "job_id": job.id, "filename": key}), 202
+        return _json_response(run())
     except Exception as e:
-        return _json_error(f"Upload failed: {e}")
+        return _json_error(f"Batch failed: {e}")
 
 @app.route("/process", methods=["POST"])
 def process_file():
@@ -574,7 +3903,10 @@ def process_file():
         phrases_in = data.get("additional_keywords", [])
         require_all = bool(data.get("require_all", False))
 
-        if "original_data" not in processed_data:
+        if not data.get("filename"):
+            return _no_filename()
+        entry = _store.get(str(data["filename"]))
+        if entry is None:
             return jsonify({"success": False, "error": "No file uploaded"})
 
         # Normalize phrases (this is the only source of truth)
@@ -582,65 +3914,191 @@ def process_file():
         for p in phrases_in:
             if isinstance(p, str) and p.strip():
                 phrases.append(p.lower().strip())
+        page_size = _int_arg(data.get("page_size"), DISPLAY_LIMIT, 0, DISPLAY_LIMIT)
+        preview = _truthy(data.get("preview"))  # long cells cut short; the modal fetches /row/<id>
+        dedup = _truthy(data.get("dedup"))  # one row per near-duplicate cluster, with a count
+        try:  # structured prefilters, e.g. {"Date": {"from": "2024-01-01", "to": "2024-03-31"}, "From": "alex@x.com"}
+            filters = _normalize_filters(data.get("filters"))
+            # a query, e.g. '"exit plan" AND (tower OR takeout) NOT draft', replaces the chips and require_all
+            query = _parse_query(data["query"]) if str(data.get("query") or "").strip() else None
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)})
 
-        df: pd.DataFrame = processed_data["original_data"]  # type: ignore
-        matches: list[dict] = []
-
-        if phrases:  # only search when user has active terms
-            for _, row in df.iterrows():
-                full_text = " ".join(str(row.get(c, "")) for c in df.columns).lower()
-                if _matches_by_mode(full_text, phrases, require_all):
-                    rd = {k: _clean_text(v) if pd.notna(v) else "" for k, v in row.to_dict().items()}
-                    rd["_match_reason"] = "Keyword Match (ALL)" if require_all else "Keyword Match"
-                    matches.append(rd)
+        # Optional column targeting: search only these headers, each column on its own
+        columns = data.get("columns")
+        if isinstance(columns, str):  # one header
+            columns = [columns]
+        elif columns is not None and not isinstance(columns, list):
+            return jsonify({"success": False, "error": "columns must be a list of column names"}), 400
+        columns = [str(c) for c in columns or ()] or None
+        batch = entry.get("batch")
+        sheets = data.get("sheets")
+        if isinstance(sheets, str):  # one sheet name
+            sheets = [sheets]
+        elif sheets is not None and not isinstance(sheets, list):
+            return jsonify({"success": False, "error": "sheets must be a list of sheet names"}), 400
+        if sheets:  # other sheets are parsed only now, inside the (possibly background) run
+            base = _store.get(entry["sheet_of"]) if entry.get("sheet_of") else entry
+            names = [s["name"] for s in (base or {}).get("sheets") or ()]
+            unknown = [s for s in sheets if str(s) not in names]
+            if unknown:
+                return jsonify({"success": False, "error": f"Unknown sheet(s): {', '.join(map(str, unknown))}"})
+            picked = sorted({names.index(str(s)) for s in sheets})
+            if len(picked) > 1:  # searched as a batch of sheets, each result row tagged with its sheet
+                sources = [{"name": base["key"], "path": base["current_file"], "digest": base["digest"],
+                            "sheet": k, "sheet_name": names[k]} for k in picked]
+                run = functools.partial(_run_batch, base["key"], base["current_file"], sources, phrases,
+                                        require_all, page_size, columns=columns, preview=preview, dedup=dedup,
+                                        filters=filters, query=query)
+            else:
+                # a synchronous run parses the sheet in this request anyway, so its filters are checked first
+                sheet = _store.get(f"{base['key']}_sheet{picked[0]}") if picked[0] != base.get("sheet", 0) else base
+                if sheet is None and not _truthy(data.get("async")):
+                    sheet = _sheet_entry(base, picked[0])
+                if sheet is not None and filters:
+                    try:
+                        _check_filters(sheet["original_data"], filters)
+                    except ValueError as e:
+                        return jsonify({"success": False, "error": str(e)})
+                run = functools.partial(_run_sheet, base, picked[0], phrases, require_all, page_size, columns=columns,
+                                        preview=preview, dedup=dedup, filters=filters, query=query)
+        elif batch:  # a batch searches its workbooks again, by column name
+            run = functools.partial(_run_batch, batch["key"], entry["current_file"], batch["sources"], phrases,
+                                    require_all, page_size, columns=columns, preview=preview, dedup=dedup,
+                                    filters=filters, query=query)
+        else:
+            scope, unknown = _column_scope(entry, columns)
+            if unknown:
+                return jsonify({"success": False, "error": f"Unknown column(s): {', '.join(map(str, unknown))}"})
+            if filters:
+                try:
+                    _check_filters(entry["original_data"], filters)
+                except ValueError as e:
+                    return jsonify({"success": False, "error": str(e)})
+            run = functools.partial(_run_process, entry, phrases, require_all, page_size, scope=scope, preview=preview,
+                                    dedup=dedup, filters=filters, query=query)
+        if _truthy(data.get("async")):
+            job = _submit_job("process", "Processing failed", run)
+            return jsonify({"success": True, "job_id": job.id}), 202
+        return _json_response(run())
+    except Exception as e:
+        return _json_error(f"Processing failed: {e}")
 
-        processed_data["filtered_data"] = matches
-        processed_data["headers"] = list(df.columns)
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    """State of a background job: rows parsed/scanned, matches so far, ETA, and the result once done."""
+    if not _JOB_ID_RE.match(job_id):
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    state = _job_state(job_id)
+    if state is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    return jsonify({"success": True, **state})
 
-        return jsonify({
+@app.route("/results")
+def results_page():
+    """One page of the stored result: ?filename=&offset=&limit=&q=&sort=<column index>&dir=1|-1&preview=1."""
+    try:
+        if not request.args.get("filename"):
+            return _no_filename()
+        entry = _result_entry()
+        if entry is None:
+            return jsonify({"success": False, "error": "No results yet"})
+        q = (request.args.get("q") or "").strip().lower()
+        sort_col = request.args.get("sort")
+        sort_col = _int_arg(sort_col, -1, -1, 1 << 30) if sort_col not in (None, "") else None
+        descending = request.args.get("dir") == "-1"
+        order = _result_view(entry, q, sort_col, descending)
+        offset = _int_arg(request.args.get("offset"), 0, 0, max(len(order), 0))
+        limit = _int_arg(request.args.get("limit"), 50, 1, DISPLAY_LIMIT)
+        df = entry["original_data"]
+        page = order[offset:offset + limit]
+        _count(rows=len(page))
+        return _json_response({
             "success": True,
             "total_count": int(len(df)),
-            "matching_count": int(len(matches)),
-            "results": matches[:DISPLAY_LIMIT],
+            "matching_count": int(len(entry["filtered_rows"])),
+            "total": int(len(order)),
+            "offset": offset,
+            "limit": limit,
+            "results": _page_records(entry, page, _truthy(request.args.get("preview"))),
             "headers": list(df.columns),
         })
     except Exception as e:
-        return _json_error(f"Processing failed: {e}")
+        return _json_error(f"Loading results failed: {e}")
+
+@app.route("/row/<int:row_id>")
+def result_row(row_id):
+    """One whole row of the stored result, by its upload position (``_row`` of a preview page): ?filename=."""
+    try:
+        if not request.args.get("filename"):
+            return _no_filename()
+        entry = _result_entry()
+        if entry is None:
+            return jsonify({"success": False, "error": "No results yet"})
+        rows = entry["filtered_rows"]  # ascending
+        pos = int(np.searchsorted(rows, row_id))
+        if pos >= len(rows) or rows[pos] != row_id:
+            return jsonify({"success": False, "error": "Row is not in the result"}), 404
+        return _json_response({"success": True, "row": _page_records(entry, np.array([pos]))[0],
+                               "headers": list(entry["original_data"].columns)})
+    except Exception as e:
+        return _json_error(f"Loading the row failed: {e}")
 
 @app.route("/download")
 def download_results():
-    """Return XLSX in-memory."""
+    """XLSX export, written row by row in openpyxl write-only mode to a temporary file."""
     try:
-        if "filtered_data" not in processed_data:
+        if not request.args.get("filename"):
+            return _no_filename()
+        entry = _result_entry()
+        if entry is None:
             return jsonify({"success": False, "error": "No results to download"})
-        rows = [{k: v for k, v in row.items() if k != "_match_reason"} for row in processed_data["filtered_data"]]
-        df = pd.DataFrame(rows)
-        from io import BytesIO
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="results")
-        output.seek(0)
-        out_name = f"EMAILSIM_output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        return send_file(output, as_attachment=True, download_name=out_name)
+        with _stage("export"):
+            output = tempfile.TemporaryFile()  # removed when send_file closes it
+            _write_xlsx(entry, output)
+            _count(rows=len(entry["filtered_rows"]), bytes=output.tell())
+            output.seek(0)
+        return send_file(output, as_attachment=True, download_name=_export_name("xlsx"),
+                         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     except Exception as e:
         return _json_error(f"Download failed: {e}")
 
 @app.route("/download_csv")
 def download_csv():
-    """Optional CSV download."""
+    """CSV export, streamed to the client a chunk of rows at a time."""
     try:
-        if "filtered_data" not in processed_data:
+        if not request.args.get("filename"):
+            return _no_filename()
+        entry = _result_entry()
+        if entry is None:
             return jsonify({"success": False, "error": "No results to download"})
-        rows = [{k: v for k, v in row.items() if k != "_match_reason"} for row in processed_data["filtered_data"]]
-        df = pd.DataFrame(rows)
-        from io import StringIO, BytesIO
-        csv_buf = StringIO(); df.to_csv(csv_buf, index=False)
-        byte_buf = BytesIO(csv_buf.getvalue().encode("utf-8"))
-        out_name = f"EMAILSIM_output_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        return send_file(byte_buf, as_attachment=True, download_name=out_name, mimetype="text/csv")
+        chunks = _csv_chunks(dict(entry))  # pin the current result; a later /process does not change this download
+        rows = len(entry["filtered_rows"])
+
+        def generate():
+            # runs after the response headers went out, so it reports to /metrics on its own
+            timings = _Timings()
+            token = _timings_var.set(timings)
+            try:
+                with _stage("export"):
+                    for data in chunks:
+                        timings.count(bytes=len(data))
+                        yield data
+                timings.count(rows=rows)
+            finally:
+                _timings_var.reset(token)
+                _metrics.record("download_csv_stream", timings)
+
+        return Response(generate(), mimetype="text/csv",
+                        headers={"Content-Disposition": f"attachment; filename={_export_name('csv')}"})
     except Exception as e:
         return _json_error(f"CSV export failed: {e}")
 
+@app.route("/metrics")
+def metrics():
+    """Request, stage, row and byte counters of this worker in the Prometheus text format."""
+    return Response(_metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # ------------------------------
 # Dev server bootstrap
 # ------------------------------
@@ -670,7 +4128,58 @@ def main():
     except KeyboardInterrupt:
         print("\n👋 Application stopped by user")  # noqa: T201
 
+def batch_main(argv=None) -> int:
+    """Headless batch run: ``python email_filter_app.py batch <workbooks, folders, .zip> -o merged.xlsx``."""
+    import argparse
+
+    ap = argparse.ArgumentParser(prog="email_filter_app.py batch",
+                                 description="Search many workbooks at once and write one merged, source-tagged result.")
+    ap.add_argument("inputs", nargs="+", help=".xlsx/.xls workbooks, folders of them, or .zip archives")
+    ap.add_argument("-k", "--keyword", action="append", help="phrase to search for; repeat for more (default: built-in keywords)")
+    ap.add_argument("--all", action="store_true", help="require every phrase (default: any)")
+    ap.add_argument("-q", "--query", help='boolean query instead of -k, e.g. \'"exit plan" AND (tower OR takeout) NOT draft\'')
+    ap.add_argument("--columns", nargs="+", help="search only these headers")
+    ap.add_argument("--all-sheets", action="store_true", help="search every sheet of each workbook (default: the first)")
+    ap.add_argument("-o", "--out", required=True, help="merged result, .xlsx or .csv")
+    args = ap.parse_args(argv)
+
+    phrases = [p.lower().strip() for p in (args.keyword or DEFAULT_KEYWORDS) if p.strip()]
+    try:
+        query = _parse_query(args.query) if args.query else None
+    except ValueError as e:
+        ap.error(str(e))
+    work = tempfile.mkdtemp(prefix="emailsim_batch_")
+    try:
+        sources = _batch_sources([(os.path.basename(p.rstrip("/\\")), p) for p in args.inputs], work, args.all_sheets)
+        if not sources:
+            print("No .xlsx or .xls workbooks found", file=sys.stderr)  # noqa: T201
+            return 1
+
+        def progress(files_done=0, files_total=0, matches=0, **_):
+            print(f"\r{files_done}/{files_total} workbooks, {matches} matches", end="", file=sys.stderr, flush=True)  # noqa: T201
+
+        key = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}_batch"
+        result = _run_batch(key, work, sources, phrases, args.all, 0, progress, args.columns, query=query)
+        print(file=sys.stderr)  # noqa: T201
+        entry = _store.get(result["filename"])
+        with open(args.out, "wb") as fh:
+            if args.out.lower().endswith(".csv"):
+                for block in _csv_chunks(entry):
+                    fh.write(block)
+            else:
+                _write_xlsx(entry, fh)
+        for src in result["sources"]:
+            name = f"{src['name']} [{src['sheet_name']}]" if "sheet_name" in src else src["name"]
+            note = f"  ERROR: {src['error']}" if "error" in src else ""
+            print(f"{name}: {src['rows']} rows, {src['matches']} matches{note}")  # noqa: T201
+        print(f"{result['matching_count']} of {result['total_count']} rows matched -> {args.out}")  # noqa: T201
+        return 0
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["batch"]:
+        sys.exit(batch_main(sys.argv[2:]))
     main()
 
 # expose the Flask app for gunicorn
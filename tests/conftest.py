@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+os.environ.setdefault("EMAILSIM_MATCH_WORKERS", "1")  # scan in-process; the pool is exercised by hand
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import email_filter_app as app_module  # noqa: E402
+
+# cells with punctuation, symbols, runs of whitespace and non-ASCII letters around the phrases
+ROWS = [
+    ["alex@example.com", "sam@example.com", "Re: exit plan", "See the exit-plan for Tower C."],
+    ["riley@example.com", "sam@example.com", "C++ roadmap", "c++ and c# devs; (tower c) moved"],
+    ["casey@example.com", "alex@example.com", "Takeout's schedule", "takeout, exit plan... tower   c"],
+    ["devon@example.com", "riley@example.com", "Naïve café", "the café menu: 100% done"],
+    ["sam@example.com", "casey@example.com", "e-mail thread", "exitplan towerc e-mail a.b.c"],
+    ["alex@example.com", "devon@example.com", "_under_score", "snake_case tower c_ tower_c"],
+    ["riley@example.com", "alex@example.com", "", "EXIT PLAN and TOWER C, all caps"],
+    ["casey@example.com", "sam@example.com", "Fwd: .NET port", "moving to .net; tower c!"],
+]
+HEADERS = ["From", "To", "Subject", "Body"]
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "UPLOAD_FOLDER", str(tmp_path))
+    # searches cached by an earlier test (same sheet content, same query) would skip the scans under test
+    monkeypatch.setattr(app_module, "_results", app_module._ResultCache(
+        app_module.RESULT_CACHE_ENTRIES, app_module.RESULT_CACHE_MB * 1024 * 1024))
+    return app_module
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "mailbox.xlsx"
+    pd.DataFrame(ROWS, columns=HEADERS).to_excel(path, index=False)
+    return path
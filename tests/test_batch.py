@@ -0,0 +1,93 @@
+"""/batch and ``python email_filter_app.py batch``: many workbooks searched into one source-tagged result."""
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+
+from conftest import HEADERS, ROWS
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    """Two workbooks with different headers: the first half of ROWS, and the rest without a "To" column."""
+    first, second = tmp_path / "inbox.xlsx", tmp_path / "sent.xlsx"
+    pd.DataFrame(ROWS[:4], columns=HEADERS).to_excel(first, index=False)
+    pd.DataFrame([[r[0], r[2], r[3]] for r in ROWS[4:]], columns=["From", "Subject", "Body"]).to_excel(second, index=False)
+    return first, second
+
+
+def _zipped(*paths) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for path in paths:
+            zf.write(path, f"mail/{path.name}")
+        zf.writestr("__MACOSX/mail/._sent.xlsx", b"resource fork")
+    buf.seek(0)
+    return buf
+
+
+def test_batch_merges_matched_rows_behind_source_tags(client, workbooks):
+    first, second = workbooks
+    with open(first, "rb") as fh:
+        body = client.post("/batch", data={"files": [(fh, "inbox.xlsx"), (_zipped(second), "more.zip")],
+                                           "additional_keywords": '["tower c"]'}).get_json()
+    assert body["success"], body
+    assert body["headers"] == ["Source File", "Source Row", *HEADERS]
+    assert body["total_count"] == len(ROWS)
+    tagged = [(r["Source File"], r["Source Row"], r["To"]) for r in body["results"]]
+    assert tagged == [("inbox.xlsx", "2", "sam@example.com"), ("inbox.xlsx", "3", "sam@example.com"),
+                      ("inbox.xlsx", "4", "alex@example.com"),
+                      ("more.zip/mail/sent.xlsx", "4", ""), ("more.zip/mail/sent.xlsx", "5", "")]
+    assert [(s["name"], s["rows"], s["matches"]) for s in body["sources"]] == [
+        ("inbox.xlsx", 4, 3), ("more.zip/mail/sent.xlsx", 4, 2)]
+
+    csv = pd.read_csv(io.BytesIO(client.get(f"/download_csv?filename={body['filename']}").data),
+                      dtype=str, keep_default_na=False)
+    assert csv["Source Row"].tolist() == ["2", "3", "4", "4", "5"]
+
+
+def test_a_parsed_batch_is_searched_again_through_process(client, workbooks):
+    first, second = workbooks
+    with open(first, "rb") as a, open(second, "rb") as b:
+        parsed = client.post("/batch", data={"files": [(a, "inbox.xlsx"), (b, "sent.xlsx")]}).get_json()
+    assert parsed["success"] and parsed["rows"] == len(ROWS) and parsed["workbooks"] == 2
+    body = client.post("/process", json={"filename": parsed["filename"], "query": '"exit plan" NOT takeout'}).get_json()
+    assert body["success"], body
+    assert [(r["Source File"], r["Source Row"]) for r in body["results"]] == [("inbox.xlsx", "2"), ("sent.xlsx", "4")]
+
+
+def test_all_sheets_tags_rows_with_their_sheet(client, tmp_path):
+    path = tmp_path / "two_sheets.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame(ROWS[:4], columns=HEADERS).to_excel(writer, sheet_name="Inbox", index=False)
+        pd.DataFrame(ROWS[4:], columns=HEADERS).to_excel(writer, sheet_name="Sent", index=False)
+    with open(path, "rb") as fh:
+        body = client.post("/batch", data={"files": [(fh, "two_sheets.xlsx")], "all_sheets": "1",
+                                           "additional_keywords": '["exit plan"]'}).get_json()
+    assert body["headers"][:2] == ["Sheet", "Source Row"]
+    assert [(r["Sheet"], r["Source Row"]) for r in body["results"]] == [("Inbox", "2"), ("Inbox", "4"), ("Sent", "4")]
+
+
+def test_batch_rejects_other_file_types(client):
+    body = client.post("/batch", data={"files": [(io.BytesIO(b"x"), "notes.txt")]}).get_json()
+    assert body == {"success": False, "error": "Invalid file type: notes.txt"}
+
+
+@pytest.mark.parametrize("out", ["merged.csv", "merged.xlsx"])
+def test_batch_main_writes_the_merged_result(app, workbooks, tmp_path, capsys, out):
+    folder = tmp_path / "mail"
+    folder.mkdir()
+    for path in workbooks:
+        path.rename(folder / path.name)
+    (folder / "broken.xlsx").write_bytes(b"PK\x03\x04 not a workbook")
+
+    assert app.batch_main([str(folder), "-k", "tower c", "-o", str(tmp_path / out)]) == 0
+    read = pd.read_csv if out.endswith(".csv") else pd.read_excel
+    merged = read(tmp_path / out, dtype=str, keep_default_na=False)
+    assert merged.columns.tolist() == ["Source File", "Source Row", *HEADERS]
+    assert list(zip(merged["Source File"], merged["Source Row"])) == [
+        ("inbox.xlsx", "2"), ("inbox.xlsx", "3"), ("inbox.xlsx", "4"), ("sent.xlsx", "4"), ("sent.xlsx", "5")]
+    printed = capsys.readouterr().out
+    assert "broken.xlsx: 0 rows, 0 matches  ERROR:" in printed
+    assert f"5 of {len(ROWS)} rows matched" in printed
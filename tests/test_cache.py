@@ -0,0 +1,78 @@
+"""The result cache: repeated searches come from memory or disk, and new content is never answered from it."""
+import numpy as np
+import pandas as pd
+
+from conftest import HEADERS, ROWS
+from test_routes import _upload
+
+
+def _search(client, filename, phrases, **extra):
+    body = client.post("/process", json={"filename": filename, "additional_keywords": phrases, **extra}).get_json()
+    assert body["success"], body
+    return body
+
+
+def _fresh_results(app, monkeypatch):
+    """An empty in-memory tier, as another worker (or this one after a restart) has."""
+    monkeypatch.setattr(app, "_results", app._ResultCache(app.RESULT_CACHE_ENTRIES, app.RESULT_CACHE_MB * 1024 * 1024))
+
+
+def test_a_repeated_search_comes_from_memory(app, client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    first = _search(client, filename, ["tower c", "exit plan"])
+    again = _search(client, filename, ["exit plan", "tower c", "exit plan"])
+    assert first["cached"] is None and again["cached"] == "memory"
+    assert [r["_row"] for r in again["results"]] == [r["_row"] for r in first["results"]]
+    assert again["phrase_counts"] == first["phrase_counts"]
+    assert _search(client, filename, ["tower c", "exit plan"], require_all=True)["cached"] is None
+    assert _search(client, filename, ["tower c", "exit plan"], columns=["Body"])["cached"] is None
+    assert app._results.hits["memory"] == 1 and app._results.misses == 3
+
+
+def test_another_worker_finds_the_result_on_disk(app, client, workbook, tmp_path, monkeypatch):
+    filename = _upload(client, workbook)["filename"]
+    first = _search(client, filename, ["tower c"])
+    assert len(list((tmp_path / "emailsim_results").glob("*.npz"))) == 1
+
+    _fresh_results(app, monkeypatch)
+    from_disk = _search(client, filename, ["tower c"])
+    assert from_disk["cached"] == "disk"
+    assert [r["_row"] for r in from_disk["results"]] == [r["_row"] for r in first["results"]]
+    assert from_disk["results"][0]["_matched_phrases"] == ["tower c"]
+    assert _search(client, filename, ["tower c"])["cached"] == "memory"
+
+
+def test_results_are_keyed_by_content_not_by_upload(client, workbook):
+    first = _upload(client, workbook)["filename"]
+    _search(client, first, ["exit plan"])
+    same = _upload(client, workbook)["filename"]
+    assert same != first
+    assert _search(client, same, ["exit plan"])["cached"] == "memory"
+
+    changed = [row[:3] + ["the exit plan moved"] if i == 3 else row for i, row in enumerate(ROWS)]
+    pd.DataFrame(changed, columns=HEADERS).to_excel(workbook, index=False)
+    edited = _search(client, _upload(client, workbook)["filename"], ["exit plan"])
+    assert edited["cached"] is None
+    assert [r["_row"] for r in edited["results"]] == [0, 2, 3, 6]
+    assert edited["phrase_counts"] == [{"phrase": "exit plan", "hits": 4, "rows": 4}]
+
+
+def test_memory_only_when_disk_is_off(app, client, workbook, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "RESULT_CACHE_DISK_MB", 0)
+    filename = _upload(client, workbook)["filename"]
+    _search(client, filename, ["tower c"])
+    assert not (tmp_path / "emailsim_results").exists()
+    _fresh_results(app, monkeypatch)
+    assert _search(client, filename, ["tower c"])["cached"] is None
+
+
+def test_least_recently_used_entries_leave_memory_first(app, monkeypatch):
+    monkeypatch.setattr(app, "RESULT_CACHE_DISK_MB", 0)
+    cache = app._ResultCache(2, 1 << 20)
+    outcome = {"rows": np.arange(3), "hits": np.zeros((3, 1), dtype=np.uint8), "counts": np.zeros((1, 2), dtype=np.int64)}
+    for key in ("a", "b"):
+        cache.put(key, outcome)
+    assert cache.get("a")[1] == "memory"  # "b" is now the oldest
+    cache.put("c", outcome)
+    assert [cache.get(k)[1] for k in ("a", "b", "c")] == ["memory", "", "memory"]
+    assert cache.usage() == (2, 2 * sum(a.nbytes for a in outcome.values()))
@@ -0,0 +1,15 @@
+"""Column-wide cleaning gives exactly the per-cell _clean_text output."""
+import pandas as pd
+import pytest
+
+CELLS = [
+    "Hi_x000D__x000A_there", "  a  &amp;  b  ", "x _ y", "_  _", "tab\there", "&lt;b&gt;bold&lt;/b&gt;",
+    "&nbsp;&nbsp;", "*x000D*line*x000A*", "", None, 3.5, 7, True, "nul\x00inside", "café _x000D_ naïve",
+]
+
+
+@pytest.mark.parametrize("slice_chars", [1, 16, 100_000])
+def test_clean_series_matches_clean_text(app, monkeypatch, slice_chars):
+    monkeypatch.setattr(app, "CLEAN_SLICE_CHARS", slice_chars)
+    col = pd.Series(CELLS * 3, dtype=object)
+    assert app._clean_series(col).tolist() == col.apply(app._clean_text).tolist()
@@ -0,0 +1,60 @@
+"""Near-duplicate collapsing: MinHash clusters, ``_duplicates`` counts and the "Duplicates" export column."""
+import io
+
+import pandas as pd
+import pytest
+
+from test_routes import _upload
+
+THREAD = ("Team, the exit plan for tower c is final: movers arrive Monday at nine, badges are returned "
+          "at the front desk, and the last shipment leaves from loading dock two on Friday afternoon.")
+MAILS = [
+    ["alex@example.com", "sam@example.com", "Exit plan", THREAD],
+    ["sam@example.com", "alex@example.com", "RE: Exit plan", THREAD + " Thanks!"],
+    ["riley@example.com", "casey@example.com", "Budget", "Our exit plan budget is approved; the forecast is due."],
+    ["alex@example.com", "devon@example.com", "Exit plan", THREAD],
+    ["casey@example.com", "riley@example.com", "Lunch", "Tacos at noon?"],
+    ["devon@example.com", "sam@example.com", "Empty", ""],
+    ["devon@example.com", "sam@example.com", "Empty", ""],
+]
+
+
+@pytest.fixture
+def thread(tmp_path):
+    path = tmp_path / "thread.xlsx"
+    pd.DataFrame(MAILS, columns=["From", "To", "Subject", "Body"]).to_excel(path, index=False)
+    return path
+
+
+def test_clusters_join_copies_and_replies_only(app):
+    texts = pd.Series([m[3].lower() for m in MAILS], dtype=object)
+    labels = app._near_duplicate_clusters(app._minhash_signatures(texts, chunk_rows=3))
+    assert labels.tolist() == [0, 0, 2, 0, 4, 5, 6]  # rows without words stay on their own
+
+
+def test_dedup_text_takes_the_body_columns(app):
+    df = pd.DataFrame(MAILS[:2], columns=["From", "To", "Subject", "Message body"])
+    assert app._dedup_text(df).tolist() == [THREAD.lower(), (THREAD + " Thanks!").lower()]
+
+
+def test_process_collapses_matched_duplicates(client, thread):
+    filename = _upload(client, thread)["filename"]
+    search = {"filename": filename, "additional_keywords": ["exit plan"]}
+    plain = client.post("/process", json=search).get_json()
+    assert [r["_row"] for r in plain["results"]] == [0, 1, 2, 3]
+    assert plain["duplicates_collapsed"] == 0 and "_duplicates" not in plain["results"][0]
+
+    body = client.post("/process", json={**search, "dedup": True}).get_json()
+    assert body["success"], body
+    assert [(r["_row"], r["_duplicates"]) for r in body["results"]] == [(0, 3), (2, 1)]
+    assert body["matching_count"] == 2 and body["duplicates_collapsed"] == 2
+
+    csv = pd.read_csv(io.BytesIO(client.get(f"/download_csv?filename={filename}").data), dtype=str)
+    assert csv["Duplicates"].tolist() == ["3", "1"]
+
+
+def test_clusters_worked_out_at_upload_are_kept_beside_the_cache(app, client, thread, tmp_path):
+    filename = _upload(client, thread, dedup="1")["filename"]
+    entry = app._store.get(filename)
+    assert entry["clusters"].tolist() == [0, 0, 2, 0, 4, 5, 6]
+    assert (tmp_path / "emailsim_cache" / app._sheet_digest(entry["digest"], 0) / "clusters.npy").is_file()
@@ -0,0 +1,85 @@
+"""Upload formats: CSV/TSV exports in their usual encodings, and files whose extension does not match their content."""
+import io
+import logging
+
+import pandas as pd
+import pytest
+
+from conftest import HEADERS, ROWS
+from test_routes import _upload
+
+
+def _export(tmp_path, name, sep=",", encoding="utf-8"):
+    path = tmp_path / name
+    pd.DataFrame(ROWS, columns=HEADERS).to_csv(path, sep=sep, index=False, encoding=encoding)
+    return path
+
+
+def _rows_with(client, filename, phrase):
+    body = client.post("/process", json={"filename": filename, "additional_keywords": [phrase]}).get_json()
+    assert body["success"], body
+    return [r["_row"] for r in body["results"]]
+
+
+@pytest.mark.parametrize("name,sep,encoding", [
+    ("mail.csv", ",", "utf-8"),
+    ("mail.csv", ";", "utf-8-sig"),
+    ("mail.txt.csv", "|", "cp1252"),
+    ("mail.tsv", "\t", "utf-16"),  # Excel's "Unicode Text"
+])
+def test_delimited_exports_read_like_the_workbook(client, workbook, tmp_path, name, sep, encoding):
+    reference = _upload(client, workbook)["filename"]
+    body = _upload(client, _export(tmp_path, name, sep, encoding))
+    assert body["rows"] == len(ROWS) and body["headers"] == HEADERS
+    for phrase in ("café", "naïve café", "tower c", "takeout's"):
+        assert _rows_with(client, body["filename"], phrase) == _rows_with(client, reference, phrase), phrase
+
+
+def test_cells_stay_as_typed(app, client, tmp_path):
+    path = tmp_path / "ids.csv"
+    path.write_text("Id,Zip,Note\n007,02134,\n8,n/a,  two   spaces \n", encoding="utf-8")
+    filename = _upload(client, path)["filename"]
+    df = app._store.get(filename)["original_data"]
+    assert df.to_dict("list") == {"Id": ["007", "8"], "Zip": ["02134", "n/a"], "Note": ["", "two spaces"]}
+
+
+@pytest.mark.parametrize("real,named", [("xlsx", "mailbox.csv"), ("csv", "mailbox.xlsx")])
+def test_content_decides_the_format(client, workbook, tmp_path, caplog, real, named):
+    path = workbook if real == "xlsx" else _export(tmp_path, "mailbox.csv")
+    with open(path, "rb") as fh, caplog.at_level(logging.WARNING):
+        body = client.post("/upload", data={"file": (fh, named)}).get_json()
+    assert body["success"] and body["rows"] == len(ROWS) and body["headers"] == HEADERS
+    assert f"holds {real}; reading it as {real}" in caplog.text
+
+
+@pytest.mark.parametrize("data", [b"", b"   \n", b"\x00\x01\x02binary\x00", b"PK\x03\x04 truncated"])
+def test_other_content_is_rejected(client, data):
+    body = client.post("/upload", data={"file": (io.BytesIO(data), "mail.csv")}).get_json()
+    assert body == {"success": False, "error": "Not an Excel workbook or a CSV/TSV export"}
+
+
+@pytest.mark.parametrize("head,encoding", [
+    (b"\xef\xbb\xbfFrom,To", "utf-8-sig"),
+    (b"\xff\xfeF\x00", "utf-16"),
+    ("From,Body\ncafé".encode("utf-8"), "utf-8"),
+    ("From,Body\ncafé".encode("cp1252"), "cp1252"),  # a short export ending in a non-ASCII letter
+    ("From,Body\ncafé €".encode("cp1252"), "cp1252"),
+    (b"From,Body\ncaf\xe9 \x81", "latin-1"),  # a byte cp1252 leaves undefined
+    (b"From\x00Body", None),
+])
+def test_text_encoding_is_sniffed(app, head, encoding):
+    assert app._text_encoding(head) == encoding
+
+
+@pytest.mark.parametrize("cut", ["é".encode("utf-8")[:1], "€".encode("utf-8")[:2]])
+def test_a_character_cut_off_by_the_sniff_window_is_still_utf8(app, cut):
+    head = b"From,Body\n" + b"x" * app._SNIFF_BYTES
+    assert app._text_encoding(head[:app._SNIFF_BYTES - len(cut)] + cut) == "utf-8"
+    assert app._text_encoding(head[:100] + cut) == "cp1252"  # the whole file: not cut off, so not UTF-8
+
+
+def test_short_cp1252_export_uploads(client, tmp_path):
+    path = tmp_path / "mail.csv"
+    path.write_bytes("From,Body\nalex@example.com,menu at the café".encode("cp1252"))
+    filename = _upload(client, path)["filename"]
+    assert _rows_with(client, filename, "café") == [0]
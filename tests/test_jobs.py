@@ -0,0 +1,70 @@
+"""Background jobs: async=1 answers 202 with a job id, and /jobs/<id> reports progress, the result or the error."""
+import io
+import time
+import zipfile
+
+from conftest import ROWS
+from test_routes import _upload
+
+
+def _wait(client, job_id, timeout=30.0):
+    """Poll /jobs/<id> until the job is done or failed."""
+    deadline = time.time() + timeout
+    while True:
+        state = client.get(f"/jobs/{job_id}").get_json()
+        assert state["success"], state
+        if state["state"] in ("done", "error") or time.time() > deadline:
+            return state
+        time.sleep(0.02)
+
+
+def test_async_upload_and_process_finish_as_jobs(client, workbook):
+    with open(workbook, "rb") as fh:
+        response = client.post("/upload", data={"file": (fh, "mailbox.xlsx"), "async": "1"})
+    assert response.status_code == 202
+    queued = response.get_json()
+    state = _wait(client, queued["job_id"])
+    assert state["state"] == "done" and state["kind"] == "upload"
+    assert state["result"]["filename"] == queued["filename"] and state["result"]["rows"] == len(ROWS)
+    assert state["rows_parsed"] == len(ROWS) and state["finished"] >= state["started"]
+
+    search = {"filename": queued["filename"], "additional_keywords": ["exit plan"]}
+    response = client.post("/process", json={**search, "async": True})
+    assert response.status_code == 202
+    state = _wait(client, response.get_json()["job_id"])
+    assert state["state"] == "done" and state["eta_seconds"] == 0.0
+    assert state["rows_scanned"] == len(ROWS) and state["matches"] == state["result"]["matching_count"]
+    direct = client.post("/process", json=search).get_json()
+    assert [r["_row"] for r in state["result"]["results"]] == [r["_row"] for r in direct["results"]]
+
+
+def test_a_failing_job_reports_its_error(client):
+    broken = io.BytesIO()
+    with zipfile.ZipFile(broken, "w") as zf:  # passes the upload's format check, fails to parse in the job
+        zf.writestr("xl/workbook.xml", "not really a workbook")
+    broken.seek(0)
+    response = client.post("/upload", data={"file": (broken, "broken.xlsx"), "async": "1"})
+    assert response.status_code == 202
+    state = _wait(client, response.get_json()["job_id"])
+    assert state["state"] == "error"
+    assert state["error"].startswith("Upload failed: ")
+    assert "result" not in state
+
+
+def test_unknown_jobs_are_404(client):
+    for job_id in ("0" * 32, "not-a-job", "A" * 32, ".." + "0" * 30):
+        response = client.get(f"/jobs/{job_id}")
+        assert response.status_code == 404, job_id
+        assert response.get_json() == {"success": False, "error": "Unknown job"}
+
+
+def test_another_worker_reads_the_shared_job_record(app, client, workbook, monkeypatch):
+    filename = _upload(client, workbook)["filename"]
+    response = client.post("/process", json={"filename": filename, "additional_keywords": ["tower c"], "async": 1})
+    job_id = response.get_json()["job_id"]
+    done = _wait(client, job_id)
+
+    monkeypatch.setattr(app, "_jobs", {})  # this worker never ran the job
+    state = client.get(f"/jobs/{job_id}").get_json()
+    assert state["state"] == "done"
+    assert state["result"]["matching_count"] == done["result"]["matching_count"]
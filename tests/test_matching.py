@@ -0,0 +1,86 @@
+"""The phrase scanners against the original per-row regex test (``\\bphrase\\b``, ANY/ALL)."""
+import itertools
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROWS
+
+PHRASES = [
+    "exit plan", "tower c", "c++", "c#", "e-mail", "tower  c", "tower   c", "100%", "(tower c)", "a.b",
+    "café", "naïve café", "_under", ".net", "exit plan...", "takeout's", "tower_c", "c", "exit", "plan.",
+    "see the", "all caps", "c_", "",
+]
+TEXTS = [" ".join(row).lower() for row in ROWS] + [
+    "", "c", "c c c", "tower c tower c", "a.b.c.d", "x(tower c)y", "exit plan.", "exit  plan", "c++c++", "-c-",
+]
+
+
+def _phrase_in_text(text: str, phrase: str) -> bool:
+    """The original test: an exact phrase (word-boundaries) is in the text."""
+    if not text:
+        return False
+    return re.search(r"\b" + re.escape(phrase) + r"\b", text.lower()) is not None
+
+
+def _matches_by_mode(full_text: str, phrases: list[str], require_all: bool) -> bool:
+    """The original ANY vs ALL mode."""
+    phrases = [p for p in phrases if isinstance(p, str) and p.strip()]
+    if not phrases:
+        return False
+    return all(_phrase_in_text(full_text, p) for p in phrases) if require_all \
+        else any(_phrase_in_text(full_text, p) for p in phrases)
+
+
+def _scan(app, phrases: tuple[str, ...], automaton: bool) -> np.ndarray:
+    """Occurrences of the phrases in TEXTS, through the regex scanner or (padded to its size) the automaton."""
+    if automaton:
+        phrases += tuple(f"zzfiller{i}" for i in range(app.AUTOMATON_MIN_PHRASES))
+    occ = app._phrase_occurrences(pd.Series(TEXTS, dtype=object), phrases)
+    return occ[occ[:, 1] < len(phrases) - (app.AUTOMATON_MIN_PHRASES if automaton else 0)]
+
+
+@pytest.mark.parametrize("automaton", [False, True], ids=["regex", "automaton"])
+def test_each_phrase_matches_like_word_bounded_regex(app, automaton):
+    phrases = tuple(sorted({p for p in PHRASES if p.strip()}))
+    masks = app._occurrence_masks(_scan(app, phrases, automaton), len(TEXTS), len(phrases))
+    for j, phrase in enumerate(phrases):
+        expected = [_phrase_in_text(t, phrase) for t in TEXTS]
+        assert masks[:, j].tolist() == expected, phrase
+
+
+@pytest.mark.parametrize("automaton", [False, True], ids=["regex", "automaton"])
+def test_occurrences_are_every_regex_match(app, automaton):
+    phrases = tuple(sorted({p for p in PHRASES if p.strip()}))
+    occ = _scan(app, phrases, automaton)
+    for j, phrase in enumerate(phrases):
+        pattern = re.compile(r"(?=\b" + re.escape(phrase) + r"\b)")
+        expected = [(i, m.start()) for i, t in enumerate(TEXTS) for m in pattern.finditer(t)]
+        got = sorted((int(i), int(start)) for i, k, start in occ if k == j)
+        assert got == expected, phrase
+
+
+@pytest.mark.parametrize("automaton", [False, True], ids=["regex", "automaton"])
+@pytest.mark.parametrize("require_all", [False, True], ids=["any", "all"])
+def test_any_all_modes_match_original(app, automaton, require_all):
+    for size in (1, 2, 3):
+        for chosen in itertools.combinations(PHRASES[:12], size):
+            phrases = tuple(sorted(set(p for p in chosen if p.strip())))
+            if not phrases:
+                continue
+            masks = app._occurrence_masks(_scan(app, phrases, automaton), len(TEXTS), len(phrases))
+            got = masks.all(axis=1) if require_all else masks.any(axis=1)
+            expected = [_matches_by_mode(t, list(chosen), require_all) for t in TEXTS]
+            assert got.tolist() == expected, chosen
+
+
+def test_occurrences_split_by_phrase_keep_row_order(app):
+    phrases = ("c", "tower c", "exit plan")
+    occ = app._phrase_occurrences(pd.Series(TEXTS, dtype=object), phrases)
+    parts = app._occurrences_by_phrase(np.insert(occ, 2, -1, axis=1), len(phrases))
+    assert len(parts) == len(phrases)
+    for j, part in enumerate(parts):
+        mine = occ[occ[:, 1] == j]
+        assert part.tolist() == np.column_stack([mine[:, 0], np.full(len(mine), -1), mine[:, 2]]).tolist()
@@ -0,0 +1,100 @@
+"""Stage timings: the Server-Timing header, /metrics in the Prometheus text format, and opt-in profiles."""
+import re
+import time
+
+import pytest
+
+from conftest import ROWS
+from test_jobs import _wait
+from test_routes import _upload
+
+
+@pytest.fixture
+def metrics(app, monkeypatch):
+    """Empty process-wide metrics for the test."""
+    monkeypatch.setattr(app, "_metrics", app._Metrics())
+    return app._metrics
+
+
+def _server_timing(response) -> dict:
+    """``{name: dur}`` and ``{name: desc}`` entries of a Server-Timing header."""
+    out = {}
+    for part in response.headers["Server-Timing"].split(", "):
+        name, _, value = part.partition(";")
+        out[name] = float(value[4:]) if value.startswith("dur=") else value[len('desc="'):-1]
+    return out
+
+
+def test_server_timing_reports_stages_and_counts(client, workbook, metrics):
+    with open(workbook, "rb") as fh:
+        upload = client.post("/upload", data={"file": (fh, "mailbox.xlsx")})
+    timing = _server_timing(upload)
+    assert {"save", "digest", "parse", "total"} <= timing.keys()
+    assert timing["rows"] == str(len(ROWS)) and int(timing["bytes"]) > 0
+    assert sum(v for k, v in timing.items() if k not in ("total", "rows", "bytes")) <= timing["total"] + 0.5
+
+    processed = client.post("/process", json={"filename": upload.get_json()["filename"],
+                                              "additional_keywords": ["exit plan"]})
+    timing = _server_timing(processed)
+    assert {"match", "serialize", "total"} <= timing.keys()
+    assert timing["matches"] == str(processed.get_json()["matching_count"])
+
+
+def test_nested_stages_are_timed_exclusively(app):
+    timings = app._Timings()
+    with timings.stage("outer"):
+        time.sleep(0.02)
+        with timings.stage("inner"):
+            time.sleep(0.1)
+    assert timings.stages["inner"] >= 0.1
+    assert 0.02 <= timings.stages["outer"] < timings.stages["inner"]
+
+
+def test_metrics_render_requests_stages_and_caches(client, workbook, metrics):
+    filename = _upload(client, workbook)["filename"]
+    search = {"filename": filename, "additional_keywords": ["exit plan"]}
+    client.post("/process", json=search)
+    client.post("/process", json=search)
+    client.get("/results?filename=nope")
+    client.get("/metrics")
+
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert 'emailsim_requests_total{endpoint="process_file",status="200"} 2' in text
+    assert 'emailsim_requests_total{endpoint="upload_file",status="200"} 1' in text
+    assert 'endpoint="metrics"' not in text
+    assert 'emailsim_request_duration_seconds_count{endpoint="process_file"} 2' in text
+    assert 'emailsim_request_duration_seconds_bucket{endpoint="process_file",le="+Inf"} 2' in text
+    assert re.search(r'emailsim_stage_duration_seconds_count\{endpoint="upload_file",stage="parse"\} 1\b', text)
+    assert f'emailsim_rows_total{{endpoint="upload_file"}} {len(ROWS)}' in text
+    assert 'emailsim_result_cache_hits_total{tier="memory"} 1' in text
+    assert "emailsim_result_cache_misses_total 1" in text
+    assert "emailsim_store_entries " in text
+    for line in text.splitlines():  # every sample is `name{labels} value`
+        assert line.startswith("# ") or re.fullmatch(r'[a-z_]+(\{[^}]*\})? [0-9.e+-]+', line), line
+
+
+def test_jobs_report_their_timings(client, workbook, metrics):
+    filename = _upload(client, workbook)["filename"]
+    job_id = client.post("/process", json={"filename": filename, "additional_keywords": ["c"],
+                                           "async": True}).get_json()["job_id"]
+    state = _wait(client, job_id)
+    assert "match" in state["timings"]["stages_ms"] and state["timings"]["total_ms"] > 0
+    text = client.get("/metrics").get_data(as_text=True)
+    assert re.search(r'emailsim_stage_duration_seconds_count\{endpoint="job_process",stage="match"\} 1\b', text)
+    assert 'emailsim_requests_total{endpoint="job_process"' not in text  # a job is not a request
+
+
+def test_profiles_only_when_enabled_and_asked_for(app, client, workbook, monkeypatch, tmp_path):
+    assert "X-Profile-File" not in client.get("/metrics?profile=1").headers
+    monkeypatch.setitem(app.app.config, "PROFILING", True)
+    assert "X-Profile-File" not in client.get("/metrics").headers
+    with open(workbook, "rb") as fh:
+        response = client.post("/upload?profile=1", data={"file": (fh, "mailbox.xlsx")})
+    path = response.headers["X-Profile-File"]
+    assert path.startswith(str(tmp_path / "emailsim_profiles")) and path.endswith(".folded")
+
+
+def test_label_values_are_escaped(app):
+    assert app._prom_escape('a"b\\c\nd') == r'a\"b\\c\nd'
@@ -0,0 +1,49 @@
+"""Matching spread over the process pool gives the serial result."""
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    """Two match processes, used from 40 rows up; shut down afterwards."""
+    monkeypatch.setattr(app, "MATCH_WORKERS", 2)
+    monkeypatch.setattr(app, "PARALLEL_MIN_ROWS", 40)
+    monkeypatch.setattr(app, "_match_pool_instance", None)
+    yield app
+    if app._match_pool_instance is not None:
+        app._match_pool_instance.shutdown()
+
+
+def test_pool_starts_on_the_first_large_scan_only(pool, caplog):
+    small = pd.Series(["exit plan"] * 10, dtype=object)
+    pool._scan_occurrences(small, ("exit plan",))
+    assert pool._match_pool_instance is None
+
+    texts = pd.Series([f"row {i}: exit plan, tower c" if i % 3 else "nothing here" for i in range(400)], dtype=object)
+    got = pool._scan_occurrences(texts, ("exit plan", "tower c"))
+    assert pool._match_pool_instance is not None
+    assert pool._match_pool_instance._mp_context.get_start_method() in ("forkserver", "spawn")
+    assert np.array_equal(got, pool._serial_scan(texts, ("exit plan", "tower c")))
+    assert "parallel matching failed" not in caplog.text
+
+
+def test_parallel_scan_reports_progress_and_keeps_row_order(pool):
+    texts = pd.Series([f"café {i} tower c tower c" for i in range(200)], dtype=object)
+    seen = []
+    got = pool._parallel_scan(texts, ("tower c", "café"), 2, lambda **kw: seen.append(kw))
+    assert np.array_equal(got, pool._serial_scan(texts, ("tower c", "café")))
+    assert seen[-1] == {"rows_scanned": 200, "matches": 200}
+    assert [s["rows_scanned"] for s in seen] == sorted(s["rows_scanned"] for s in seen)
+
+
+def test_large_process_through_the_pool_matches_serial(pool, client, tmp_path, caplog):
+    rows = [[f"user{i}@example.com", f"exit plan {i}" if i % 4 == 0 else f"note {i}"] for i in range(120)]
+    path = tmp_path / "big.xlsx"
+    pd.DataFrame(rows, columns=["From", "Body"]).to_excel(path, index=False)
+    with open(path, "rb") as fh:
+        filename = client.post("/upload", data={"file": (fh, "big.xlsx")}).get_json()["filename"]
+    body = client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"],
+                                         "page_size": 500}).get_json()
+    assert pool._match_pool_instance is not None and "parallel matching failed" not in caplog.text
+    assert [r["_row"] for r in body["results"]] == list(range(0, 120, 4))
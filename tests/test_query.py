@@ -0,0 +1,72 @@
+"""The /process query language: parsing, NEAR/n, NOT, and the order terms are scanned in."""
+import pytest
+
+from test_routes import _upload
+
+
+def _query(client, filename, query, **extra):
+    return client.post("/process", json={"filename": filename, "query": query, **extra}).get_json()
+
+
+def test_parse_query_builds_the_plan(app):
+    assert app._parse_query('"Exit  Plan" tower NOT draft OR x') == (
+        "or", [("and", [("term", "exit plan"), ("term", "tower"), ("not", ("term", "draft"))]), ("term", "x")])
+    assert app._parse_query("budget NEAR/5 forecast") == ("near", "budget", "forecast", 5)
+    assert app._parse_query("a NEAR b") == ("near", "a", "b", app.NEAR_DEFAULT_WORDS)
+    assert app._query_text(app._parse_query("a AND (b OR c)")) == '("a" AND ("b" OR "c"))'
+
+
+@pytest.mark.parametrize("query,error", [
+    ("a OR", "Expected a word or quoted phrase in query, found the end"),
+    ('"exit plan', "Unclosed quote in query"),
+    ("(tower", "Expected ')' in query"),
+    ("NOT", "Expected a word or quoted phrase in query, found the end"),
+    ('""', "Empty quoted phrase in query"),
+    ("x NEAR (y OR z)", "NEAR joins two words or quoted phrases"),
+    ("a b )", "Unexpected ')' in query"),
+])
+def test_bad_queries_are_reported(app, client, workbook, query, error):
+    with pytest.raises(ValueError, match=error.replace("(", r"\(").replace(")", r"\)")):
+        app._parse_query(query)
+    filename = _upload(client, workbook)["filename"]
+    assert _query(client, filename, query) == {"success": False, "error": error}
+
+
+def test_too_many_terms_are_rejected(app):
+    with pytest.raises(ValueError, match="at most"):
+        app._parse_query(" OR ".join(f"w{i}" for i in range(app.QUERY_MAX_TERMS + 1)))
+
+
+@pytest.mark.parametrize("query,rows", [
+    ('exit NEAR/2 "tower c"', [0, 2, 6]),
+    ("exit NEAR/0 plan", [0, 2, 6]),
+    ("exit NEAR/1 tower", [2]),
+    ("tower NEAR/1 exit", [2]),
+    ("c NEAR/0 c", []),
+])
+def test_near_counts_the_words_between(client, workbook, query, rows):
+    filename = _upload(client, workbook)["filename"]
+    body = _query(client, filename, query)
+    assert body["success"], body
+    assert [r["_row"] for r in body["results"]] == rows
+
+
+def test_not_takes_rows_away(client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    assert [r["_row"] for r in _query(client, filename, '"exit plan" NOT takeout')["results"]] == [0, 6]
+    assert [r["_row"] for r in _query(client, filename, 'NOT "tower c"')["results"]] == [3, 4, 5]
+
+
+@pytest.mark.parametrize("build_index", ["0", "1"], ids=["scan", "indexed"])
+def test_query_plan_scans_narrow_terms_first_and_nots_last(client, workbook, build_index):
+    filename = _upload(client, workbook, build_index=build_index)["filename"]
+    body = _query(client, filename, 'NOT takeout c "exit plan"')
+    assert [r["_row"] for r in body["results"]] == [0, 6]
+    assert body["query"] == '(NOT "takeout" AND "c" AND "exit plan")'
+    plan = body["query_plan"]
+    assert [s["term"] for s in plan] == ["exit plan", "c", "takeout"]
+    assert [s["rows_in"] for s in plan] == [8, 3, 3]
+    assert [s["rows_out"] for s in plan] == [3, 3, 1]
+
+    either = _query(client, filename, 'café OR "tower c"')["query_plan"]
+    assert [s["rows_in"] for s in either] == [8, 8 - either[0]["rows_out"]]
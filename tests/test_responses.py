@@ -0,0 +1,77 @@
+"""Response size: preview pages with /row/<id> for the whole row, and gzip/brotli by Accept-Encoding."""
+import gzip
+import importlib.util
+import json
+
+import pandas as pd
+import pytest
+
+from conftest import HEADERS, ROWS
+from test_routes import _upload
+
+LONG_BODY = "filler " * 80 + "exit plan at the very end"
+
+
+@pytest.fixture
+def long_mail(tmp_path):
+    path = tmp_path / "long.xlsx"
+    pd.DataFrame([ROWS[0][:3] + [LONG_BODY]] + ROWS[1:], columns=HEADERS).to_excel(path, index=False)
+    return path
+
+
+def test_preview_cuts_long_cells_and_row_sends_them_whole(app, client, long_mail):
+    filename = _upload(client, long_mail)["filename"]
+    body = client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"],
+                                         "preview": True}).get_json()
+    first = body["results"][0]
+    assert first["_row"] == 0 and first["_truncated"] == [3]
+    assert first["Body"] == LONG_BODY[:app.PREVIEW_CHARS] + "…"
+    assert not first["_highlights"].get("3")  # the match lies past the cut
+    assert body["results"][1]["_truncated"] == []
+
+    whole = client.get(f"/row/0?filename={filename}").get_json()
+    assert whole["success"] and whole["headers"] == HEADERS
+    assert whole["row"]["Body"] == LONG_BODY and "_truncated" not in whole["row"]
+    start = LONG_BODY.index("exit plan")
+    assert whole["row"]["_highlights"]["3"] == [[start, start + len("exit plan")]]
+
+
+def test_row_outside_the_result_is_404(client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    assert client.get(f"/row/0?filename={filename}").get_json() == {"success": False, "error": "No results yet"}
+    client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"]})
+    response = client.get(f"/row/1?filename={filename}")
+    assert response.status_code == 404
+    assert response.get_json() == {"success": False, "error": "Row is not in the result"}
+
+
+def test_large_json_is_gzipped_when_accepted(client, long_mail):
+    filename = _upload(client, long_mail)["filename"]
+    search = {"filename": filename, "additional_keywords": ["exit plan", "c"]}
+    plain = client.post("/process", json=search)
+    assert "Content-Encoding" not in plain.headers and "Accept-Encoding" in plain.headers["Vary"]
+
+    packed = client.post("/process", json=search, headers={"Accept-Encoding": "gzip, deflate"})
+    assert packed.headers["Content-Encoding"] == "gzip"
+    assert len(packed.data) < len(plain.data)
+    assert json.loads(gzip.decompress(packed.data))["results"] == plain.get_json()["results"]
+
+
+def test_small_and_streamed_responses_are_left_alone(app, client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"]})
+    small = client.get(f"/row/0?filename={filename}", headers={"Accept-Encoding": "gzip"})
+    assert len(small.data) < app.COMPRESS_MIN_BYTES and "Content-Encoding" not in small.headers
+    csv = client.get(f"/download_csv?filename={filename}", headers={"Accept-Encoding": "gzip"})
+    assert csv.status_code == 200 and "Content-Encoding" not in csv.headers
+
+
+@pytest.mark.skipif(importlib.util.find_spec("brotli") is None, reason="brotli is not installed")
+def test_brotli_is_preferred_when_installed(client, long_mail):
+    import brotli
+
+    filename = _upload(client, long_mail)["filename"]
+    search = {"filename": filename, "additional_keywords": ["exit plan", "c"]}
+    packed = client.post("/process", json=search, headers={"Accept-Encoding": "gzip, br"})
+    assert packed.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(packed.data))["success"] is True
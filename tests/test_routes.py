@@ -0,0 +1,143 @@
+"""/upload -> /process -> /results -> /download round trips through the Flask test client."""
+import io
+
+import pandas as pd
+import pytest
+
+from conftest import HEADERS, ROWS
+from test_matching import _matches_by_mode
+
+SEARCHES = [
+    (["exit plan", "tower c"], False),
+    (["exit plan", "tower c"], True),
+    (["c++", "c#", "(tower c)", "devs"], False),
+    (["tower   c", "100%"], False),
+    (["e-mail", ".net", "takeout's"], False),
+    (["café", "the"], True),
+    (["naïve café", "all caps"], False),
+]
+
+
+def _upload(client, workbook, **form):
+    with open(workbook, "rb") as fh:
+        body = client.post("/upload", data={"file": (fh, "mailbox.xlsx"), **form}).get_json()
+    assert body["success"], body
+    return body
+
+
+def _expected_rows(app, filename, phrases, require_all):
+    """Upload positions the original row-by-row /process would have matched."""
+    df = app._store.get(filename)["original_data"]
+    return [i for i, (_, row) in enumerate(df.iterrows())
+            if _matches_by_mode(" ".join(str(row.get(c, "")) for c in df.columns).lower(), phrases, require_all)]
+
+
+def test_upload_reports_rows_and_headers(client, workbook):
+    body = _upload(client, workbook)
+    assert body["rows"] == len(ROWS)
+    assert body["headers"] == HEADERS
+
+
+def test_upload_rejects_other_file_types(client):
+    body = client.post("/upload", data={"file": (io.BytesIO(b"x"), "notes.txt")}).get_json()
+    assert body == {"success": False, "error": "Invalid file type"}
+
+
+@pytest.mark.parametrize("build_index", ["0", "1"], ids=["scan", "indexed"])
+@pytest.mark.parametrize("phrases,require_all", SEARCHES)
+def test_process_matches_original_rows(app, client, workbook, build_index, phrases, require_all):
+    filename = _upload(client, workbook, build_index=build_index)["filename"]
+    body = client.post("/process", json={"filename": filename, "additional_keywords": phrases,
+                                         "require_all": require_all}).get_json()
+    assert body["success"], body
+    expected = _expected_rows(app, filename, phrases, require_all)
+    assert [r["_row"] for r in body["results"]] == expected
+    assert body["matching_count"] == len(expected)
+    assert body["total_count"] == len(ROWS)
+
+
+def test_results_pages_sort_and_search_the_stored_result(client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    processed = client.post("/process", json={"filename": filename, "additional_keywords": ["tower c", "c"]}).get_json()
+    matched = [r["_row"] for r in processed["results"]]
+    assert len(matched) > 2
+
+    first = client.get(f"/results?filename={filename}&offset=0&limit=2").get_json()
+    rest = client.get(f"/results?filename={filename}&offset=2&limit=50").get_json()
+    assert first["total"] == len(matched)
+    assert [r["_row"] for r in first["results"] + rest["results"]] == matched
+    assert first["results"][0]["_matched_phrases"]
+
+    by_from = client.get(f"/results?filename={filename}&sort=0&dir=-1").get_json()["results"]
+    assert [r["From"] for r in by_from] == sorted((r["From"] for r in processed["results"]), reverse=True)
+    found = client.get(f"/results?filename={filename}&q=c%2B%2B").get_json()["results"]
+    assert [r["_row"] for r in found] == [1]
+
+
+def test_downloads_hold_the_matched_rows(client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    processed = client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"]}).get_json()
+    shown = pd.DataFrame(processed["results"])[HEADERS]
+
+    xlsx = client.get(f"/download?filename={filename}")
+    assert xlsx.status_code == 200
+    assert xlsx.headers["Content-Disposition"].startswith("attachment; filename=EMAILSIM_output_")
+    pd.testing.assert_frame_equal(pd.read_excel(io.BytesIO(xlsx.data), dtype=str, keep_default_na=False), shown)
+
+    csv = client.get(f"/download_csv?filename={filename}")
+    assert csv.status_code == 200
+    pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(csv.data), dtype=str, keep_default_na=False), shown)
+
+
+def test_requests_without_a_filename_are_rejected(client, workbook):
+    _upload(client, workbook)
+    response = client.post("/process", json={"additional_keywords": ["exit plan"]})
+    assert response.status_code == 400
+    for url in ("/results", "/row/0", "/download", "/download_csv"):
+        assert client.get(url).status_code == 400, url
+
+
+@pytest.mark.parametrize("filters", [
+    {"From": 5},
+    {"Nope": "alex@example.com"},
+    {"Subject": {"from": "2024-01-01"}},
+    ["From"],
+])
+def test_bad_filters_are_reported_not_raised(client, workbook, filters):
+    filename = _upload(client, workbook)["filename"]
+    response = client.post("/process", json={"filename": filename, "additional_keywords": ["c"], "filters": filters})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["success"] is False and "trace" not in body
+
+
+def test_sheets_takes_one_name_or_a_list(client, tmp_path):
+    path = tmp_path / "two_sheets.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame(ROWS[:4], columns=HEADERS).to_excel(writer, sheet_name="Inbox", index=False)
+        pd.DataFrame(ROWS[4:], columns=HEADERS).to_excel(writer, sheet_name="Sent", index=False)
+    filename = _upload(client, path)["filename"]
+    search = {"filename": filename, "additional_keywords": ["tower c"]}
+
+    as_list = client.post("/process", json={**search, "sheets": ["Sent"]}).get_json()
+    as_name = client.post("/process", json={**search, "sheets": "Sent"}).get_json()
+    assert as_list["success"] and as_list["matching_count"] == 2
+    assert as_name["matching_count"] == as_list["matching_count"]
+    assert as_name["filename"] == as_list["filename"]
+
+    assert client.post("/process", json={**search, "sheets": {"Sent": 1}}).status_code == 400
+
+
+def test_columns_takes_one_name_or_a_list(client, workbook):
+    filename = _upload(client, workbook)["filename"]
+    search = {"filename": filename, "additional_keywords": ["exit plan"]}
+
+    as_list = client.post("/process", json={**search, "columns": ["Subject"]}).get_json()
+    as_name = client.post("/process", json={**search, "columns": "Subject"}).get_json()
+    assert as_list["success"] and [r["_row"] for r in as_list["results"]] == [0]
+    assert [r["_row"] for r in as_name["results"]] == [0]
+    assert as_name["results"][0]["_highlights"] == {"2": [[4, 13]]}
+
+    unknown = client.post("/process", json={**search, "columns": ["Nope"]}).get_json()
+    assert unknown == {"success": False, "error": "Unknown column(s): Nope"}
+    assert client.post("/process", json={**search, "columns": 3}).status_code == 400
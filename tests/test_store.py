@@ -0,0 +1,51 @@
+"""The shared dataset store: entries rebuilt by a worker that never saw the upload."""
+import os
+
+from test_routes import _upload
+
+
+def _other_worker(app, monkeypatch):
+    """Swap in an empty store, as a request landing on another worker would see."""
+    monkeypatch.setattr(app, "_store", app._DatasetStore(app.STORE_MAX_MB * 1024 * 1024, app.STORE_MAX_ENTRIES))
+
+
+def test_uploads_are_saved_in_an_app_folder(app, client, workbook, tmp_path):
+    filename = _upload(client, workbook)["filename"]
+    assert os.path.isfile(tmp_path / "emailsim_uploads" / filename)
+    assert not os.path.exists(tmp_path / filename)
+
+
+def test_another_worker_rebuilds_the_upload_and_its_result(app, client, workbook, monkeypatch):
+    filename = _upload(client, workbook)["filename"]
+    processed = client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"]}).get_json()
+
+    _other_worker(app, monkeypatch)
+    page = client.get(f"/results?filename={filename}").get_json()
+    assert page["success"], page
+    assert [r["_row"] for r in page["results"]] == [r["_row"] for r in processed["results"]]
+    assert page["results"][0]["_matched_phrases"] == ["exit plan"]
+
+    again = client.post("/process", json={"filename": filename, "additional_keywords": ["tower c"]}).get_json()
+    assert again["success"] and again["matching_count"] > 0
+
+
+def test_a_result_written_by_another_worker_is_picked_up(app, client, workbook, monkeypatch):
+    filename = _upload(client, workbook)["filename"]
+    client.post("/process", json={"filename": filename, "additional_keywords": ["exit plan"]})
+    first = app._store
+    _other_worker(app, monkeypatch)
+    newer = client.post("/process", json={"filename": filename, "additional_keywords": ["c++"]}).get_json()
+
+    monkeypatch.setattr(app, "_store", first)  # the first worker still holds the older result
+    page = client.get(f"/results?filename={filename}").get_json()
+    assert page["matching_count"] == newer["matching_count"]
+
+
+def test_keys_without_an_upload_record_are_not_read_from_disk(app, client, tmp_path):
+    (tmp_path / "not_an_upload_secret.txt").write_text("user,password\nalice,hunter2\n")
+    for key in ("not_an_upload_secret.txt", "emailsim_uploads", "../not_an_upload_secret.txt"):
+        body = client.post("/process", json={"filename": key, "additional_keywords": ["alice"]}).get_json()
+        assert body == {"success": False, "error": "No file uploaded"}, key
+        response = client.get("/download_csv", query_string={"filename": key})
+        assert b"hunter2" not in response.data
+        assert response.get_json()["success"] is False
@@ -0,0 +1,59 @@
+"""The streaming .xlsx reader prints numeric, bool and blank cells the way pd.read_excel did."""
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from test_routes import _upload
+
+COLUMNS = {
+    "big": [10**20, 5, 7, 8],
+    "big_blank": [10**20, None, 7, 8],
+    "big_text": [10**20, "x", 3, 4],
+    "floats": [1.0, 2.0, 3.25, 1e20],
+    "float_text": [1.0, "x", 2.5, 4.0],
+    "bool_float": [True, 1.5, False, 2.0],
+    "bool_int": [True, 2, False, 3],
+    "bool_blank": [True, None, False, True],
+    "bools": [True, False, True, False],
+    "int_blank": [1, None, 3, 4],
+    "num_text": ["007", "8", None, "9"],
+    "num_then_text": ["007", "8", "x", 5],
+    "bool_text": ["True", "FALSE", "true", "false"],
+    "na_text": ["a", "n/a", "NULL", "#DIV/0!"],
+}
+
+
+@pytest.fixture
+def numbers(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(list(COLUMNS))
+    for i in range(4):
+        ws.append([cells[i] for cells in COLUMNS.values()])
+    path = tmp_path / "numbers.xlsx"
+    wb.save(path)
+    return path
+
+
+def _shown(app, df):
+    return {str(c): [app._display_value(v) for v in df[c]] for c in df.columns}
+
+
+@pytest.mark.parametrize("batch_rows", [1, 3, 5000])
+def test_cells_print_like_read_excel(app, numbers, batch_rows):
+    expected = app._clean_frame(pd.read_excel(numbers, engine="openpyxl"))
+    got = app._read_xlsx_streaming(str(numbers), batch_rows)
+    assert _shown(app, got) == _shown(app, expected)
+    assert got["big"].tolist()[0] == "100000000000000000000"
+    assert got["bool_int"].tolist() == [1, 2, 0, 3]
+
+
+def test_cached_upload_searches_the_printed_numbers(client, numbers):
+    filename = _upload(client, numbers)["filename"]
+    body = client.post("/process", json={"filename": filename,
+                                         "additional_keywords": ["100000000000000000000"]}).get_json()
+    assert body["success"], body
+    assert [r["_row"] for r in body["results"]] == [0]
+    assert body["results"][0]["na_text"] == "a"
+    blank = client.post("/process", json={"filename": filename, "additional_keywords": ["n/a"]}).get_json()
+    assert blank["matching_count"] == 0